@@ -0,0 +1,189 @@
+"""
+Stage-level benchmarks of the FileHandler on a synthetic corpus (see benchmarks/corpus.py).
+Every stage reports files/s, bytes/s and its peak RSS, run it with
+
+    uv run python -m benchmarks.bench --scale 1
+
+the corpus is generated once per scale and seed into the workdir, every run works on a fresh copy of it.
+"""
+
+import contextlib
+import platform
+import resource
+import shutil
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Annotated
+
+import toml
+import typer
+from pydantic import BaseModel
+from typer import colors, secho
+
+from benchmarks.corpus import generate
+from fileidentification.definitions.constants import FileState, StoreBackend
+from fileidentification.definitions.models import SfInfo
+from fileidentification.filehandling import FileHandler
+from fileidentification.tasks.os_tasks import move_tmp, set_filepaths
+
+REPO = Path(__file__).parent.parent
+
+
+class StageResult(BaseModel):
+    name: str
+    files: int
+    bytes: int
+    seconds: float
+    peak_rss: int
+    children_peak_rss: int
+
+    @property
+    def files_per_s(self) -> float:
+        return self.files / self.seconds if self.seconds else 0
+
+    @property
+    def bytes_per_s(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0
+
+
+class BenchResult(BaseModel):
+    scale: float
+    seed: int
+    stages: list[StageResult]
+
+
+def _reset_peak_rss() -> None:
+    """Reset the peak RSS of the process (linux only), so it is measured per stage"""
+    with contextlib.suppress(OSError):
+        Path("/proc/self/clear_refs").write_text("5")
+
+
+def _peak_rss() -> int:
+    """Peak RSS in bytes since the last reset, on other systems than linux since the start of the process"""
+    status = Path("/proc/self/status")
+    if status.is_file():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return _maxrss(resource.RUSAGE_SELF)
+
+
+def _maxrss(who: int) -> int:
+    maxrss = resource.getrusage(who).ru_maxrss
+    return maxrss if platform.system() == "Darwin" else maxrss * 1024
+
+
+def _measure(name: str, stage: Callable[[], object], files: Callable[[], list[SfInfo]]) -> StageResult:
+    """Run the stage, files returns the files the stage works on (called after the stage for the loading)"""
+    _reset_peak_rss()
+    start = time.perf_counter()
+    # write_logs exits the program
+    with contextlib.suppress(SystemExit):
+        stage()
+    seconds = time.perf_counter() - start
+    sfinfos = files()
+    return StageResult(
+        name=name,
+        files=len(sfinfos),
+        bytes=sum(sfinfo.filesize for sfinfo in sfinfos),
+        seconds=seconds,
+        peak_rss=_peak_rss(),
+        children_peak_rss=_maxrss(resource.RUSAGE_CHILDREN),
+    )
+
+
+def run_stages(root_folder: Path, verbose: bool, compact: bool, store: str) -> list[StageResult]:
+    fh = FileHandler()
+    fh.config = toml.load(REPO / "appconfig.toml")
+    fh.config["policies"]["DEFAULTPOLICIES"] = (
+        f"{REPO / 'fileidentification' / 'definitions' / 'default_policies.json'}"
+    )
+    fh.config["catalog"]["COMPACT"] = compact
+    fh.config["catalog"]["STORE"] = store
+    set_filepaths(fh.fp, fh.config, root_folder)
+    fh.mode.QUIET, fh.mode.VERBOSE = True, verbose
+
+    def active() -> list[SfInfo]:
+        return fh.stack.select(FileState.ACTIVE)
+
+    results = [_measure("load_sfinfos", lambda: fh._load_sfinfos(root_folder), lambda: list(fh.stack))]  # noqa: SLF001
+
+    results.append(
+        _measure("duplicates", lambda: fh.stack.find_duplicates(fh.ba, fh.config["hashing"]["WORKERS"]), active)
+    )
+    results.append(_measure("policies", fh._manage_policies, active))  # noqa: SLF001
+    inspected = active()
+    results.append(_measure("inspect", fh.inspect, lambda: inspected))
+    applied = active()
+    results.append(_measure("apply_policies", fh.apply_policies, lambda: applied))
+    pending = fh.stack.select(FileState.PENDING)
+    results.append(_measure("convert", fh.convert, lambda: pending))
+    converted = fh.stack.select(FileState.CONVERTED)
+    results.append(
+        _measure(
+            "move_tmp",
+            lambda: move_tmp(fh.stack, fh.policies, fh.log_tables, fh.mode.REMOVEORIGINAL),
+            lambda: converted,
+        )
+    )
+    results.append(_measure("write_logs", fh.write_logs, lambda: list(fh.stack)))
+    return results
+
+
+def _format_size(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def print_results(results: list[StageResult]) -> None:
+    secho(
+        f"\n{'stage': <16} | {'files': >7} | {'seconds': >9} | {'files/s': >10} | {'bytes/s': >12} | "
+        f"{'peak rss': >10} | {'children rss': >12}",
+        bold=True,
+    )
+    for r in results:
+        secho(
+            f"{r.name: <16} | {r.files: >7} | {r.seconds: >9.3f} | {r.files_per_s: >10.1f} | "
+            f"{_format_size(r.bytes_per_s) + '/s': >12} | {_format_size(r.peak_rss): >10} | "
+            f"{_format_size(r.children_peak_rss): >12}"
+        )
+
+
+def main(
+    scale: Annotated[float, typer.Option("--scale", help="size of the corpus, 1 are about 60 files")] = 1,
+    seed: Annotated[int, typer.Option("--seed", help="seed of the corpus generator")] = 0,
+    workdir: Annotated[Path, typer.Option("--workdir", help="where the corpus is generated and processed")] = Path(
+        "_bench"
+    ),
+    verbose: Annotated[bool, typer.Option("--verbose", "-v", help="inspect in verbose mode")] = False,
+    compact: Annotated[bool, typer.Option("--compact", help="keep the files in a compact catalog")] = False,
+    store: Annotated[
+        StoreBackend, typer.Option("--store", help="keep the stack in memory or in a sqlite database")
+    ] = StoreBackend.MEMORY,
+    output: Annotated[Path | None, typer.Option("--output", "-o", help="write the results as json")] = None,
+) -> None:
+    corpus = workdir / f"corpus_{scale}_{seed}"
+    if not corpus.is_dir():
+        secho(f"generating corpus in {corpus} ...")
+        generate(corpus, scale=scale, seed=seed)
+    # work on a copy, the files get renamed, removed and converted
+    root_folder = workdir / "run"
+    for path in workdir.glob("run*"):
+        shutil.rmtree(path) if path.is_dir() else path.unlink()
+    shutil.copytree(corpus, root_folder)
+
+    results = run_stages(root_folder, verbose, compact, store)
+    print_results(results)
+    if output:
+        output.write_text(BenchResult(scale=scale, seed=seed, stages=results).model_dump_json(indent=4))
+        secho(f"\nresults written to {output}", fg=colors.GREEN)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    typer.run(main)
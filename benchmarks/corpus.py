@@ -0,0 +1,160 @@
+"""
+Reproducible synthetic corpus for the benchmarks: small images, office files, media (intact, truncated and corrupt),
+duplicates and extension mismatches. The same seed and scale always give the same files.
+Images and office files are written in python, media needs ffmpeg and further image formats need imagemagick,
+they are skipped if the programs are not installed (they are in the docker image).
+"""
+
+import random
+import shutil
+import struct
+import subprocess
+import zipfile
+import zlib
+from pathlib import Path
+
+from typer import colors, secho
+
+# files per kind at scale 1
+BASE = {
+    "png": 20,
+    "jpg": 10,
+    "tif": 5,
+    "docx": 10,
+    "mp4": 2,
+    "truncated": 1,
+    "corrupt": 1,
+    "duplicates": 5,
+    "mismatch": 5,
+}
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    "</Types>"
+)
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    "</Relationships>"
+)
+DOCX_DOCUMENT = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>{}</w:body>'
+    "</w:document>"
+)
+WORDS = ["archive", "format", "policy", "preservation", "migration", "fixity", "container", "codec", "pronom"]
+
+
+def _png(width: int, height: int, rng: random.Random) -> bytes:
+    """Return a random rgb png, written without any image library"""
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def _docx(path: Path, rng: random.Random) -> None:
+    paragraphs = "".join(
+        f"<w:p><w:r><w:t>{' '.join(rng.choices(WORDS, k=rng.randint(5, 50)))}</w:t></w:r></w:p>"
+        for _ in range(rng.randint(1, 20))
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        # fixed timestamps, otherwise the files differ from run to run
+        for name, content in [
+            ("[Content_Types].xml", DOCX_CONTENT_TYPES),
+            ("_rels/.rels", DOCX_RELS),
+            ("word/document.xml", DOCX_DOCUMENT.format(paragraphs)),
+        ]:
+            z.writestr(zipfile.ZipInfo(name, date_time=(2000, 1, 1, 0, 0, 0)), content, zipfile.ZIP_DEFLATED)
+
+
+def _run(cmd: list[str]) -> bool:
+    return subprocess.run(cmd, check=False, capture_output=True).returncode == 0  # noqa: S603
+
+
+def _video(path: Path, seconds: int, seed: int) -> bool:
+    cmd = [
+        "ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc=duration={seconds}:size=320x240:rate=25",
+        "-f", "lavfi", "-i", f"anoisesrc=duration={seconds}:seed={seed}",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", f"{path}",
+    ]  # fmt: skip
+    return _run(cmd)
+
+
+def _images(pngs: list[Path], folders: list[Path], count: dict[str, int], rng: random.Random) -> None:
+    """Convert some of the pngs to jpg and tif"""
+    # the random choices are made even if a program is missing, so the other files stay the same
+    images = [
+        (rng.choice(pngs), rng.choice(folders) / f"image_{i}.{kind}")
+        for kind in ["jpg", "tif"]
+        for i in range(count[kind])
+    ]
+    if not shutil.which("magick"):
+        secho("magick not found, no jpg and tif in the corpus", fg=colors.YELLOW)
+        return
+    for src, dest in images:
+        _run(["magick", f"{src}", f"{dest}"])
+
+
+def _media(folders: list[Path], count: dict[str, int], rng: random.Random, seed: int) -> None:
+    """Write the videos and truncated copies of them"""
+    videos = [(rng.choice(folders) / f"video_{i}.mp4", rng.randint(1, 5)) for i in range(count["mp4"])]
+    truncated = [(rng.choice(videos)[0], rng.choice(folders) / f"truncated_{i}.mp4") for i in range(count["truncated"])]
+    if not shutil.which("ffmpeg"):
+        secho("ffmpeg not found, no audio/video in the corpus", fg=colors.YELLOW)
+        return
+    for i, (video, seconds) in enumerate(videos):
+        _video(video, seconds, seed + i)
+    for src, dest in truncated:
+        if src.is_file():
+            data = src.read_bytes()
+            dest.write_bytes(data[: len(data) // 2])
+
+
+def generate(outdir: Path, scale: float = 1, seed: int = 0) -> Path:
+    """Write the corpus to outdir, returns outdir. existing files in outdir are replaced"""
+    rng = random.Random(seed)  # noqa: S311
+    count = {kind: max(1, round(n * scale)) for kind, n in BASE.items()}
+    if outdir.exists():
+        shutil.rmtree(outdir)
+    folders = [outdir / f"folder_{i}" for i in range(max(1, round(4 * scale)))]
+    for folder in folders:
+        folder.mkdir(parents=True)
+
+    pngs: list[Path] = []
+    for i in range(count["png"]):
+        pngs.append(rng.choice(folders) / f"image_{i}.png")
+        pngs[-1].write_bytes(_png(rng.randint(16, 256), rng.randint(16, 256), rng))
+
+    _images(pngs, folders, count, rng)
+
+    for i in range(count["docx"]):
+        _docx(rng.choice(folders) / f"document_{i}.docx", rng)
+
+    _media(folders, count, rng, seed)
+
+    # random bytes behind a video extension
+    for i in range(count["corrupt"]):
+        (rng.choice(folders) / f"corrupt_{i}.mp4").write_bytes(rng.randbytes(rng.randint(1024, 64 * 1024)))
+
+    files = sorted(f for f in outdir.rglob("*") if f.is_file())
+    for i in range(count["duplicates"]):
+        original = rng.choice(files)
+        shutil.copyfile(original, rng.choice(folders) / f"duplicate_{i}{original.suffix}")
+
+    # png content with a jpg extension
+    for i in range(count["mismatch"]):
+        (rng.choice(folders) / f"mismatch_{i}.jpg").write_bytes(_png(rng.randint(16, 64), rng.randint(16, 64), rng))
+
+    return outdir
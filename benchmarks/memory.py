@@ -0,0 +1,90 @@
+"""
+Memory of the files of a run: a list of SfInfos against the compact catalog (see definitions/compact.py).
+The files are copies of the identified testdata with own paths, md5s and processing logs, run it with
+
+    uv run python -m benchmarks.memory --files 100000
+"""
+
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Annotated, Any
+
+import typer
+from typer import secho
+
+from benchmarks.bench import REPO, _format_size
+from fileidentification.definitions.catalog import Catalog
+from fileidentification.definitions.models import LogMsg, SfInfo
+from fileidentification.wrappers.siegfried import identify_files
+
+FILES_PER_FOLDER = 500
+
+
+def _templates() -> list[SfInfo]:
+    files = sorted(f for f in (REPO / "testdata").iterdir() if f.is_file())
+    return list(identify_files(files, md5=True, fixity=None, workers=0))
+
+
+def synthetic(templates: list[SfInfo], n: int, seed: int) -> Iterator[SfInfo]:
+    """Yield n files like the ones of a run after the inspection"""
+    rng = random.Random(seed)  # noqa: S311
+    root_folder, tdir = Path("/data/collection"), Path("/data/collection_TMP")
+    for i in range(n):
+        template = templates[i % len(templates)]
+        sfinfo = template.model_copy(deep=True)
+        sfinfo.filename = Path(f"folder_{i // FILES_PER_FOLDER}", f"file_{i}{template.filename.suffix}")
+        sfinfo.filesize = rng.randint(1024, 1024**3)
+        sfinfo.md5 = rng.randbytes(16).hex()
+        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg="did rename file.JPG -> file.jpg"))
+        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg="file format skipped, not in policies"))
+        sfinfo.set_processing_paths(root_folder, tdir, initial=False)
+        yield sfinfo
+
+
+def measure(build: Callable[[], Any]) -> tuple[int, float, Any]:
+    """Return the memory held by what build returns, the seconds it took and the result"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, seconds, result
+
+
+def main(
+    files: Annotated[int, typer.Option("--files", "-n", help="number of files")] = 100_000,
+    seed: Annotated[int, typer.Option("--seed", help="seed of the generated values")] = 0,
+) -> None:
+    templates = _templates()
+    secho(
+        f"\n{'model': <16} | {'files': >9} | {'memory': >10} | {'per file': >10} | {'build s': >8} | {'iterate s': >9}",
+        bold=True,
+    )
+    for name, build in [
+        ("list[SfInfo]", lambda: list(synthetic(templates, files, seed))),
+        ("Catalog", lambda: Catalog(synthetic(templates, files, seed))),
+        ("Catalog compact", lambda: Catalog(synthetic(templates, files, seed), compact=True)),
+    ]:
+        memory, seconds, stack = measure(build)
+        start = time.perf_counter()
+        size = sum(sfinfo.filesize for sfinfo in stack)
+        iterate = time.perf_counter() - start
+        assert size > 0
+        secho(
+            f"{name: <16} | {len(stack): >9} | {_format_size(memory): >10} | {_format_size(memory / files): >10} | "
+            f"{seconds: >8.2f} | {iterate: >9.2f}"
+        )
+        del stack
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,62 @@
+"""
+Startup time of the cli: every command runs in a fresh python, as in a container started per job.
+"cold" runs without the compiled bytecode (__pycache__), like a container whose image has none, run it with
+
+    uv run python -m benchmarks.startup --runs 10 --cold
+
+the budget is checked in the CI, the modules of the stages are imported where they are used to keep within it
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Annotated
+
+import typer
+from typer import colors, secho
+
+from benchmarks.bench import REPO
+
+COMMANDS = {
+    "import": [sys.executable, "-c", "import identify"],
+    "help": [sys.executable, "identify.py", "--help"],
+    "pipeline": [sys.executable, "-c", "from fileidentification.filehandling import FileHandler"],
+}
+
+
+def measure(cmd: list[str], runs: int, cold: bool) -> float:
+    """Return the median ms of the runs of cmd"""
+    times = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as cache:
+            # an empty cache prefix and -B: the modules are compiled every time and nothing is written
+            cmd_ = [cmd[0], "-B", *cmd[1:]] if cold else cmd
+            env = {"PYTHONPYCACHEPREFIX": cache} if cold else {}
+            start = time.perf_counter()
+            subprocess.run(cmd_, cwd=REPO, env={**os.environ, **env}, check=True, capture_output=True)  # noqa: S603
+            times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main(
+    runs: Annotated[int, typer.Option("--runs", "-n", help="runs per command")] = 10,
+    budget: Annotated[float, typer.Option("--budget", help="max median ms of 'pipeline' (warm), 0 = none")] = 600,
+    cold: Annotated[bool, typer.Option("--cold", help="also measure without compiled bytecode")] = False,
+) -> None:
+    secho(f"\n{'command': <10} | {'warm ms': >8} | {'cold ms': >8}", bold=True)
+    results: dict[str, float] = {}
+    for name, cmd in COMMANDS.items():
+        results[name] = measure(cmd, runs, cold=False)
+        cold_ms = f"{measure(cmd, runs, cold=True):.0f}" if cold else "-"
+        secho(f"{name: <10} | {results[name]: >8.0f} | {cold_ms: >8}")
+    if budget and results["pipeline"] > budget:
+        secho(f"\nstartup of {results['pipeline']:.0f} ms exceeds the budget of {budget:.0f} ms", fg=colors.RED)
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    typer.run(main)
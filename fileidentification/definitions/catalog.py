@@ -0,0 +1,228 @@
+import weakref
+from bisect import insort
+from collections.abc import Iterable, Iterator
+
+from fileidentification.definitions.compact import FileRecord, Interner
+from fileidentification.definitions.constants import FileState
+from fileidentification.definitions.models import BasicAnalytics, LogTables, SfInfo
+
+# files handed out at once by batches()
+BATCH = 10_000
+
+Keys = tuple[str, str, str | None, frozenset[FileState]]
+
+# the few combinations of states, shared by all files
+_STATES: dict[tuple[FileState, bool, bool], frozenset[FileState]] = {}
+
+
+def _states(sfinfo: SfInfo) -> frozenset[FileState]:
+    state = FileState.REMOVED if sfinfo.status.removed else FileState.CONVERTED if sfinfo.dest else FileState.ACTIVE
+    key = (state, sfinfo.status.pending, sfinfo.status.added)
+    if key not in _STATES:
+        states = {state}
+        if sfinfo.status.pending:
+            states.add(FileState.PENDING)
+        if sfinfo.status.added:
+            states.add(FileState.ADDED)
+        _STATES[key] = frozenset(states)
+    return _STATES[key]
+
+
+class Catalog:
+    """
+    The files of a run in the order they were added (their position is the one in the log), indexed by relative
+    path, md5, puid and state, with the links between converted files and the files they were derived from.
+    The stages change the sfinfos in place, call update() afterwards so the indexes follow.
+
+    In compact mode the files are kept as FileRecords, the SfInfos handed out are views that live as long as they
+    are referenced somewhere. update() writes a view back to its record, changes that are not updated are lost
+    once the view is gone.
+    """
+
+    def __init__(self, sfinfos: Iterable[SfInfo] = (), compact: bool = False) -> None:
+        self.compact = compact
+        self._files: list[SfInfo | FileRecord] = []
+        self._intern = Interner()
+        # the views of the records in compact mode, by position
+        self._views: weakref.WeakValueDictionary[int, SfInfo] = weakref.WeakValueDictionary()
+        # id of the sfinfo: position
+        self._positions: dict[int, int] = {}
+        # the keys a position is indexed with, to remove them on update
+        self._keys: list[Keys] = []
+        self._by_path: dict[str, list[int]] = {}
+        self._by_md5: dict[str, list[int]] = {}
+        self._by_puid: dict[str, set[int]] = {}
+        self._by_state: dict[FileState, set[int]] = {state: set() for state in FileState}
+        self._parent: dict[int, int] = {}
+        self._derived: dict[int, list[int]] = {}
+        self.extend(sfinfos)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __iter__(self) -> Iterator[SfInfo]:
+        return (self._file(i) for i in range(len(self._files)))
+
+    def __getitem__(self, i: int) -> SfInfo:
+        return self._file(i)
+
+    def __setitem__(self, i: int, sfinfo: SfInfo) -> None:
+        """Replace the file at position i, e.g. with the re-identified one, its links are kept"""
+        self._unindex(i)
+        old = self._files[i] if isinstance(self._files[i], SfInfo) else self._views.get(i)
+        if old is not None:
+            self._positions.pop(id(old), None)
+        self._store(i, sfinfo)
+        self._index(i, sfinfo)
+
+    def append(self, sfinfo: SfInfo) -> int:
+        """Add the file, returns its position. a converted file is linked to the file it was derived from"""
+        i = len(self._files)
+        self._files.append(sfinfo)
+        self._keys.append(("", "", None, frozenset()))
+        self._store(i, sfinfo)
+        self._index(i, sfinfo)
+        if sfinfo.derived_from:
+            # the sfinfo itself after a conversion, a copy of it if read from the log
+            parent = self._positions.get(id(sfinfo.derived_from))
+            if parent is None:
+                parent = next(iter(self._by_path.get(f"{sfinfo.derived_from.filename}", [])), None)
+            if parent is not None:
+                self._parent[i] = parent
+                self._derived.setdefault(parent, []).append(i)
+        return i
+
+    def extend(self, sfinfos: Iterable[SfInfo]) -> None:
+        for sfinfo in sfinfos:
+            self.append(sfinfo)
+
+    def index(self, sfinfo: SfInfo) -> int:
+        return self._positions[id(sfinfo)]
+
+    def update(self, *sfinfos: SfInfo) -> None:
+        """Re-index the files after their filename, md5, processed_as, status or dest changed"""
+        for sfinfo in sfinfos:
+            i = self._positions[id(sfinfo)]
+            self._unindex(i)
+            if self.compact:
+                self._files[i] = FileRecord(sfinfo, self._intern)
+            self._index(i, sfinfo)
+
+    def get(self, path: str) -> SfInfo | None:
+        """Return the file at the path relative to root_folder, a removed one only if there is no other"""
+        positions = self._by_path.get(path, [])
+        i = next((i for i in positions if i not in self._by_state[FileState.REMOVED]), None)
+        if i is None and positions:
+            i = positions[0]
+        return None if i is None else self._file(i)
+
+    def with_md5(self, md5: str) -> list[SfInfo]:
+        return self._select(self._by_md5.get(md5, []))
+
+    def with_puid(self, puid: str) -> list[SfInfo]:
+        return self._select(self._by_puid.get(puid, set()))
+
+    def select(self, state: FileState) -> list[SfInfo]:
+        """Return the files in state, in the order of the catalog"""
+        return self._select(self._by_state[state])
+
+    def batches(self, state: FileState, size: int = BATCH, start: int = 0) -> Iterator[list[tuple[int, SfInfo]]]:
+        """
+        Yield the files in state from position start on with their position in batches, in compact mode only a batch
+        of views is needed
+        """
+        positions = sorted(i for i in self._by_state[state] if i >= start)
+        for first in range(0, len(positions), size):
+            yield [(i, self._file(i)) for i in positions[first : first + size]]
+
+    def parent(self, sfinfo: SfInfo) -> SfInfo | None:
+        """Return the file sfinfo was converted from"""
+        i = self._parent.get(self._positions[id(sfinfo)])
+        return None if i is None else self._file(i)
+
+    def derived(self, sfinfo: SfInfo) -> list[SfInfo]:
+        """Return the files converted from sfinfo"""
+        return [self._file(i) for i in self._derived.get(self._positions[id(sfinfo)], [])]
+
+    def analyse(self, ba: BasicAnalytics) -> None:
+        """Add the active files to the basic analytics"""
+        for batch in self.batches(FileState.ACTIVE):
+            for _, sfinfo in batch:
+                ba.append(sfinfo)
+
+    def find_duplicates(self, ba: BasicAnalytics, workers: int = 0) -> None:
+        """
+        Set the duplicates among the active files with a puid in ba, the md5s calculated on the way are kept.
+        only the files that share their size are handed out, in compact mode no other views are created
+        """
+        by_size: dict[int, list[int]] = {}
+        for i in self._by_state[FileState.ACTIVE]:
+            if self._keys[i][2]:
+                by_size.setdefault(self._files[i].filesize, []).append(i)
+        candidates = self._select(i for group in by_size.values() if len(group) > 1 for i in group)
+        ba.find_duplicates(candidates, workers)
+        self.update(*candidates)
+
+    def store_logs(self, log_tables: LogTables) -> None:
+        """Hand over the diagnostics and errors collected so far, a catalog in memory keeps them in log_tables"""
+
+    def load_logs(self, log_tables: LogTables) -> LogTables:
+        """Return all diagnostics and errors of the run, the ones handed over to store_logs() and log_tables"""
+        return log_tables
+
+    def commit(self) -> None:
+        """Write the pending changes, nothing to do in memory"""
+
+    def _select(self, positions: Iterable[int]) -> list[SfInfo]:
+        return [self._file(i) for i in sorted(positions)]
+
+    def _file(self, i: int) -> SfInfo:
+        file = self._files[i]
+        if isinstance(file, SfInfo):
+            return file
+        sfinfo = self._views.get(i)
+        if sfinfo is None:
+            sfinfo = file.view()
+            self._register(i, sfinfo)
+        return sfinfo
+
+    def _store(self, i: int, sfinfo: SfInfo) -> None:
+        if not self.compact:
+            self._files[i] = sfinfo
+            self._positions[id(sfinfo)] = i
+            return
+        self._files[i] = FileRecord(sfinfo, self._intern)
+        self._register(i, sfinfo)
+
+    def _register(self, i: int, sfinfo: SfInfo) -> None:
+        """Hand out sfinfo as the view of position i until it is garbage collected"""
+        self._views[i] = sfinfo
+        self._positions[id(sfinfo)] = i
+        weakref.finalize(sfinfo, self._positions.pop, id(sfinfo), None)
+
+    def _index(self, i: int, sfinfo: SfInfo) -> None:
+        keys = (f"{sfinfo.filename}", sfinfo.md5, sfinfo.processed_as, _states(sfinfo))
+        path, md5, puid, states = keys
+        insort(self._by_path.setdefault(path, []), i)
+        if md5:
+            insort(self._by_md5.setdefault(md5, []), i)
+        if puid:
+            self._by_puid.setdefault(puid, set()).add(i)
+        for state in states:
+            self._by_state[state].add(i)
+        self._keys[i] = keys
+
+    def _unindex(self, i: int) -> None:
+        path, md5, puid, states = self._keys[i]
+        if path in self._by_path:
+            self._by_path[path].remove(i)
+            if not self._by_path[path]:
+                del self._by_path[path]
+        if md5:
+            self._by_md5[md5].remove(i)
+            if not self._by_md5[md5]:
+                del self._by_md5[md5]
+        if puid:
+            self._by_puid[puid].discard(i)
+        for state in states:
+            self._by_state[state].discard(i)
@@ -0,0 +1,152 @@
+from collections.abc import Hashable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from fileidentification.definitions.models import LogMsg, SfInfo, Status
+
+# bits of FileRecord.status
+REMOVED, PENDING, ADDED = 1, 2, 4
+
+# a LogMsg: name, msg, timestamp in microseconds since the epoch
+LogRecord = tuple[str, str, int | None]
+
+
+class Interner:
+    """
+    Shares equal values (puids, folders, messages, matches ...) between the records,
+    unlike sys.intern the strings can be freed with the catalog
+    """
+
+    def __init__(self) -> None:
+        self._values: dict[Hashable, Any] = {}
+
+    def __call__[T: Hashable](self, value: T) -> T:
+        interned: T = self._values.setdefault(value, value)
+        return interned
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+def _ts(timestamp: datetime | None) -> int | None:
+    if timestamp is None:
+        return None
+    delta = timestamp - datetime(1970, 1, 1, tzinfo=timestamp.tzinfo or UTC)
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _datetime(us: int | None) -> datetime | None:
+    return None if us is None else datetime.fromtimestamp(us // 1_000_000, UTC).replace(microsecond=us % 1_000_000)
+
+
+def _pack_md5(md5: str) -> bytes | str:
+    try:
+        packed = bytes.fromhex(md5)
+    except ValueError:
+        return md5
+    return packed if packed.hex() == md5 else md5
+
+
+class FileRecord:
+    """
+    The fields of a SfInfo packed into slots: the strings that repeat are interned, the md5 is kept as bytes,
+    the status as bits and the matches and logs as tuples. view() creates the SfInfo again.
+    """
+
+    __slots__ = (
+        "checksums",
+        "derived_from",
+        "dest",
+        "errors",
+        "filesize",
+        "folder",
+        "matches",
+        "md5",
+        "media_info",
+        "member",
+        "modified",
+        "name",
+        "path",
+        "processed_as",
+        "processing_logs",
+        "root_folder",
+        "status",
+        "tdir",
+    )
+
+    def __init__(self, sfinfo: SfInfo, intern: Interner) -> None:
+        self.folder = intern(f"{sfinfo.filename.parent}")
+        self.name = sfinfo.filename.name
+        self.filesize = sfinfo.filesize
+        self.modified = sfinfo.modified
+        self.errors = intern(sfinfo.errors)
+        self.md5 = _pack_md5(sfinfo.md5)
+        self.checksums = tuple(sfinfo.checksums.items()) if sfinfo.checksums else None
+        self.matches = self._matches(sfinfo.matches, intern)
+        status = sfinfo.status
+        self.status = (
+            (REMOVED if status.removed else 0) | (PENDING if status.pending else 0) | (ADDED if status.added else 0)
+        )
+        self.processed_as = intern(sfinfo.processed_as) if sfinfo.processed_as else None
+        self.media_info = self._logs(sfinfo.media_info, intern)
+        self.processing_logs = self._logs(sfinfo.processing_logs, intern)
+        self.derived_from = FileRecord(sfinfo.derived_from, intern) if sfinfo.derived_from else None
+        self.dest = intern(f"{sfinfo.dest}") if sfinfo.dest else None
+        self.member = tuple(sfinfo.member) if sfinfo.member is not None else None
+        self.root_folder = intern(f"{sfinfo.root_folder}")
+        self.tdir = intern(f"{sfinfo.tdir}")
+        # the path is only kept if it is not the usual root_folder / filename
+        self.path: str | None = None
+        if not sfinfo.path.name:
+            self.path = ""
+        elif sfinfo.path != sfinfo.root_folder / sfinfo.filename:
+            self.path = f"{sfinfo.path}"
+
+    @staticmethod
+    def _matches(matches: list[dict[str, Any]], intern: Interner) -> tuple[tuple[tuple[str, Any], ...], ...]:
+        """Files of the same format mostly share their matches, the matches are interned as a whole"""
+        packed = tuple(
+            tuple((intern(k), intern(v) if isinstance(v, str) else v) for k, v in m.items()) for m in matches
+        )
+        try:
+            return intern(packed)
+        except TypeError:
+            # a value that is not hashable (siegfried only reports strings though)
+            return packed
+
+    @staticmethod
+    def _logs(logs: list[LogMsg], intern: Interner) -> tuple[LogRecord, ...]:
+        return tuple((intern(log.name), intern(log.msg), _ts(log.timestamp)) for log in logs)
+
+    @staticmethod
+    def _view_logs(logs: tuple[LogRecord, ...]) -> list[LogMsg]:
+        return [LogMsg.model_construct(name=n, msg=m, timestamp=_datetime(ts)) for n, m, ts in logs]
+
+    def view(self) -> SfInfo:
+        filename = Path(self.folder, self.name)
+        root_folder = Path(self.root_folder)
+        fields: dict[str, Any] = {
+            "filename": filename,
+            "filesize": self.filesize,
+            "modified": self.modified,
+            "errors": self.errors,
+            "md5": self.md5.hex() if isinstance(self.md5, bytes) else self.md5,
+            "checksums": dict(self.checksums) if self.checksums else None,
+            "matches": [dict(match) for match in self.matches],
+            "status": Status(
+                removed=bool(self.status & REMOVED),
+                pending=bool(self.status & PENDING),
+                added=bool(self.status & ADDED),
+            ),
+            "processed_as": self.processed_as,
+            "media_info": self._view_logs(self.media_info),
+            "processing_logs": self._view_logs(self.processing_logs),
+            "derived_from": self.derived_from.view() if self.derived_from else None,
+            "dest": Path(self.dest) if self.dest else None,
+            "member": list(self.member) if self.member is not None else None,
+            "path": root_folder / filename if self.path is None else Path(self.path),
+            "root_folder": root_folder,
+            "tdir": Path(self.tdir),
+        }
+        return SfInfo.model_construct(**fields)
@@ -1,7 +1,7 @@
-import json
 from enum import StrEnum
 from pathlib import Path
-from typing import Any
+
+from fileidentification.definitions.formats import FormatRegistry
 
 
 # application settings
@@ -14,7 +14,9 @@ class DroidSigURL(StrEnum):
 
 # dict that resolves the puid to possible ext and file format name
 FMTJSN: Path = Path(__file__).parent / "fmt2ext.json"
-FMT2EXT: dict[str, Any] = json.loads(FMTJSN.read_text())
+# the same as FMTJSN in the compact layout read at runtime, written by update.py
+FMTTSV: Path = Path(__file__).parent / "fmt2ext.tsv"
+FMT2EXT = FormatRegistry(FMTTSV, FMTJSN)
 
 
 class Bin(StrEnum):
@@ -25,6 +27,77 @@ class Bin(StrEnum):
     EMPTY = ""
 
 
+class SfBackend(StrEnum):
+    """how the files are identified: one pygfried call per file or one streaming directory scan with sf"""
+
+    PYGFRIED = "pygfried"
+    SF = "sf"
+
+
+class ProbeBackend(StrEnum):
+    """how audio and video files are probed: an ffprobe call per file or in process with the libav bindings (PyAV)"""
+
+    FFPROBE = "ffprobe"
+    LIBAV = "libav"
+
+
+class LogFormat(StrEnum):
+    """json writes the whole log at the end of the run, jsonl appends a line per file as it finishes processing"""
+
+    JSON = "json"
+    JSONL = "jsonl"
+
+
+class StoreBackend(StrEnum):
+    """where the stack is kept during a run: in memory or in a sqlite database on disk (see [catalog])"""
+
+    MEMORY = "memory"
+    SQLITE = "sqlite"
+
+
+class WatchBackend(StrEnum):
+    """how the watch mode notices new files: inotify events (linux) or polling the mtime of the dirs"""
+
+    INOTIFY = "inotify"
+    POLLING = "polling"
+
+
+class ShardSplit(StrEnum):
+    """how a collection is split into shards: by the hash of the path of a file or by the first folder below root"""
+
+    HASH = "hash"
+    SUBTREE = "subtree"
+
+
+class DecodeMode(StrEnum):
+    """how ffmpeg decodes the files in verbose mode: completely, sampled windows or segments decoded in parallel"""
+
+    FULL = "full"
+    SAMPLED = "sampled"
+    SEGMENTS = "segments"
+
+
+class HashAlg(StrEnum):
+    """digests that can be calculated for the files"""
+
+    MD5 = "md5"
+    SHA256 = "sha256"
+    BLAKE2B = "blake2b"
+
+
+class FileState(StrEnum):
+    """
+    state of a file in the catalog: active files are in root_folder, converted ones wait in the tmp dir to be moved.
+    pending and added are set in addition to the other states
+    """
+
+    ACTIVE = "active"
+    CONVERTED = "converted"
+    REMOVED = "removed"
+    PENDING = "pending"
+    ADDED = "added"
+
+
 class LOPath(StrEnum):
     """path where LibreOffice exec is according to os"""
 
@@ -35,9 +108,16 @@ class LOPath(StrEnum):
 # foldername for removed files (is in TMP_DIR)
 RMV_DIR = "_REMOVED"
 
+# zip, tar and gzip: archives whose members are identified (a gzip only if it is a compressed tar)
+ARCHIVE_PUIDS = ["x-fmt/263", "x-fmt/265", "x-fmt/266"]
+
 
 # it needs libreoffice v7.4 + for this to work, set to pdf/A version 2
 PDFSETTINGS = ':writer_pdf_Export:{"SelectPdfVersion":{"type":"long","value":"2"}}'
+# the same setting for the LibreOffice worker (FilterData of the pdf export)
+PDFFILTERDATA = {"SelectPdfVersion": 2}
+# target containers the LibreOffice worker has an export filter for
+SOFFICEWORKERTARGETS = ["pdf", "docx", "xlsx", "pptx", "odt", "ods", "odp"]
 
 
 CSVFIELDS = [
@@ -81,6 +161,8 @@ class FDMsg(StrEnum):
     ERROR = "file is corrupt: removed"
     WARNING = "file has warnings"
     EXTMISMATCH = "extension mismatch"
+    TIMEOUT = "file exceeded the limits of the watchdog: not inspected"
+    NOTFOUND = "the bin to probe the file with was not found: not inspected"
 
 
 class FPMsg(StrEnum):
@@ -89,6 +171,18 @@ class FPMsg(StrEnum):
     PUIDFAIL = "failed to get fmt type"
     CONVFAILED = "conversion failed"
     NOTEXPECTEDFMT = "converted file does not match the expected fmt."
+    CACHED = "conversion taken from the cache of"
+    TIMEOUT = "stopped by the watchdog:"
+    NOTFOUND = "bin not found:"
+
+
+class RSMsg(StrEnum):
+    """rescan message, changes in root_folder since the last run"""
+
+    NEW = "new file since last run"
+    CHANGED = "file changed since last run, re-identified"
+    DELETED = "file not found anymore in root_folder"
+    MOVED = "file moved since last run, was"
 
 
 # file corrupt errors to parse from wrappers.wrappers.Ffmpeg when in verbose mode
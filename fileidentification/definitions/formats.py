@@ -0,0 +1,56 @@
+import json
+from collections.abc import Iterator, Mapping
+from pathlib import Path
+from typing import Any
+
+
+class FormatRegistry(Mapping[str, dict[str, Any]]):
+    """
+    The name and the file extensions of the formats by puid: {"name": str, "file_extensions": list[str]}.
+    They are read on first use from a compact tab separated file (a line per puid: puid, name, extensions) that
+    update.py writes along with the json, only the lines of the puids looked up are parsed.
+    The json (the same content, indented) is only read if the tsv is missing.
+    """
+
+    def __init__(self, tsv: Path, jsn: Path) -> None:
+        self.tsv = tsv
+        self.jsn = jsn
+        self._lines: dict[str, str] | None = None
+        self._entries: dict[str, dict[str, Any]] = {}
+
+    def __getitem__(self, puid: str) -> dict[str, Any]:
+        if puid not in self._entries:
+            _, name, *extensions = self._load()[puid].split("\t")
+            self._entries[puid] = {"name": name, "file_extensions": extensions}
+        return self._entries[puid]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __contains__(self, puid: object) -> bool:
+        return puid in self._load()
+
+    def _load(self) -> dict[str, str]:
+        if self._lines is None:
+            if self.tsv.is_file():
+                text = self.tsv.read_text(encoding="utf-8")
+            else:
+                text = to_tsv(json.loads(self.jsn.read_text(encoding="utf-8")))
+            self._lines = {line.partition("\t")[0]: line for line in text.splitlines()}
+        return self._lines
+
+
+def to_tsv(fmt2ext: dict[str, dict[str, Any]]) -> str:
+    """Return the formats in the layout of the registry file, tabs and newlines in the values become spaces"""
+
+    def clean(value: str) -> str:
+        return " ".join(value.split("\t")).replace("\n", " ")
+
+    lines = (
+        "\t".join([puid, clean(entry.get("name", "")), *map(clean, entry["file_extensions"])])
+        for puid, entry in fmt2ext.items()
+    )
+    return "\n".join(lines) + "\n"
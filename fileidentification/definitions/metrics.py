@@ -0,0 +1,143 @@
+import bisect
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+# upper bounds of the latency buckets in seconds, from a quick probe up to the conversion of a long video
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+PREFIX = "fileidentification"
+# what the metrics measure, for the HELP lines of the textfile
+HELP = {
+    "stage": "stages of the FileHandler",
+    "task": "work done per file (hash, inspect, apply, convert)",
+    "tool": "calls of the external programs by bin and puid",
+}
+# the puid of the file processed in the current thread, the calls of external programs are labelled with it
+PUID: ContextVar[str] = ContextVar("puid", default="")
+
+
+class Series(BaseModel):
+    """observations of a metric with one set of labels: count, total duration and bytes, latency histogram"""
+
+    labels: dict[str, str]
+    count: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    # observations per bucket of BUCKETS (not cumulative), the last one counts those above the largest bound
+    buckets: list[int] = Field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+
+    def observe(self, seconds: float, size: int) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.bytes += size
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+
+class Metrics:
+    """
+    The metrics of the run, a series per name (see HELP) and labels. Observing is cheap and thread-safe,
+    so they are always collected, FileHandler writes them with --metrics.
+    """
+
+    def __init__(self) -> None:
+        self._series: dict[tuple[str, tuple[tuple[str, str], ...]], Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, size: int = 0, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._series:
+                self._series[key] = Series(labels=labels)
+            self._series[key].observe(seconds, size)
+
+    @contextmanager
+    def time(self, name: str, size: int = 0, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block, the calls of external programs in it get its puid label"""
+        token = PUID.set(labels["puid"]) if "puid" in labels else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, size, **labels)
+            if token is not None:
+                PUID.reset(token)
+
+    def timed[**P, R](self, name: str, **labels: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+        """Return a decorator that observes the duration of every call of the function"""
+
+        def decorator(func: Callable[P, R]) -> Callable[P, R]:
+            @functools.wraps(func)
+            def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                with self.time(name, 0, **labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self) -> dict[str, list[Series]]:
+        """Return a copy of the series by name"""
+        metrics: dict[str, list[Series]] = {}
+        with self._lock:
+            for (name, _), series in self._series.items():
+                metrics.setdefault(name, []).append(series.model_copy(deep=True))
+        return metrics
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def to_json(self) -> str:
+        metrics = {name: [s.model_dump() for s in series] for name, series in self.snapshot().items()}
+        return json.dumps({"buckets": BUCKETS, "metrics": metrics}, indent=4)
+
+    def to_prometheus(self) -> str:
+        """Return the metrics in the text format of prometheus, for the textfile collector of the node exporter"""
+        lines = [
+            f"# HELP {PREFIX}_last_run_timestamp_seconds end of the last run",
+            f"# TYPE {PREFIX}_last_run_timestamp_seconds gauge",
+            f"{PREFIX}_last_run_timestamp_seconds {time.time():.3f}",
+        ]
+        for name, series in self.snapshot().items():
+            metric = f"{PREFIX}_{name}"
+            lines += [f"# HELP {metric}_seconds {HELP.get(name, name)}", f"# TYPE {metric}_seconds histogram"]
+            for s in series:
+                cumulative = 0
+                for bound, count in zip([*map(str, BUCKETS), "+Inf"], s.buckets, strict=True):
+                    cumulative += count
+                    lines.append(f"{metric}_seconds_bucket{_labels({**s.labels, 'le': bound})} {cumulative}")
+                lines.append(f"{metric}_seconds_sum{_labels(s.labels)} {s.seconds:.6f}")
+                lines.append(f"{metric}_seconds_count{_labels(s.labels)} {s.count}")
+            lines += [f"# HELP {metric}_bytes_total bytes processed", f"# TYPE {metric}_bytes_total counter"]
+            lines += [f"{metric}_bytes_total{_labels(s.labels)} {s.bytes}" for s in series]
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path: Path, prom_path: Path) -> None:
+        """Write the metrics as json and as prometheus textfile, the textfile is replaced atomically"""
+        json_path.write_text(self.to_json())
+        prom_path.parent.mkdir(parents=True, exist_ok=True)
+        # the collector reads every *.prom file, the temporary one must not end with it
+        fd, tmp = tempfile.mkstemp(dir=prom_path.parent, prefix=".tmp_")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.to_prometheus())
+        Path(tmp).chmod(0o644)
+        Path(tmp).replace(prom_path)
+
+
+def _labels(labels: dict[str, str]) -> str:
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+METRICS = Metrics()
@@ -1,12 +1,12 @@
 import hashlib
 import re
 from datetime import UTC, datetime
-from pathlib import Path
+from pathlib import Path, PurePath
 from typing import Any, Self
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 
-from fileidentification.definitions.constants import Bin, FDMsg, PCMsg, PVErr
+from fileidentification.definitions.constants import Bin, FDMsg, HashAlg, PCMsg, PVErr, ShardSplit
 
 
 class LogMsg(BaseModel):
@@ -37,6 +37,8 @@ class SfInfo(BaseModel):
     modified: str
     errors: str
     md5: str = Field(default_factory=str)
+    # additional digests for fixity, e.g. {"sha256": ...}
+    checksums: dict[str, str] | None = None
     matches: list[dict[str, Any]] = Field(default_factory=list)
     # added during processing
     status: Status = Field(default_factory=Status)
@@ -46,6 +48,8 @@ class SfInfo(BaseModel):
     # if converted
     derived_from: Self | None = None
     dest: Path | None = None
+    # if identified in an archive: its name in the archive (and in the nested archives), see wrappers/archives.py
+    member: list[str] | None = None
     # paths used during processing, they are not written out
     path: Path = Field(default_factory=Path, exclude=True)
     root_folder: Path = Field(default_factory=Path, exclude=True)
@@ -56,8 +60,12 @@ class SfInfo(BaseModel):
             self.status = Status()
         if not self.processed_as:
             self.processed_as = self._fetch_puid()
+
+    def ensure_md5(self) -> str:
+        """Return the md5, it is calculated here if it was deferred during the identification"""
         if not self.md5:
-            self.md5 = get_md5(self.filename)
+            self.md5 = get_md5(self.path if self.path.name else self.filename)
+        return self.md5
 
     def _fetch_puid(self) -> str | None:
         if self.matches:
@@ -100,6 +108,12 @@ class LogTables(BaseModel):
             self.diagnostics[fdgm.name] = []
         self.diagnostics[fdgm.name].append(sfinfo)
 
+    def merge(self, other: "LogTables") -> None:
+        """Append the diagnostics and errors of other, e.g. the ones collected by a worker thread"""
+        for key, sfinfos in other.diagnostics.items():
+            self.diagnostics.setdefault(key, []).extend(sfinfos)
+        self.errors.extend(other.errors)
+
     def dump_errors(self) -> list[SfInfo] | None:
         if self.errors:
             for el in self.errors:
@@ -108,26 +122,47 @@ class LogTables(BaseModel):
         return None
 
 
+class PuidStats(BaseModel):
+    """number and combined size of the files of a puid, the smallest one is the sample to test the policies"""
+
+    count: int = 0
+    size: int = 0
+    sample: SfInfo | None = None
+
+
 class BasicAnalytics(BaseModel):
+    """aggregates of the files, they don't keep the files themselves (but the sample and the ones with errors)"""
+
     filehashes: dict[str, list[Path]] = Field(default_factory=dict)
-    puid_unique: dict[str, list[SfInfo]] = Field(default_factory=dict)
+    puid_unique: dict[str, PuidStats] = Field(default_factory=dict)
     siegfried_errors: list[SfInfo] = Field(default_factory=list)
-    total_size: dict[str, int] = Field(default_factory=dict)
     blank: list[str] | None = None
 
     def append(self, sfinfo: SfInfo) -> None:
         if sfinfo.processed_as:
-            if sfinfo.md5 not in self.filehashes:
-                self.filehashes[sfinfo.md5] = []
-            self.filehashes[sfinfo.md5].append(sfinfo.filename)
-            if sfinfo.processed_as not in self.puid_unique:
-                self.puid_unique[sfinfo.processed_as] = []
-            self.puid_unique[sfinfo.processed_as].append(sfinfo)
+            stats = self.puid_unique.setdefault(sfinfo.processed_as, PuidStats())
+            stats.count += 1
+            stats.size += sfinfo.filesize
+            if not stats.sample or sfinfo.filesize < stats.sample.filesize:
+                stats.sample = sfinfo
         if sfinfo.errors:
             self.siegfried_errors.append(sfinfo)
 
-    def sort_puid_unique_by_size(self, puid: str) -> None:
-        self.puid_unique[puid] = sorted(self.puid_unique[puid], key=lambda x: x.filesize, reverse=False)
+    def find_duplicates(self, sfinfos: list[SfInfo], workers: int = 0) -> None:
+        """
+        Set filehashes to the groups of identical files with a puid. only files that share their size (and then their
+        head and tail blocks) are hashed completely, the md5s calculated on the way are kept in the sfinfos
+        """
+        from fileidentification.wrappers.hashing import find_duplicates  # noqa: PLC0415
+
+        sfinfos = [sfinfo for sfinfo in sfinfos if sfinfo.processed_as]
+        order = {id(sfinfo): i for i, sfinfo in enumerate(sfinfos)}
+        duplicates = find_duplicates(sfinfos, lambda s: s.path, lambda s: s.filesize, lambda s: s.md5, workers)
+        self.filehashes = {}
+        for md5, group in sorted(duplicates.items(), key=lambda el: min(order[id(s)] for s in el[1])):
+            for sfinfo in sorted(group, key=lambda s: order[id(s)]):
+                sfinfo.md5 = sfinfo.md5 or md5
+                self.filehashes.setdefault(md5, []).append(sfinfo.filename)
 
 
 # models for policies
@@ -195,14 +230,88 @@ class FilePaths(BaseModel, validate_assignment=True):
     TMP_DIR: Path = Field(default_factory=Path)
     POLICIES_J: Path = Field(default_factory=Path)
     LOG_J: Path = Field(default_factory=Path)
+    LOG_JL: Path = Field(default_factory=Path)
+    INDEX_J: Path = Field(default_factory=Path)
+    STORE_DB: Path = Field(default_factory=Path)
+    METRICS_J: Path = Field(default_factory=Path)
+    METRICS_PROM: Path = Field(default_factory=Path)
+
+
+# the start of the md5 appended to a file name that is taken, e.g. file_0a1b2c.tif
+COLLISION_SUFFIX = re.compile(r"(_[0-9a-f]{6})+$")
+
+
+class Shard(BaseModel):
+    """
+    the index-th of count parts of a collection, each handled by its own run. the files are assigned by the hash of
+    their path without the extension (split hash) or of the first folder below root_folder (split subtree).
+    renamed and converted files keep the stem of their original in its folder, so they stay in its shard
+    """
+
+    index: int = Field(ge=1)
+    count: int = Field(ge=1)
+    split: ShardSplit = ShardSplit.HASH
+
+    @model_validator(mode="after")
+    def check_index(self) -> Self:
+        if self.index > self.count:
+            msg = f"shard {self.index} of {self.count} does not exist"
+            raise ValueError(msg)
+        return self
+
+    @property
+    def tag(self) -> str:
+        return f"shard-{self.index}-of-{self.count}"
+
+    def owns(self, path: str | Path) -> bool:
+        """Return whether the file at path (relative to root_folder) is in the shard"""
+        file = PurePath(path)
+        if self.split == ShardSplit.SUBTREE and file.parent.parts:
+            return self._holds(file.parent.parts[0])
+        # without the md5 a renamed or moved file gets if its name is taken (see inspection._rename, os_tasks.move_tmp)
+        stem = COLLISION_SUFFIX.sub("", file.stem)
+        return self._holds((file.parent / stem).as_posix())
+
+    def walks(self, folder: str | Path) -> bool:
+        """Return whether files of the shard can be in folder (relative to root_folder)"""
+        return self.split == ShardSplit.HASH or self._holds(PurePath(folder).parts[0])
+
+    def _holds(self, key: str) -> bool:
+        """Return whether the key falls into the range of the shard, the hash space is split into count ranges"""
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest())
+        return digest * self.count >> 64 == self.index - 1
+
+
+# models for the rescan index
+class IndexEntry(BaseModel):
+    """stat data of a file, if any of it differs from the last run, the file is identified again"""
+
+    size: int
+    mtime_ns: int
+    inode: int
+
+
+class FileIndex(BaseModel):
+    """stat data of the files in root_folder after the last run, keyed on the path relative to root_folder"""
+
+    files: dict[str, IndexEntry] = Field(default_factory=dict)
+
+
+class IndexDiff(BaseModel):
+    new: list[str] = Field(default_factory=list)
+    changed: list[str] = Field(default_factory=list)
+    deleted: list[str] = Field(default_factory=list)
+    # old path: new path
+    moved: dict[str, str] = Field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.new or self.changed or self.deleted or self.moved)
 
 
 def get_md5(path: str | Path) -> str:
-    md5 = hashlib.md5()  # noqa: S324
-    with open(path, "rb") as s:  # noqa: PTH123
-        for chunk in iter(lambda: s.read(4096), b""):
-            md5.update(chunk)
-    return md5.hexdigest()
+    from fileidentification.wrappers.hashing import hash_file  # noqa: PLC0415
+
+    return hash_file(path, (HashAlg.MD5,))[HashAlg.MD5]
 
 
 def sfinfo2csv(sfinfo: SfInfo) -> dict[str, str | int]:
@@ -0,0 +1,273 @@
+import sqlite3
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from fileidentification.definitions.catalog import BATCH, Catalog, _states
+from fileidentification.definitions.constants import FileState
+from fileidentification.definitions.models import BasicAnalytics, LogMsg, LogTables, PuidStats, SfInfo
+
+SCHEMA = """
+CREATE TABLE files (
+    i INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    md5 TEXT NOT NULL,
+    puid TEXT,
+    state TEXT NOT NULL,
+    pending INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    filesize INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    parent INTEGER,
+    data TEXT NOT NULL,
+    root_folder TEXT NOT NULL,
+    tdir TEXT NOT NULL,
+    abspath TEXT NOT NULL
+);
+CREATE INDEX files_path ON files (path);
+CREATE INDEX files_md5 ON files (md5) WHERE md5 != '';
+CREATE INDEX files_puid ON files (puid, filesize);
+CREATE INDEX files_state ON files (state, filesize);
+CREATE INDEX files_pending ON files (i) WHERE pending = 1;
+CREATE INDEX files_added ON files (i) WHERE added = 1;
+CREATE INDEX files_parent ON files (parent) WHERE parent IS NOT NULL;
+CREATE TABLE diagnostics (i INTEGER NOT NULL, kind TEXT NOT NULL);
+CREATE TABLE errors (i INTEGER NOT NULL, name TEXT NOT NULL, msg TEXT NOT NULL, timestamp TEXT);
+"""
+
+INSERT = """
+INSERT INTO files (i, parent, path, md5, puid, state, pending, added, filesize, errors, data, root_folder, tdir, abspath)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPDATE = """
+UPDATE files SET (path, md5, puid, state, pending, added, filesize, errors, data, root_folder, tdir, abspath)
+= (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) WHERE i = ?
+"""
+
+# the columns a file is created from
+SELECT = "SELECT i, data, root_folder, tdir, abspath FROM files"
+
+
+def _where(state: FileState) -> str:
+    match state:
+        case FileState.PENDING:
+            return "pending = 1"
+        case FileState.ADDED:
+            return "added = 1"
+        case _:
+            return f"state = '{state}'"
+
+
+def _columns(sfinfo: SfInfo) -> tuple[Any, ...]:
+    states = _states(sfinfo)
+    state = next(state for state in (FileState.ACTIVE, FileState.CONVERTED, FileState.REMOVED) if state in states)
+    return (
+        f"{sfinfo.filename}",
+        sfinfo.md5,
+        sfinfo.processed_as,
+        state,
+        FileState.PENDING in states,
+        FileState.ADDED in states,
+        sfinfo.filesize,
+        bool(sfinfo.errors),
+        sfinfo.model_dump_json(exclude_none=True),
+        f"{sfinfo.root_folder}",
+        f"{sfinfo.tdir}",
+        f"{sfinfo.path}",
+    )
+
+
+def _sfinfo(data: str, root_folder: str, tdir: str, path: str) -> SfInfo:
+    sfinfo = SfInfo.model_validate_json(data)
+    sfinfo.root_folder, sfinfo.tdir, sfinfo.path = Path(root_folder), Path(tdir), Path(path)
+    return sfinfo
+
+
+class Store(Catalog):
+    """
+    A catalog kept in a sqlite database, for collections that don't fit in memory. The files are rows with the
+    indexed columns of the catalog, the aggregates, duplicates and pending conversions are queries on them.
+    Like in compact mode, the SfInfos handed out are views that live as long as they are referenced,
+    update() writes them back. The changes are committed every BATCH writes and after every batch of batches().
+    The database is created anew for every run, the log stays the record of the files.
+    """
+
+    def __init__(self, path: Path, sfinfos: Iterable[SfInfo] = ()) -> None:
+        path.unlink(missing_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript(SCHEMA)
+        self._len = 0
+        self._pending = 0
+        super().__init__(sfinfos)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[SfInfo]:
+        for page in self._pages("1", BATCH):
+            yield from (sfinfo for _, sfinfo in page)
+
+    def __setitem__(self, i: int, sfinfo: SfInfo) -> None:
+        """Replace the file at position i, e.g. with the re-identified one, its links are kept"""
+        old = self._views.get(i)
+        if old is not None:
+            self._positions.pop(id(old), None)
+        self._db.execute(UPDATE, (*_columns(sfinfo), i))
+        self._register(i, sfinfo)
+        self._written(1)
+
+    def append(self, sfinfo: SfInfo) -> int:
+        """Add the file, returns its position. a converted file is linked to the file it was derived from"""
+        i = self._len
+        parent = None
+        if sfinfo.derived_from:
+            parent = self._positions.get(id(sfinfo.derived_from))
+            if parent is None:
+                parent = self._first("SELECT i FROM files WHERE path = ? ORDER BY i", f"{sfinfo.derived_from.filename}")
+        self._db.execute(INSERT, (i, parent, *_columns(sfinfo)))
+        self._len += 1
+        self._register(i, sfinfo)
+        self._written(1)
+        return i
+
+    def update(self, *sfinfos: SfInfo) -> None:
+        """Write the files back after they changed"""
+        self._db.executemany(
+            UPDATE,
+            [(*_columns(sfinfo), self._positions[id(sfinfo)]) for sfinfo in sfinfos],
+        )
+        self._written(len(sfinfos))
+
+    def get(self, path: str) -> SfInfo | None:
+        """Return the file at the path relative to root_folder, a removed one only if there is no other"""
+        i = self._first("SELECT i FROM files WHERE path = ? ORDER BY state = 'removed', i", path)
+        return None if i is None else self._file(i)
+
+    def with_md5(self, md5: str) -> list[SfInfo]:
+        return self._fetch("md5 = ?", md5)
+
+    def with_puid(self, puid: str) -> list[SfInfo]:
+        return self._fetch("puid = ?", puid)
+
+    def select(self, state: FileState) -> list[SfInfo]:
+        """Return the files in state, in the order of the catalog"""
+        return self._fetch(_where(state))
+
+    def batches(self, state: FileState, size: int = BATCH, start: int = 0) -> Iterator[list[tuple[int, SfInfo]]]:
+        """Yield the files in state from position start on in batches, the changes of a batch are committed"""
+        yield from self._pages(_where(state), size, start)
+
+    def parent(self, sfinfo: SfInfo) -> SfInfo | None:
+        """Return the file sfinfo was converted from"""
+        i = self._first("SELECT parent FROM files WHERE i = ?", self._positions[id(sfinfo)])
+        return None if i is None else self._file(i)
+
+    def derived(self, sfinfo: SfInfo) -> list[SfInfo]:
+        """Return the files converted from sfinfo"""
+        return self._fetch("parent = ?", self._positions[id(sfinfo)])
+
+    def analyse(self, ba: BasicAnalytics) -> None:
+        """Set the count, size and smallest file per puid and the siegfried errors of the active files in ba"""
+        groups = self._db.execute(
+            "SELECT puid, COUNT(*), SUM(filesize) FROM files WHERE state = 'active' AND puid IS NOT NULL "
+            "GROUP BY puid ORDER BY MIN(i)"
+        ).fetchall()
+        for puid, count, size in groups:
+            sample = self._first("SELECT i FROM files WHERE puid = ? AND state = 'active' ORDER BY filesize, i", puid)
+            ba.puid_unique[puid] = PuidStats(count=count, size=size, sample=self._file(sample))
+        ba.siegfried_errors.extend(self._fetch("state = 'active' AND errors = 1"))
+
+    def find_duplicates(self, ba: BasicAnalytics, workers: int = 0) -> None:
+        """Set the duplicates among the active files with a puid in ba, only the files that share their size are loaded"""
+        candidates = self._fetch(
+            "state = 'active' AND puid IS NOT NULL AND filesize IN (SELECT filesize FROM files "
+            "WHERE state = 'active' AND puid IS NOT NULL GROUP BY filesize HAVING COUNT(*) > 1)"
+        )
+        ba.find_duplicates(candidates, workers)
+        self.update(*candidates)
+        self.commit()
+
+    def store_logs(self, log_tables: LogTables) -> None:
+        """Move the diagnostics and errors of the files in the store from log_tables to the database"""
+        kept = LogTables()
+        diagnostics: list[tuple[int, str]] = []
+        for kind, sfinfos in log_tables.diagnostics.items():
+            for sfinfo in sfinfos:
+                if (i := self._positions.get(id(sfinfo))) is not None:
+                    diagnostics.append((i, kind))
+                else:
+                    kept.diagnostics.setdefault(kind, []).append(sfinfo)
+        errors: list[tuple[int, str, str, str | None]] = []
+        for log, sfinfo in log_tables.errors:
+            if (i := self._positions.get(id(sfinfo))) is not None:
+                errors.append((i, log.name, log.msg, log.timestamp.isoformat() if log.timestamp else None))
+            else:
+                kept.errors.append((log, sfinfo))
+        self._db.executemany("INSERT INTO diagnostics VALUES (?, ?)", diagnostics)
+        self._db.executemany("INSERT INTO errors VALUES (?, ?, ?, ?)", errors)
+        log_tables.diagnostics, log_tables.errors = kept.diagnostics, kept.errors
+        self._written(len(diagnostics) + len(errors))
+
+    def load_logs(self, log_tables: LogTables) -> LogTables:
+        """Return all diagnostics and errors of the run, the ones in the database followed by log_tables"""
+        logs = LogTables()
+        for i, kind in self._db.execute("SELECT i, kind FROM diagnostics ORDER BY rowid").fetchall():
+            logs.diagnostics.setdefault(kind, []).append(self._file(i))
+        for i, name, msg, ts in self._db.execute("SELECT * FROM errors ORDER BY rowid").fetchall():
+            log = LogMsg(name=name, msg=msg, timestamp=datetime.fromisoformat(ts) if ts else None)
+            logs.errors.append((log, self._file(i)))
+        logs.merge(log_tables)
+        return logs
+
+    def commit(self) -> None:
+        self._db.commit()
+        self._pending = 0
+
+    def _written(self, n: int) -> None:
+        self._pending += n
+        if self._pending >= BATCH:
+            self.commit()
+
+    def _first(self, sql: str, *params: Any) -> Any:
+        row = self._db.execute(f"{sql} LIMIT 1", params).fetchone()
+        return None if row is None else row[0]
+
+    def _fetch(self, where: str, *params: Any) -> list[SfInfo]:
+        rows = self._db.execute(f"{SELECT} WHERE {where} ORDER BY i", params).fetchall()
+        return [sfinfo for _, sfinfo in self._load(rows)]
+
+    def _pages(self, where: str, size: int, start: int = 0) -> Iterator[list[tuple[int, SfInfo]]]:
+        """Page through the files by position, so the files can change their state while they are processed"""
+        last = start - 1
+        while True:
+            self.commit()
+            rows = self._db.execute(f"{SELECT} WHERE {where} AND i > ? ORDER BY i LIMIT ?", (last, size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield self._load(rows)
+
+    def _load(self, rows: list[tuple[int, str, str, str, str]]) -> list[tuple[int, SfInfo]]:
+        """Return the files of the rows, the views that are still alive are handed out instead of new ones"""
+        files = []
+        for i, *columns in rows:
+            sfinfo = self._views.get(i)
+            if sfinfo is None:
+                sfinfo = _sfinfo(*columns)
+                self._register(i, sfinfo)
+            files.append((i, sfinfo))
+        return files
+
+    def _file(self, i: int) -> SfInfo:
+        sfinfo = self._views.get(i)
+        if sfinfo is not None:
+            return sfinfo
+        rows = self._db.execute(f"{SELECT} WHERE i = ?", (i,)).fetchall()
+        if not rows:
+            raise IndexError(i)
+        return self._load(rows)[0][1]
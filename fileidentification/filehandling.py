@@ -1,17 +1,22 @@
-import csv
 import json
 import os
+import signal
 import sys
+import time
+from collections.abc import Iterable
+from contextlib import ExitStack
+from itertools import chain
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import pygfried
-from rich.progress import Progress, SpinnerColumn, TextColumn
 from typer import colors, secho
 
-from fileidentification.definitions.constants import CSVFIELDS, FMT2EXT
+from fileidentification.definitions.catalog import Catalog
+from fileidentification.definitions.constants import CSVFIELDS, FMT2EXT, Bin, FileState, LogFormat, RSMsg, StoreBackend
+from fileidentification.definitions.metrics import METRICS
 from fileidentification.definitions.models import (
     BasicAnalytics,
+    FileIndex,
     FilePaths,
     LogMsg,
     LogOutput,
@@ -21,6 +26,7 @@ from fileidentification.definitions.models import (
     PoliciesFile,
     PolicyParams,
     SfInfo,
+    Shard,
     sfinfo2csv,
 )
 from fileidentification.tasks.console_output import (
@@ -31,10 +37,16 @@ from fileidentification.tasks.console_output import (
     print_processing_errors,
     print_siegfried_errors,
 )
-from fileidentification.tasks.conversion import convert_file
-from fileidentification.tasks.inspection import inspect_file
-from fileidentification.tasks.os_tasks import move_tmp, set_filepaths
-from fileidentification.tasks.policies import apply_policy
+from fileidentification.tasks.logfile import LogAppender, export_json, read_errors, read_log, write_log
+from fileidentification.tasks.os_tasks import build_index, diff_index, move_tmp, scan_folder, set_filepaths
+
+# the modules of the stages (the tools they call, the conversion, the sqlite store, the watch mode) are imported where
+# they are used, for a fast start
+if TYPE_CHECKING:
+    from rich.progress import Progress
+
+    from fileidentification.tasks.cache import ConversionCache
+    from fileidentification.tasks.watch import Watcher
 
 
 class FileHandler:
@@ -45,48 +57,195 @@ class FileHandler:
         self.policies: dict[str, PolicyParams] = {}
         self.log_tables = LogTables()
         self.ba = BasicAnalytics()
-        self.stack: list[SfInfo] = []
+        self.stack: Catalog = Catalog()
         self.fp: FilePaths = FilePaths()
         self.config: dict[str, Any] = {}
-
+        self.log_appender: LogAppender | None = None
+        # the zip or tar the files are read from, if root_folder is an archive
+        self.archive: Path | None = None
+        # write the metrics at the end of the run (--metrics)
+        self.metrics = False
+        # position of the first file in the stack the stages process, in watch mode the files that just arrived
+        self.start = 0
+        # the part of root_folder this run handles (--shard), None for all of it
+        self.shard: Shard | None = None
+        # the conversion cache, opened with the first conversion of the handler
+        self.cache: ConversionCache | None = None
+
+    @METRICS.timed("stage", stage="load")
     def _load_sfinfos(self, root_folder: Path) -> None:
         """
         Add sfinfos to stack.
-        Checks whether a log json at default location exists. if so, it adds the sfinfos to the stack from there,
-        otherwhise it scans the root_folder with pygfried and adds its output as sfinfos to the stack
+        Checks whether a log json at default location exists. if so, it adds the sfinfos to the stack from there
+        and, if there is an index of the last run, only identifies the files that changed since then.
+        otherwhise it scans the root_folder with siegfried and adds its output as sfinfos to the stack as it streams in
         """
         initial = True
+        self.stack = self._catalog()
         # if there is a log, try to read from there
-        if self.fp.LOG_J.is_file():
+        if self._jsonl() and self.fp.LOG_JL.is_file():
+            initial = False
+            self.stack.extend(read_log(self.fp.LOG_JL))
+        elif self.fp.LOG_J.is_file():
             initial = False
             self.stack.extend([SfInfo(**metadata) for metadata in json.loads(self.fp.LOG_J.read_text())["files"]])
+        if self.stack and self.fp.INDEX_J.is_file() and root_folder.is_dir():
+            self._rescan(root_folder)
 
-        # else scan the root_folder with pygfried
+        # else scan the root_folder with siegfried
         if not self.stack:
-            with Progress(
-                SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True
-            ) as prog:
-                prog.add_task(description="analysing files with pygfried...", total=None)
-                self.stack.extend(
-                    [
-                        SfInfo(**pygfried.identify(f"{f}", detailed=True)["files"][0])  # type: ignore[arg-type]
-                        for f in root_folder.rglob("*")
-                        if f.is_file()
-                    ]
-                )
-                if root_folder.is_file():
-                    self.stack.append(SfInfo(**pygfried.identify(f"{root_folder}", detailed=True)["files"][0]))  # type: ignore[arg-type]
+            self._identify(root_folder)
 
-        # append path values run basic analytics
-        for sfinfo in self.stack:
-            if not sfinfo.status.removed:
-                sfinfo.set_processing_paths(root_folder, self.fp.TMP_DIR, initial=initial)
-            if not (sfinfo.status.removed or sfinfo.dest):
-                self.ba.append(sfinfo)
+        self._analyse(root_folder, initial)
+
+        # write the stack as base of the jsonl log, the files are appended to it as they get processed
+        if self._jsonl():
+            write_log(self.fp.LOG_JL, self.stack, None)
+            self.log_appender = LogAppender(self.fp.LOG_JL)
 
         print_siegfried_errors(ba=self.ba)
+        if not self.mode.QUIET:
+            self.stack.find_duplicates(self.ba, self.config["hashing"]["WORKERS"])
         print_duplicates(ba=self.ba, mode=self.mode)
 
+    def _analyse(self, root_folder: Path, initial: bool) -> None:
+        """Append path values, run basic analytics"""
+        for sfinfo in self.stack:
+            if not sfinfo.status.removed:
+                sfinfo.set_processing_paths(root_folder, self.fp.TMP_DIR, initial=initial)
+                self.stack.update(sfinfo)
+        self.stack.analyse(self.ba)
+
+    def _catalog(self) -> Catalog:
+        """Return the stack in memory or, for collections that don't fit in memory, in a sqlite database"""
+        if self.config["catalog"]["STORE"] == StoreBackend.SQLITE:
+            from fileidentification.definitions.store import Store  # noqa: PLC0415
+
+            return Store(self.fp.STORE_DB)
+        return Catalog(compact=self.config["catalog"]["COMPACT"])
+
+    def _identify(self, root_folder: Path) -> None:
+        """Scan the root_folder with siegfried and add its output to the stack as it streams in"""
+        from fileidentification.wrappers.siegfried import SiegfriedError, identify, identify_files  # noqa: PLC0415
+
+        backend, multi = self.config["siegfried"]["BACKEND"], self.config["siegfried"]["MULTI"]
+        md5, fixity, workers = (self.config["hashing"][key] for key in ["MD5", "FIXITY", "WORKERS"])
+        sfinfos = identify(root_folder, backend, multi, md5=md5, fixity=fixity, workers=workers)
+        if self.shard:
+            # only the files of the shard are identified, one by one
+            backend = "pygfried"
+            files = [root_folder / path for path in sorted(scan_folder(root_folder, self.shard))]
+            sfinfos = identify_files(files, md5=md5, fixity=fixity, workers=workers)
+        if self.archive:
+            from fileidentification.wrappers.archives import identify_archive  # noqa: PLC0415
+
+            backend = "pygfried"
+            sfinfos = identify_archive(self.archive, root_folder, self.config["archives"]["DEPTH"], fixity=fixity)
+        with _spinner(text=True) as prog:
+            task = prog.add_task(description=f"analysing files with {backend}...", total=None)
+            try:
+                for sfinfo in sfinfos:
+                    self.stack.append(sfinfo)
+                    prog.update(task, description=f"analysing files with {backend}... {len(self.stack)}")
+            except SiegfriedError as e:
+                # the files sf did not get to would be missing in the stack without a notice
+                secho(f"{e}\nthe scan of {root_folder} is incomplete, stopping", fg=colors.RED)
+                sys.exit(1)
+
+    def _extract(self, sfinfos: Iterable[SfInfo]) -> None:
+        """Extract the files that are needed on disk out of the archive, the others are only read while identified"""
+        if self.archive:
+            from fileidentification.wrappers.archives import extract  # noqa: PLC0415
+
+            extract(self.archive, sfinfos)
+
+    def _cache(self) -> "ConversionCache | None":
+        """Return the conversion cache, if a folder is set for it. its entries are scanned once, when it is opened"""
+        if self.cache is None and self.config["cache"]["DIR"]:
+            from fileidentification.tasks.cache import ConversionCache  # noqa: PLC0415
+
+            self.cache = ConversionCache(
+                Path(self.config["cache"]["DIR"]).expanduser(), int(self.config["cache"]["MAX_GB"] * 1024**3)
+            )
+        return self.cache
+
+    def _watchdog(self) -> None:
+        """Set the limits of the calls of every bin"""
+        from fileidentification.wrappers.process import WATCHDOG, Limits  # noqa: PLC0415
+
+        WATCHDOG.configure(
+            {
+                pbin.lower(): Limits(**{key.lower(): value for key, value in limits.items()})
+                for pbin, limits in self.config["watchdog"].items()
+            }
+        )
+
+    def _probes(self) -> None:
+        """Set how the audio and video files are probed"""
+        from fileidentification.wrappers.ffmpeg import PROBES  # noqa: PLC0415
+
+        PROBES.configure(self.config["probe"]["BACKEND"])
+
+    def _write_metrics(self) -> None:
+        """Write the metrics of the run as json and as prometheus textfile, if asked to"""
+        if self.metrics:
+            METRICS.write(self.fp.METRICS_J, self.fp.METRICS_PROM)
+
+    def _jsonl(self) -> bool:
+        return bool(self.config["log"]["FORMAT"] == LogFormat.JSONL)
+
+    def _append_logs(self, indexed: Iterable[tuple[int, SfInfo]]) -> None:
+        """Append the processed files with their position in the stack to the jsonl log"""
+        if self.log_appender:
+            for i, sfinfo in indexed:
+                self.log_appender.append(i, sfinfo)
+            self.log_appender.flush()
+
+    def _rescan(self, root_folder: Path) -> None:
+        """
+        Compare root_folder with the index of the last run and merge the changes into the stack:
+        new and changed files are identified and hashed, moved files get their new path, deleted ones are flagged
+        """
+        index = FileIndex(**json.loads(self.fp.INDEX_J.read_text()))
+        diff = diff_index(index, scan_folder(root_folder, self.shard))
+        if not diff:
+            return
+        print_msg(
+            f"... {len(diff.new)} new, {len(diff.changed)} changed, {len(diff.moved)} moved and "
+            f"{len(diff.deleted)} deleted files since the last run",
+            self.mode.QUIET,
+        )
+
+        for old, new in diff.moved.items():
+            if (sfinfo := self._tracked(old)) is not None:
+                sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{RSMsg.MOVED} {old}"))
+                sfinfo.filename = Path(new)
+                self.stack.update(sfinfo)
+            else:
+                diff.new.append(new)
+        for path in diff.deleted:
+            if (sfinfo := self._tracked(path)) is not None:
+                sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{RSMsg.DELETED}"))
+                sfinfo.status.removed = True
+                self.stack.update(sfinfo)
+
+        from fileidentification.wrappers.siegfried import identify_files  # noqa: PLC0415
+
+        files = [root_folder / path for path in [*diff.changed, *diff.new]]
+        md5, fixity, workers = (self.config["hashing"][key] for key in ["MD5", "FIXITY", "WORKERS"])
+        for sfinfo in identify_files(files, md5=md5, fixity=fixity, workers=workers):
+            sfinfo.filename = sfinfo.filename.relative_to(root_folder)
+            if (tracked := self._tracked(f"{sfinfo.filename}")) is not None:
+                sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{RSMsg.CHANGED}"))
+                self.stack[self.stack.index(tracked)] = sfinfo
+            else:
+                sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{RSMsg.NEW}"))
+                self.stack.append(sfinfo)
+
+    def _tracked(self, path: str) -> SfInfo | None:
+        sfinfo = self.stack.get(path)
+        return None if sfinfo is None or sfinfo.status.removed else sfinfo
+
     # policies stuff
     def _load_policies(self, policies_path: Path) -> Policies:
         """Load and validate an existing policies.json"""
@@ -183,6 +342,8 @@ class FileHandler:
         of the policies.
         """
 
+        from fileidentification.tasks.conversion import convert_file  # noqa: PLC0415
+
         puids = [puid] if puid else [puid for puid in self.ba.puid_unique if not self.policies[puid].accepted]
 
         if not puids:
@@ -191,88 +352,335 @@ class FileHandler:
             print_msg("\n --- testing policies with a sample from the directory ---", self.mode.QUIET)
 
             for puid in puids:  # noqa: PLR1704
-                # we want the smallest file first for running the test
-                self.ba.sort_puid_unique_by_size(puid)
-                sample = self.ba.puid_unique[puid][0]
+                # we want the smallest file for running the test
+                sample: SfInfo = self.ba.puid_unique[puid].sample  # type: ignore[assignment]
                 secho(f"\n{puid}", fg=colors.YELLOW)
-                t_sfinfo, cmd = convert_file(sample, self.policies)
+                self._extract([sample])
+                self._watchdog()
+                self._probes()
+                t_sfinfo, cmds = convert_file(sample, self.policies)
                 if t_sfinfo:
-                    secho(f"{cmd}", fg=colors.GREEN, bold=True)
-                    secho(f"You find the file with the log in {t_sfinfo.filename.parent}")
-
+                    secho("; ".join(cmds), fg=colors.GREEN, bold=True)
+                    secho(f"You find the converted file in {t_sfinfo.filename.parent}")
+                    # the log of the bin is kept in the processing logs of the output, not in a file next to it
+                    for log in t_sfinfo.processing_logs:
+                        if log.name == self.policies[puid].bin:
+                            secho(log.msg.rstrip())
+
+    @METRICS.timed("stage", stage="inspect")
     def inspect(self) -> None:
+        from fileidentification.tasks.inspection import inspect_files, inspection_needs_file  # noqa: PLC0415
+        from fileidentification.tasks.policies import policy_needs_file  # noqa: PLC0415
+        from fileidentification.wrappers.ffmpeg import PROBES, DecodeParams  # noqa: PLC0415
+
         print_msg("\nprobing the files ...", self.mode.QUIET)
-        with Progress(SpinnerColumn(), transient=True) as prog:
+        limits: dict[str, int] = {key.lower(): value for key, value in self.config["inspection"].items()}
+        decode = DecodeParams(**{key.lower(): value for key, value in self.config["decode"].items()})
+        batch: int = self.config["imagemagick"]["BATCH"]
+        self._watchdog()
+        self._probes()
+        with _spinner() as prog:
             prog.add_task(description="", total=None)
-            for sfinfo in self.stack:
-                if not (sfinfo.status.removed or sfinfo.dest):
-                    inspect_file(sfinfo, self.policies, self.log_tables, self.mode.VERBOSE)
-
-        print_diagnostic(log_tables=self.log_tables, mode=self.mode)
-
+            for indexed in self.stack.batches(FileState.ACTIVE, start=self.start):
+                sfinfos = [el[1] for el in indexed]
+                self._extract(sfinfo for sfinfo in sfinfos if inspection_needs_file(sfinfo, self.policies))
+                inspect_files(sfinfos, self.policies, self.log_tables, self.mode.VERBOSE, limits, decode, batch)
+                # only the files whose streams are checked against their policy are probed again
+                PROBES.evict(*(s for s in sfinfos if not policy_needs_file(s, self.policies, self.mode.STRICT)))
+                self.stack.update(*sfinfos)
+                self.stack.store_logs(self.log_tables)
+                self._append_logs(indexed)
+
+        print_diagnostic(log_tables=self.stack.load_logs(self.log_tables), mode=self.mode)
+
+    @METRICS.timed("stage", stage="apply")
     def apply_policies(self) -> None:
+        from fileidentification.tasks.policies import apply_policy, policy_needs_file  # noqa: PLC0415
+        from fileidentification.wrappers.ffmpeg import PROBES  # noqa: PLC0415
+
         print_msg("\napplying policies ...", self.mode.QUIET)
-        with Progress(SpinnerColumn(), transient=True) as prog:
+        with _spinner() as prog:
             prog.add_task(description="")
-            for sfinfo in self.stack:
-                if not (sfinfo.status.removed or sfinfo.dest):
-                    apply_policy(sfinfo, self.policies, self.log_tables, self.mode.STRICT)
-
+            for indexed in self.stack.batches(FileState.ACTIVE, start=self.start):
+                self._extract(s for _, s in indexed if policy_needs_file(s, self.policies, self.mode.STRICT))
+                for _, sfinfo in indexed:
+                    with METRICS.time("task", sfinfo.filesize, task="apply", puid=sfinfo.processed_as or ""):
+                        apply_policy(sfinfo, self.policies, self.log_tables, self.mode.STRICT)
+                    PROBES.evict(sfinfo)
+                    self.stack.update(sfinfo)
+                self.stack.store_logs(self.log_tables)
+                self._append_logs(indexed)
+
+    @METRICS.timed("stage", stage="convert")
     def convert(self) -> None:
-        """Convert files whose metadata status pending is True"""
+        """Convert files whose metadata status pending is True, batch by batch"""
 
-        pending: list[SfInfo] = [sfinfo for sfinfo in self.stack if sfinfo.status.pending]
-
-        if not pending:
+        batches = self.stack.batches(FileState.PENDING, start=self.start)
+        first = next(batches, None)
+        if first is None:
             print_msg("there was nothing to convert", self.mode.QUIET)
             return
 
         print_msg("\nconverting ...", self.mode.QUIET)
-        with Progress(SpinnerColumn(), transient=True) as prog:
+        from fileidentification.tasks.conversion import convert_files  # noqa: PLC0415
+        from fileidentification.wrappers.soffice import SofficePool  # noqa: PLC0415
+
+        slots: dict[str, int] = {key.lower(): value for key, value in self.config["conversion"].items()}
+        self._watchdog()
+        self._probes()
+        cache = self._cache()
+        # the outputs are identified like the files
+        backend, multi = self.config["siegfried"]["BACKEND"], self.config["siegfried"]["MULTI"]
+        # the LibreOffice workers are started with the first batch that has a file they convert
+        soffice: SofficePool | None = None
+        worker: bool = self.config["soffice"]["WORKER"]
+        with _spinner() as prog, ExitStack() as pools:
             prog.add_task(description="", total=None)
-            for sfinfo in pending:
-                conv_sfinfo, cmd = convert_file(sfinfo, self.policies)
-                if conv_sfinfo:
-                    msg = f"converted -> {sfinfo.tdir.stem}/{conv_sfinfo.filename.parent.name}/{conv_sfinfo.filename.name}"
-                    sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg))
-                    conv_sfinfo.root_folder = sfinfo.root_folder
-                    self.stack.append(conv_sfinfo)
-                else:
-                    lmsg = sfinfo.processing_logs.pop()
-                    lmsg.msg += f". cmd={cmd} "
-                    self.log_tables.errors.append((lmsg, sfinfo))
+            for indexed in chain([first], batches):
+                pending: list[SfInfo] = [el[1] for el in indexed]
+                self._extract(pending)
+                if worker and any(SofficePool.supports(self.policies[s.processed_as]) for s in pending):  # type: ignore[index]
+                    worker = False
+                    if soffice := SofficePool.start(slots.get(Bin.SOFFICE, 1) or 1, self.config["soffice"]["PYTHON"]):
+                        pools.enter_context(soffice)
+                for (i, _), (sfinfo, conv_sfinfo, cmds) in zip(
+                    indexed, convert_files(pending, self.policies, slots, soffice, cache, backend, multi), strict=True
+                ):
+                    if conv_sfinfo:
+                        msg = f"converted -> {sfinfo.tdir.stem}/{conv_sfinfo.filename.parent.name}/{conv_sfinfo.filename.name}"
+                        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg))
+                        conv_sfinfo.root_folder = sfinfo.root_folder
+                        # the log of the conversion is written back with the file, in a store or in compact mode
+                        self.stack.update(sfinfo)
+                        j = self.stack.append(conv_sfinfo)
+                        self._append_logs([(i, sfinfo), (j, conv_sfinfo)])
+                    else:
+                        lmsg = sfinfo.processing_logs.pop()
+                        lmsg.msg += f". cmd={'; '.join(cmds)} "
+                        self.stack.update(sfinfo)
+                        self.log_tables.errors.append((lmsg, sfinfo))
+                self.stack.store_logs(self.log_tables)
+        self.stack.commit()
 
     def remove_tmp(self, root_folder: Path, to_csv: bool = False) -> None:
-        # move converted files from the working dir to its destination
-        with Progress(SpinnerColumn(), transient=True) as prog:
+        if self._move_tmp():
+            print_msg(f"\nmoved the files from {self.fp.TMP_DIR.stem} to {root_folder.stem} ...", self.mode.QUIET)
+            self.write_logs(to_csv=to_csv)
+
+    def _move_tmp(self) -> bool:
+        """Move the converted files from the working dir to their destination, return whether there were any"""
+        with _spinner() as prog:
             prog.add_task(description="", total=None)
-            write_logs = move_tmp(self.stack, self.policies, self.log_tables, self.mode.REMOVEORIGINAL)
+            with METRICS.time("stage", stage="move_tmp"):
+                write_logs = move_tmp(self.stack, self.policies, self.log_tables, self.mode.REMOVEORIGINAL)
+            self.stack.store_logs(self.log_tables)
+            self.stack.commit()
 
         # remove empty folders in working dir
         if self.fp.TMP_DIR.is_dir():
             for path, _, _ in os.walk(self.fp.TMP_DIR, topdown=False):
                 if len(os.listdir(path)) == 0:  # noqa: PTH208
                     Path(path).rmdir()
-        if write_logs:
-            print_msg(f"\nmoved the files from {self.fp.TMP_DIR.stem} to {root_folder.stem} ...", self.mode.QUIET)
-            self.write_logs(to_csv=to_csv)
+        return write_logs
 
     def write_logs(self, to_csv: bool = False) -> None:
-        logoutput = LogOutput(files=self.stack, errors=self.log_tables.dump_errors())
-        self.fp.LOG_J.write_text(logoutput.model_dump_json(indent=4, exclude_none=True))
+        self._write_logs(to_csv)
+        print_processing_errors(log_tables=self.stack.load_logs(self.log_tables))
+        sys.exit(0)
 
-        print_processing_errors(log_tables=self.log_tables)
+    def _write_logs(self, to_csv: bool = False, errors: list[SfInfo] | None = None) -> None:
+        """
+        Write the log, the index, the csv and the metrics of the files processed so far
+        :param errors the files with errors in the log, default the ones of the run
+        """
+        with METRICS.time("stage", stage="write_logs"):
+            if errors is None:
+                errors = self.stack.load_logs(self.log_tables).dump_errors()
+            if self._jsonl():
+                if self.log_appender:
+                    self.log_appender.close()
+                write_log(self.fp.LOG_JL, self.stack, errors)
+                if self.config["log"]["EXPORT_JSON"]:
+                    export_json(self.fp.LOG_JL, self.fp.LOG_J)
+            else:
+                logoutput = LogOutput(files=list(self.stack), errors=errors)
+                self.fp.LOG_J.write_text(logoutput.model_dump_json(indent=4, exclude_none=True))
+            self.fp.INDEX_J.write_text(build_index(self.stack).model_dump_json())
+
+            if to_csv:
+                import csv  # noqa: PLC0415
+
+                with open(f"{self.fp.LOG_J}.csv", "w") as f:  # noqa: PTH123
+                    w = csv.DictWriter(f, CSVFIELDS)
+                    w.writeheader()
+                    [w.writerow(sfinfo2csv(el)) for el in self.stack]
+
+            self.stack.commit()
+
+        self._write_metrics()
+
+    def watch(
+        self, root_folder: Path, watcher: "Watcher", inspect: bool, apply: bool, remove_tmp: bool, to_csv: bool
+    ) -> None:
+        """
+        Process the files that arrive in root_folder until the run is stopped (ctrl-c or SIGTERM). each batch of
+        complete files is identified, appended to the stack and goes through the stages of the run. the stages
+        only process the new files, the log is written every LOG_EVERY seconds if there were any
+        """
+        if remove_tmp:
+            self._move_tmp()
+        # docker stop, the logs are written as with ctrl-c
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        print_msg(f"\nwatching {root_folder} ({watcher.backend}), stop with ctrl-c ...", self.mode.QUIET)
+        written, changed = time.monotonic(), False
+        try:
+            for files in watcher:
+                new = [file for file in files if self._new(file.relative_to(root_folder))]
+                if new:
+                    self._ingest(root_folder, new, inspect, apply, remove_tmp)
+                    changed = True
+                if changed and time.monotonic() - written >= self.config["watch"]["LOG_EVERY"]:
+                    self._write_logs(to_csv)
+                    written, changed = time.monotonic(), False
+        except KeyboardInterrupt:
+            print_msg("\nstopped watching", self.mode.QUIET)
+        finally:
+            watcher.close()
+            self.start = 0
+
+    def _new(self, path: Path) -> bool:
+        """Return whether the file that arrived is not in the stack yet and is in the shard of the run"""
+        return self._tracked(f"{path}") is None and (self.shard is None or self.shard.owns(path))
+
+    def _ingest(self, root_folder: Path, files: list[Path], inspect: bool, apply: bool, remove_tmp: bool) -> None:
+        """Identify the files that arrived, add them to the stack and run the stages on them"""
+        from fileidentification.wrappers.siegfried import identify_files  # noqa: PLC0415
+
+        print_msg(f"\n... {len(files)} new files", self.mode.QUIET)
+        self.start = len(self.stack)
+        md5, fixity, workers = (self.config["hashing"][key] for key in ["MD5", "FIXITY", "WORKERS"])
+        indexed: list[tuple[int, SfInfo]] = []
+        for sfinfo in identify_files(files, md5=md5, fixity=fixity, workers=workers):
+            sfinfo.filename = sfinfo.filename.relative_to(root_folder)
+            sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{RSMsg.NEW}"))
+            sfinfo.set_processing_paths(root_folder, self.fp.TMP_DIR, initial=False)
+            self.ba.append(sfinfo)
+            indexed.append((self.stack.append(sfinfo), sfinfo))
+        self._append_logs(indexed)
+        if inspect:
+            self.inspect()
+        if apply:
+            self.apply_policies()
+            self.convert()
+        if remove_tmp:
+            self._move_tmp()
+
+    def _watcher(self, root_folder: Path) -> "Watcher":
+        """Start watching root_folder, without the working dir, the logs and the other files the run writes"""
+        from fileidentification.tasks.watch import Watcher  # noqa: PLC0415
+
+        if self.archive or not root_folder.is_dir():
+            secho(f"{root_folder} is not a folder, only folders can be watched", fg=colors.RED)
+            sys.exit(1)
+        fp = self.fp
+        ignore = [
+            fp.TMP_DIR,
+            fp.LOG_J,
+            fp.LOG_JL,
+            fp.INDEX_J,
+            fp.POLICIES_J,
+            fp.STORE_DB,
+            fp.METRICS_J,
+            fp.METRICS_PROM,
+        ]
+        backend, settle, poll = (self.config["watch"][key] for key in ["BACKEND", "SETTLE", "POLL"])
+        return Watcher(root_folder, backend, settle, poll, ignore)
+
+    def _shard(self, spec: str | None) -> Shard | None:
+        """Return the shard of --shard index/count"""
+        if spec is None:
+            return None
+        index, _, count = spec.partition("/")
+        try:
+            shard = Shard(index=int(index), count=int(count), split=self.config["shards"]["SPLIT"])
+        except ValueError:
+            secho(f"--shard {spec}: expecting index/count with index from 1 to count, e.g. 2/4", fg=colors.RED)
+            sys.exit(1)
+        if self.archive:
+            secho("archives can't be split into shards", fg=colors.RED)
+            sys.exit(1)
+        return shard
 
-        if to_csv:
-            with open(f"{self.fp.LOG_J}.csv", "w") as f:  # noqa: PTH123
-                w = csv.DictWriter(f, CSVFIELDS)
-                w.writeheader()
-                [w.writerow(sfinfo2csv(el)) for el in self.stack]
+    def _run_shards(self, root_folder: Path, count: int, params: dict[str, Any]) -> None:
+        """Run the count shards of root_folder side by side, each in a process of its own, and merge their logs"""
+        if params["watch"]:
+            secho("the shards can't be watched from one process, watch every shard with --shard", fg=colors.RED)
+            sys.exit(1)
+        print_msg(f"\nrunning {count} shards ...", self.mode.QUIET)
+        import multiprocessing  # noqa: PLC0415
+
+        ctx = multiprocessing.get_context("spawn")
+        # plain dicts, the inline tables of toml can't be pickled
+        config = json.loads(json.dumps(self.config))
+        procs = [
+            ctx.Process(target=_run_shard, args=(config, {**params, "shard": f"{index}/{count}", "shards": 0}))
+            for index in range(1, count + 1)
+        ]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        if failed := [index for index, proc in enumerate(procs, 1) if proc.exitcode]:
+            secho(f"shards {failed} of {count} failed, the logs are not merged", fg=colors.RED)
+            sys.exit(1)
+        self.merge(root_folder, count, params["policies_path"], params["to_csv"])
+
+    @METRICS.timed("stage", stage="merge")
+    def merge(self, root_folder: Path, count: int, policies_path: Path | None = None, to_csv: bool = False) -> None:
+        """
+        Merge the logs of the count shards of root_folder into the log of root_folder: the files in the order of the
+        shards and their errors, the policies they generated (if no policies_path was passed to them) and the
+        analytics, with the duplicates across shards
+        """
+        print_msg(f"\nmerging the logs of {count} shards ...", self.mode.QUIET)
+        self.stack = self._catalog()
+        errors: list[SfInfo] = []
+        policies: Policies = {}
+        for index in range(1, count + 1):
+            fp = FilePaths()
+            set_filepaths(fp, self.config, root_folder, Shard(index=index, count=count))
+            if self._jsonl() and fp.LOG_JL.is_file():
+                self.stack.extend(read_log(fp.LOG_JL))
+                errors.extend(SfInfo(**error) for error in read_errors(fp.LOG_JL))
+            elif fp.LOG_J.is_file():
+                log = LogOutput(**json.loads(fp.LOG_J.read_text()))
+                self.stack.extend(log.files or [])
+                errors.extend(log.errors or [])
+            else:
+                secho(f"there is no log of shard {index} of {count}, did it run?", fg=colors.RED)
+                sys.exit(1)
+            if fp.POLICIES_J.is_file():
+                for puid, params in PoliciesFile(**json.loads(fp.POLICIES_J.read_text())).policies.items():
+                    policies.setdefault(puid, params)
+        # the policies the shards generated, if none were passed to them
+        if policies and not self.fp.POLICIES_J.is_file():
+            jsonfile = PoliciesFile(name=self.fp.POLICIES_J, comment=f"merged from {count} shards", policies=policies)
+            jsonfile.name.write_text(jsonfile.model_dump_json(indent=4, exclude_none=True))
+        if policies_path or self.fp.POLICIES_J.is_file():
+            self._load_policies(policies_path or self.fp.POLICIES_J)
 
+        self._analyse(root_folder, initial=False)
+        print_siegfried_errors(ba=self.ba)
+        self.stack.find_duplicates(self.ba, self.config["hashing"]["WORKERS"])
+        print_duplicates(ba=self.ba, mode=self.mode)
+        print_fmts(list(self.ba.puid_unique), self.ba, self.policies, self.mode)
+        self._write_logs(to_csv, errors)
+        path = self.fp.LOG_JL if self._jsonl() else self.fp.LOG_J
+        print_msg(f"\nmerged {len(self.stack)} files and {len(errors)} errors into {path}", self.mode.QUIET)
         sys.exit(0)
 
     # default run, has a typer interface for the params in identify.py
-    def run(
+    def run(  # noqa: C901
         self,
         root_folder: Path | str,
         inspect: bool = True,
@@ -289,15 +697,37 @@ class FileHandler:
         mode_verbose: bool = True,
         mode_quiet: bool = True,
         to_csv: bool = False,
+        metrics: bool = False,
+        watch: bool = False,
+        shard: str | None = None,
+        shards: int = 0,
+        merge: int = 0,
     ) -> None:
+        # the params of the run, for the runs of the shards
+        params = {key: value for key, value in locals().items() if key != "self"}
         root_folder = Path(root_folder)
+        # the members of an archive are read out of it, they are extracted next to it when needed on disk
+        if root_folder.is_file():
+            from fileidentification.wrappers.archives import archive_root, is_archive  # noqa: PLC0415
+
+            if is_archive(root_folder):
+                self.archive, root_folder = root_folder, archive_root(root_folder)
         # set dirs / paths
-        set_filepaths(self.fp, self.config, root_folder)
+        self.shard = self._shard(shard)
+        set_filepaths(self.fp, self.config, root_folder, self.shard)
         # set the mode
         self.mode.REMOVEORIGINAL = remove_original
         self.mode.VERBOSE = mode_verbose
         self.mode.STRICT = mode_strict
         self.mode.QUIET = mode_quiet
+        self.metrics = metrics
+        # the shards run as processes or on other nodes, here their logs are merged
+        if shards:
+            self._run_shards(root_folder, shards, params)
+        if merge:
+            self.merge(root_folder, merge, policies_path, to_csv)
+        # watch from the start, so the files that arrive while the folder is loaded are not missed
+        watcher = self._watcher(root_folder) if watch else None
         # generate a list of SfInfo objects out of the target folder
         self._load_sfinfos(root_folder)
         # generate policies
@@ -305,8 +735,8 @@ class FileHandler:
         # convert caveat
         if convert:
             self.convert()
-        # remove tmp caveat
-        if remove_tmp:
+        # remove tmp caveat, in watch mode they are moved before watching
+        if remove_tmp and not watcher:
             self.remove_tmp(root_folder, to_csv)
         # probing the files
         if inspect:
@@ -320,8 +750,27 @@ class FileHandler:
         if apply:
             self.apply_policies()
             self.convert()
+        # process the files that arrive until the run is stopped
+        if watcher:
+            self.watch(root_folder, watcher, inspect, apply, remove_tmp, to_csv)
         # remove tmp files
         if remove_tmp:
             self.remove_tmp(root_folder, to_csv)
         # write logs (if not called within remove_tmp)
         self.write_logs(to_csv=to_csv)
+
+
+def _spinner(text: bool = False) -> "Progress":
+    """Return a transient spinner, with the description of its task if text"""
+    from rich.progress import Progress, SpinnerColumn, TextColumn  # noqa: PLC0415
+
+    if text:
+        return Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True)
+    return Progress(SpinnerColumn(), transient=True)
+
+
+def _run_shard(config: dict[str, Any], params: dict[str, Any]) -> None:
+    """Run a shard in a process of its own (see FileHandler._run_shards)"""
+    fh = FileHandler()
+    fh.config = config
+    fh.run(**params)
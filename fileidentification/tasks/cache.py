@@ -0,0 +1,116 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections.abc import Iterator
+from contextlib import suppress
+from pathlib import Path
+
+from fileidentification.definitions.models import PolicyParams, SfInfo
+
+# the fields of a policy that change the output of a conversion
+OUTPUT_FIELDS = {"bin", "processing_args", "target_container", "expected"}
+# the fields of the SfInfo of an output that belong to the file it was converted from
+SOURCE_FIELDS = {"derived_from", "dest"}
+ENTRY = "entry.json"
+# ioctl of linux that lets a file share the blocks of another copy-on-write (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+class ConversionCache:
+    """
+    The verified outputs of conversions on local disk, keyed on the md5 of the source and a hash of the policy.
+    Duplicates within a run and the same content in other collections are converted once, the other files get
+    a copy of the output (a reflink where the filesystem supports it) and its SfInfo. When the outputs exceed max_size, the least recently
+    used entries are evicted. Every entry is a folder with the output and entry.json: the SfInfo and the cmd.
+    """
+
+    def __init__(self, root: Path, max_size: int) -> None:
+        self.root = root
+        self.max_size = max_size
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(sfinfo: SfInfo, args: PolicyParams) -> str:
+        policy = args.model_dump_json(include=OUTPUT_FIELDS).encode()
+        return f"{sfinfo.ensure_md5()}_{hashlib.sha256(policy).hexdigest()[:16]}"
+
+    def get(self, key: str, target: Path) -> tuple[SfInfo, str] | None:
+        """Copy the cached output to target, returns its SfInfo (with target as filename) and the cmd"""
+        entry = self._entry(key)
+        try:
+            data = json.loads((entry / ENTRY).read_text())
+            output = entry / data["output"]
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.unlink(missing_ok=True)
+            _copy(output, target)
+            # the entry is used, evicted last
+            os.utime(entry / ENTRY)
+        except (OSError, ValueError, KeyError):
+            return None
+        sfinfo = SfInfo(**data["sfinfo"])
+        sfinfo.filename = target
+        return sfinfo, data["cmd"]
+
+    def put(self, key: str, sfinfo: SfInfo, cmd: str) -> None:
+        """Add the verified output sfinfo.filename with its SfInfo, evict the oldest entries if the cache is full"""
+        entry = self._entry(key)
+        if entry.is_dir():
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # the entry is written aside and renamed, so other processes sharing the cache never see half of it
+        tmp = Path(tempfile.mkdtemp(dir=entry.parent, prefix=".tmp_"))
+        try:
+            _copy(sfinfo.filename, tmp / sfinfo.filename.name)
+            data = {
+                "output": sfinfo.filename.name,
+                "sfinfo": sfinfo.model_dump(mode="json", exclude_none=True, exclude=SOURCE_FIELDS),
+            }
+            (tmp / ENTRY).write_text(json.dumps({**data, "cmd": cmd}))
+            tmp.rename(entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        with self._lock:
+            self._size += sfinfo.filename.stat().st_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _entries(self) -> Iterator[tuple[float, int, Path]]:
+        """Yield last use, size of the output and folder of every entry"""
+        for entry in self.root.glob(f"*/*/{ENTRY}"):
+            with suppress(OSError, ValueError, KeyError):
+                output = entry.parent / json.loads(entry.read_text())["output"]
+                yield entry.stat().st_mtime, output.stat().st_size, entry.parent
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries until the cache is below max_size again"""
+        self._size, full = 0, False
+        for _, size, entry in sorted(self._entries(), reverse=True):
+            full = full or self._size + size > self.max_size
+            if full:
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                self._size += size
+
+
+def _copy(src: Path, dst: Path) -> None:
+    """
+    Copy src to dst, as a reflink if the filesystem supports it. not as a hard link: the output in the collection
+    and the entry stay separate files, a change of one doesn't reach the other
+    """
+    if sys.platform == "linux":
+        with src.open("rb") as fsrc, dst.open("wb") as fdst, suppress(OSError):
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            shutil.copystat(src, dst)
+            return
+    shutil.copy2(src, dst)
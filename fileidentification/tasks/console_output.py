@@ -22,12 +22,8 @@ def print_fmts(puids: list[str], ba: BasicAnalytics, policies: Policies, mode: M
         bold=True,
     )
     for puid in puids:
-        bytes_size: int = 0
-        for sfinfo in ba.puid_unique[puid]:
-            bytes_size += sfinfo.filesize
-        ba.total_size[puid] = bytes_size
-        size = _format_bite_size(bytes_size)
-        nbr, fmtname = len(ba.puid_unique[puid]), f"{FMT2EXT[puid]['name']}"
+        size = _format_bite_size(ba.puid_unique[puid].size)
+        nbr, fmtname = ba.puid_unique[puid].count, f"{FMT2EXT[puid]['name']}"
         if puid not in policies:
             pn = "missing"
             rm = "remove" if mode.STRICT else ""
@@ -46,22 +42,20 @@ def print_fmts(puids: list[str], ba: BasicAnalytics, policies: Policies, mode: M
 def print_diagnostic(log_tables: LogTables, mode: Mode) -> None:
     # lists all corrupt files with the respective errors thrown
     if log_tables.diagnostics:
-        if FDMsg.ERROR.name in log_tables.diagnostics:
-            secho("\n----------- errors -----------", bold=True)
-            for sfinfo in log_tables.diagnostics[FDMsg.ERROR.name]:
-                secho(f"\n{_format_bite_size(sfinfo.filesize): >10}    {sfinfo.filename}")
-                _print_logs(sfinfo.processing_logs)
+        _print_diagnostic(log_tables, FDMsg.ERROR, "errors")
+        _print_diagnostic(log_tables, FDMsg.TIMEOUT, "stopped by the watchdog")
+        _print_diagnostic(log_tables, FDMsg.NOTFOUND, "not inspected, the bin was not found")
         if mode.VERBOSE and not mode.QUIET:
-            if FDMsg.WARNING.name in log_tables.diagnostics:
-                secho("\n----------- warnings -----------", bold=True)
-                for sfinfo in log_tables.diagnostics[FDMsg.WARNING.name]:
-                    secho(f"\n{_format_bite_size(sfinfo.filesize): >10}    {sfinfo.filename}")
-                    _print_logs(sfinfo.processing_logs)
-            if FDMsg.EXTMISMATCH.name in log_tables.diagnostics:
-                secho("\n----------- extension missmatch -----------", bold=True)
-                for sfinfo in log_tables.diagnostics[FDMsg.EXTMISMATCH.name]:
-                    secho(f"\n{_format_bite_size(sfinfo.filesize): >10}    {sfinfo.filename}")
-                    _print_logs(sfinfo.processing_logs)
+            _print_diagnostic(log_tables, FDMsg.WARNING, "warnings")
+            _print_diagnostic(log_tables, FDMsg.EXTMISMATCH, "extension missmatch")
+
+
+def _print_diagnostic(log_tables: LogTables, fdmsg: FDMsg, title: str) -> None:
+    if fdmsg.name in log_tables.diagnostics:
+        secho(f"\n----------- {title} -----------", bold=True)
+        for sfinfo in log_tables.diagnostics[fdmsg.name]:
+            secho(f"\n{_format_bite_size(sfinfo.filesize): >10}    {sfinfo.filename}")
+            _print_logs(sfinfo.processing_logs)
 
 
 def print_duplicates(ba: BasicAnalytics, mode: Mode) -> None:
@@ -1,81 +1,277 @@
 import json
+import os
+import tempfile
+import threading
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
+from queue import Queue
 
-import pygfried
 from typer import colors, secho
 
-from fileidentification.definitions.constants import Bin, FPMsg
+from fileidentification.definitions.constants import Bin, FPMsg, SfBackend
+from fileidentification.definitions.metrics import METRICS
 from fileidentification.definitions.models import LogMsg, Policies, PolicyParams, SfInfo
-from fileidentification.wrappers.converter import convert
+from fileidentification.tasks.cache import ConversionCache
+from fileidentification.wrappers.converter import convert, target_path, workdir
 from fileidentification.wrappers.ffmpeg import ffmpeg_media_info
-from fileidentification.wrappers.imagemagick import imagemagick_media_info
+from fileidentification.wrappers.imagemagick import imagemagick_media_info, imagemagick_media_infos
+from fileidentification.wrappers.process import LimitExceededError, ToolNotFoundError
+from fileidentification.wrappers.siegfried import identify_batch
+from fileidentification.wrappers.soffice import SofficePool
 
+# outputs of convert_files verified at once
+VERIFY_BATCH = 32
 
-def _add_media_info(sfinfo: SfInfo, _bin: str) -> None:
-    match _bin:
-        case Bin.FFMPEG:
-            streams = ffmpeg_media_info(sfinfo.filename)
+# the output of a conversion that is still to be verified: the converted file and the log of the bin
+Output = tuple[Path, LogMsg | None]
+
+
+def _add_media_info(targets: list[tuple[SfInfo, str]]) -> None:
+    """Add the media info to the verified outputs, the one of the images is read with one call of magick identify"""
+    images = [sfinfo for sfinfo, _bin in targets if _bin == Bin.MAGICK]
+    infos = imagemagick_media_infos([sfinfo.filename for sfinfo in images]) if len(images) > 1 else [None] * len(images)
+    for sfinfo, info in zip(images, infos, strict=True):
+        try:
+            msg = imagemagick_media_info(sfinfo.filename) if info is None else info
+            sfinfo.media_info.append(LogMsg(name="imagemagick", msg=msg))
+        except LimitExceededError as e:
+            # the output is verified already, it only misses its media info
+            sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.TIMEOUT} {e.reason}"))
+        except ToolNotFoundError as e:
+            sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.NOTFOUND} {e.reason}"))
+    for sfinfo, _bin in targets:
+        if _bin != Bin.FFMPEG:
+            continue
+        try:
+            # the output is probed once, it is not read again in this run
+            streams = ffmpeg_media_info(sfinfo.filename, sfinfo.md5, keep=False)
             sfinfo.media_info.append(LogMsg(name="ffmpeg", msg=json.dumps(streams)))
-        case Bin.MAGICK:
-            sfinfo.media_info.append(LogMsg(name="imagemagick", msg=imagemagick_media_info(sfinfo.filename)))
-        case _:
-            pass
+        except LimitExceededError as e:
+            sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.TIMEOUT} {e.reason}"))
+        except ToolNotFoundError as e:
+            sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.NOTFOUND} {e.reason}"))
 
 
-def _verify(target: Path, sfinfo: SfInfo, expected: list[str]) -> SfInfo | None:
+def verify_outputs(
+    converted: list[tuple[SfInfo, PolicyParams, Output]],
+    workers: int = 0,
+    backend: str = SfBackend.PYGFRIED,
+    multi: int = 0,
+) -> list[SfInfo | None]:
     """
-    Analyse the created file with pygfried, returns a SfInfo for the new file if verification passed,
-    :param sfinfo the metadata of the origin
-    :param target the path to the converted file to analyse with siegfried
-    :param expected the expected file format, to verify the conversion
+    Analyse the outputs of a batch of conversions with siegfried, returns a SfInfo for each output that passed
+    the verification, None for the others. the outputs are identified with one scan of sf that hashes them in the
+    same read (see identify_batch), then their media info and the logs of the bins are added.
+    :param converted the metadata of the origin, its policy with the expected file formats and the output
+    :param workers number of threads hashing the outputs, 0 means number of cpus
+    :param backend, multi how the outputs are identified (see identify)
     """
-    target_sfinfo = None
-    if target.is_file():
-        # generate a SfInfo of the converted file
-        target_sfinfo = SfInfo(**pygfried.identify(f"{target}", detailed=True)["files"][0])  # type: ignore[arg-type]
+    results: list[SfInfo | None] = [None] * len(converted)
+    created: list[int] = []
+    for i, (sfinfo, _, (target, _)) in enumerate(converted):
+        if target.is_file():
+            created.append(i)
+        else:
+            # conversion error, nothing to analyse
+            sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.CONVFAILED}"))
+            secho(f"\tERROR failed to convert {sfinfo.filename} to {target}", fg=colors.RED, bold=True)
+
+    targets = identify_batch([converted[i][2][0] for i in created], backend, multi, workers=workers)
+    for i, target_sfinfo in zip(created, targets, strict=True):
+        sfinfo, args, (target, _) = converted[i]
         # only add postprocessing information if conversion was successful
-        if target_sfinfo.processed_as in expected:
+        if target_sfinfo.processed_as in args.expected:
             target_sfinfo.dest = sfinfo.filename.parent
             target_sfinfo.derived_from = sfinfo
             sfinfo.status.pending = False
-
+            results[i] = target_sfinfo
         else:
-            p_error = f" did expect {expected}, got {target_sfinfo.processed_as} instead"
+            p_error = f" did expect {args.expected}, got {target_sfinfo.processed_as} instead"
             sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.NOTEXPECTEDFMT}{p_error}"))
             secho(f"\tERROR: {p_error} when converting {sfinfo.filename} to {target}", fg=colors.YELLOW, bold=True)
-            target_sfinfo = None
-
-    else:
-        # conversion error, nothing to analyse
-        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.CONVFAILED}"))
-        secho(f"\tERROR failed to convert {sfinfo.filename} to {target}", fg=colors.RED, bold=True)
 
-    return target_sfinfo
+    _add_media_info([(t, args.bin) for t, (_, args, _) in zip(results, converted, strict=True) if t])
+    for result, (_, _, (_, log)) in zip(results, converted, strict=True):
+        if result and log:
+            result.processing_logs.append(log)
+    return results
 
 
 # file migration
-def convert_file(sfinfo: SfInfo, policies: Policies) -> tuple[SfInfo | None, list[str]]:
+def convert_file(
+    sfinfo: SfInfo,
+    policies: Policies,
+    threads: int = 0,
+    profile: Path | None = None,
+    soffice: SofficePool | None = None,
+    cache: ConversionCache | None = None,
+) -> tuple[SfInfo | None, list[str]]:
     """
     Convert a file, returns the metadata of the converted file as SfInfo
     :param sfinfo the metadata of the file to convert
     :param policies the policies for fileconversion
+    :param threads max number of threads of ffmpeg, 0 lets ffmpeg decide
+    :param profile LibreOffice user profile dir to use
+    :param soffice running LibreOffice instances to use
+    :param cache the outputs of earlier conversions, the file is only converted if its md5 and policy are not in it
     """
 
     args: PolicyParams = policies[sfinfo.processed_as]  # type: ignore[index]
+    _, target_sfinfo, cmds = next(
+        _verified([(sfinfo, _convert(sfinfo, args, threads, profile, soffice, cache))], policies, cache)
+    )
+    return target_sfinfo, cmds
 
-    target_path, cmd, logfile_path = convert(sfinfo, args)
+
+def _convert(
+    sfinfo: SfInfo,
+    args: PolicyParams,
+    threads: int,
+    profile: Path | None,
+    soffice: SofficePool | None,
+    cache: ConversionCache | None,
+) -> tuple[SfInfo | None, list[str], Output | None]:
+    """Convert the file, returns the SfInfo of the output if it is in the cache (verified already), else the output"""
+    with METRICS.time("task", sfinfo.filesize, task="convert", puid=sfinfo.processed_as or ""):
+        if cache and (hit := cache.get(key := cache.key(sfinfo, args), target_path(sfinfo, args))):
+            cached, cmd = hit
+            cached.dest, cached.derived_from = sfinfo.filename.parent, sfinfo
+            cached.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.CACHED} {key}"))
+            sfinfo.status.pending = False
+            return cached, [cmd], None
+        output, cmds = _convert_file(sfinfo, args, threads, profile, soffice)
+        return None, cmds, output
+
+
+def _convert_file(
+    sfinfo: SfInfo, args: PolicyParams, threads: int, profile: Path | None, soffice: SofficePool | None
+) -> tuple[Output | None, list[str]]:
+    """Run the conversion, returns the output to verify (None if the watchdog stopped it or the bin is missing) and the cmd"""
+    try:
+        target, cmd, log = convert(sfinfo, args, threads=threads, profile=profile, soffice=soffice)
+    except LimitExceededError as e:
+        # a partial output is not verified, the file stays pending
+        target_path(sfinfo, args).unlink(missing_ok=True)
+        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.TIMEOUT} {e.reason}"))
+        secho(f"\tERROR {e.reason} when converting {sfinfo.filename}", fg=colors.RED, bold=True)
+        return None, [e.cmd]
+    except ToolNotFoundError as e:
+        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.NOTFOUND} {e.reason}"))
+        secho(f"\tERROR {e.reason} when converting {sfinfo.filename}", fg=colors.RED, bold=True)
+        return None, [e.cmd]
 
     # replace abs path in logs, add name
     processing_log = None
-    logtext = logfile_path.read_text().replace(f"{sfinfo.root_folder}/", "").replace(f"{sfinfo.tdir}/", "")
+    logtext = log.replace(f"{sfinfo.root_folder}/", "").replace(f"{sfinfo.tdir}/", "")
     if logtext != "":
         processing_log = LogMsg(name=f"{args.bin}", msg=logtext)
+    return (target, processing_log), [cmd]
+
+
+def convert_files(  # noqa: C901
+    sfinfos: list[SfInfo],
+    policies: Policies,
+    slots: dict[str, int],
+    soffice: SofficePool | None = None,
+    cache: ConversionCache | None = None,
+    backend: str = SfBackend.PYGFRIED,
+    multi: int = 0,
+) -> Iterator[tuple[SfInfo, SfInfo | None, list[str]]]:
+    """
+    Convert the files on one thread pool per bin, yields (sfinfo, converted sfinfo, cmd) in the order of sfinfos.
+    The jobs are started smallest file first, so the short ones don't wait behind a few huge videos.
+    The outputs are verified in batches of VERIFY_BATCH (see verify_outputs) while the next files are converted.
+    The cpus are split among the ffmpeg slots (-threads), unless the policy sets the threads itself.
+    With more than one LibreOffice slot, every slot gets its own LibreOffice profile, as the profile is locked.
+    :param slots number of files converted at once per bin, 0 = number of cpus
+    :param soffice running LibreOffice instances, used for the conversions they support
+    :param cache the outputs of earlier conversions, duplicates are converted once: a duplicate is started after
+    the output of the file before it is verified and in the cache, it gets a copy of the output
+    :param backend, multi how the outputs are identified (see identify)
+    """
+    cpus = os.cpu_count() or 1
+    workers: dict[str, int] = {pbin: slots.get(pbin, 0) or cpus for pbin in Bin}
+    threads = max(1, cpus // workers[Bin.FFMPEG])
+    # duplicates are converted into the same working dir, they must not run at the same time
+    locks = {f"{workdir(sfinfo)}": threading.Lock() for sfinfo in sfinfos}
+    keys = [cache.key(sfinfo, policies[sfinfo.processed_as]) for sfinfo in sfinfos] if cache else []  # type: ignore[index]
+    # the position of the last file of every key that was started
+    started: dict[str, int] = {}
+
+    with ExitStack() as stack:
+        profiles: Queue[Path] | None = None
+        if workers[Bin.SOFFICE] > 1:
+            profiles_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="soffice_")))
+            profiles = Queue()
+            for i in range(workers[Bin.SOFFICE]):
+                profiles.put(profiles_dir / f"{i}")
+
+        pools: dict[str, ThreadPoolExecutor] = {}
+        futures: dict[int, Future[tuple[SfInfo | None, list[str], Output | None]]] = {}
+
+        def submit(i: int) -> None:
+            sfinfo = sfinfos[i]
+            pbin = policies[sfinfo.processed_as].bin  # type: ignore[index]
+            if pbin not in pools:
+                pools[pbin] = stack.enter_context(ThreadPoolExecutor(max_workers=workers[pbin]))
+            lock = locks[f"{workdir(sfinfo)}"]
+            futures[i] = pools[pbin].submit(_convert_job, sfinfo, policies, lock, threads, profiles, soffice, cache)
+
+        for i in sorted(range(len(sfinfos)), key=lambda i: sfinfos[i].filesize):
+            if not keys or started.setdefault(keys[i], i) == i:
+                submit(i)
 
-    # create an SfInfo for target and verify output, add codec and processing logs
-    target_sfinfo = _verify(target_path, sfinfo, args.expected)
-    if target_sfinfo:
-        _add_media_info(target_sfinfo, args.bin)
-        if processing_log:
-            target_sfinfo.processing_logs.append(processing_log)
+        done: list[tuple[SfInfo, tuple[SfInfo | None, list[str], Output | None]]] = []
+        for i, sfinfo in enumerate(sfinfos):
+            if i not in futures:
+                # a duplicate, the file before it is verified with its batch first (if it is in the one still open)
+                if started[keys[i]] >= i - len(done):
+                    yield from _verified(done, policies, cache, backend, multi)
+                    done = []
+                started[keys[i]] = i
+                submit(i)
+            done.append((sfinfo, futures[i].result()))
+            if len(done) == VERIFY_BATCH or i == len(sfinfos) - 1:
+                yield from _verified(done, policies, cache, backend, multi)
+                done = []
 
-    return target_sfinfo, [cmd]
+
+def _verified(
+    done: list[tuple[SfInfo, tuple[SfInfo | None, list[str], Output | None]]],
+    policies: Policies,
+    cache: ConversionCache | None = None,
+    backend: str = SfBackend.PYGFRIED,
+    multi: int = 0,
+) -> Iterator[tuple[SfInfo, SfInfo | None, list[str]]]:
+    """
+    Verify the outputs of the finished jobs at once and put them into the cache,
+    yields (sfinfo, converted sfinfo, cmd) in their order
+    """
+    outputs = [(sfinfo, policies[sfinfo.processed_as], output) for sfinfo, (_, _, output) in done if output]  # type: ignore[index]
+    verified = iter(verify_outputs(outputs, backend=backend, multi=multi) if outputs else [])
+    for sfinfo, (target_sfinfo, cmds, output) in done:
+        if output and (target_sfinfo := next(verified)) and cache:
+            cache.put(cache.key(sfinfo, policies[sfinfo.processed_as]), target_sfinfo, cmds[0])  # type: ignore[index]
+        yield sfinfo, target_sfinfo, cmds
+
+
+def _convert_job(
+    sfinfo: SfInfo,
+    policies: Policies,
+    lock: threading.Lock,
+    threads: int,
+    profiles: Queue[Path] | None,
+    soffice: SofficePool | None,
+    cache: ConversionCache | None,
+) -> tuple[SfInfo | None, list[str], Output | None]:
+    args: PolicyParams = policies[sfinfo.processed_as]  # type: ignore[index]
+    with lock:
+        if profiles is None or args.bin != Bin.SOFFICE:
+            return _convert(sfinfo, args, threads, None, soffice, cache)
+        profile = profiles.get()
+        try:
+            return _convert(sfinfo, args, 0, profile, soffice, cache)
+        finally:
+            profiles.put(profile)
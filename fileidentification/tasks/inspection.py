@@ -1,15 +1,125 @@
 import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
 
 from typer import colors, secho
 
 from fileidentification.definitions.constants import FMT2EXT, Bin, ErrMsgRE, FDMsg, FPMsg
+from fileidentification.definitions.metrics import METRICS
 from fileidentification.definitions.models import LogMsg, LogTables, Policies, SfInfo
-from fileidentification.tasks.os_tasks import remove
-from fileidentification.wrappers.ffmpeg import ffmpeg_inspect
-from fileidentification.wrappers.imagemagick import imagemagick_inspect
+from fileidentification.tasks.os_tasks import FS_LOCK, remove
+from fileidentification.wrappers.ffmpeg import DecodeParams, ffmpeg_inspect
+from fileidentification.wrappers.imagemagick import imagemagick_inspect, imagemagick_inspect_batch
+from fileidentification.wrappers.process import LimitExceededError, ToolNotFoundError
 
+# pool of the full decodes with ffmpeg in verbose mode, they are limited separately from the plain ffprobe calls
+FFMPEG_VERBOSE = "ffmpeg_verbose"
+# pool of the files that are not probed with a bin
+OTHER = "other"
 
-def inspect_file(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, verbose: bool) -> None:
+
+def inspect_files(
+    sfinfos: list[SfInfo],
+    policies: Policies,
+    log_tables: LogTables,
+    verbose: bool,
+    limits: dict[str, int],
+    decode: DecodeParams | None = None,
+    batch: int = 1,
+) -> None:
+    """
+    Inspect the files in parallel. every bin gets its own thread pool, so that e.g. a few long ffmpeg decodes
+    don't block the imagemagick probes. each file logs into its own LogTables, they are merged into log_tables
+    in the order of sfinfos once all files are inspected.
+    :param limits number of files inspected at once per pool (Bin, FFMPEG_VERBOSE or OTHER), 0 = number of cpus
+    :param decode how ffmpeg decodes the files in verbose mode, default is the whole file
+    :param batch number of images probed with one call of magick identify (not in verbose mode), 1 = one per image
+    """
+    # the cpus are split among the files decoded at once, so their windows don't run all at the same time
+    decode = decode or DecodeParams()
+    if not decode.concurrency:
+        cpus = os.cpu_count() or 1
+        decode = decode.model_copy(update={"concurrency": max(1, cpus // (limits.get(FFMPEG_VERBOSE, 0) or cpus))})
+    # the future of every file, with the position of the file in it
+    futures: dict[int, tuple[Future[list[LogTables]], int]] = {}
+    with ExitStack() as stack:
+        pools: dict[str, ThreadPoolExecutor] = {}
+
+        def pool(key: str) -> ThreadPoolExecutor:
+            if key not in pools:
+                workers = limits.get(key, 0) or os.cpu_count() or 1
+                pools[key] = stack.enter_context(ThreadPoolExecutor(max_workers=workers))
+            return pools[key]
+
+        batched = [i for i, sfinfo in enumerate(sfinfos) if batch > 1 and _batchable(sfinfo, policies, verbose)]
+        for start in range(0, len(batched), batch):
+            chunk = batched[start : start + batch]
+            future = pool(Bin.MAGICK).submit(_inspect_batch, [sfinfos[i] for i in chunk], policies)
+            futures.update({i: (future, offset) for offset, i in enumerate(chunk)})
+        for i, sfinfo in enumerate(sfinfos):
+            if i not in futures:
+                key = _pool_key(probe_bin(sfinfo, policies), verbose)
+                futures[i] = (pool(key).submit(_inspect_single, sfinfo, policies, verbose, decode), 0)
+    for i in range(len(sfinfos)):
+        future, offset = futures[i]
+        log_tables.merge(future.result()[offset])
+
+
+def _pool_key(pbin: str, verbose: bool) -> str:
+    if pbin == Bin.FFMPEG and verbose:
+        return FFMPEG_VERBOSE
+    if pbin in [Bin.FFMPEG, Bin.MAGICK]:
+        return pbin
+    return OTHER
+
+
+def _batchable(sfinfo: SfInfo, policies: Policies, verbose: bool) -> bool:
+    """Return whether the file goes straight to a probe with magick identify: it is neither removed nor renamed"""
+    return (
+        _pool_key(probe_bin(sfinfo, policies), verbose) == Bin.MAGICK
+        and bool(sfinfo.processed_as)
+        and sfinfo.errors != FDMsg.EMPTYSOURCE
+        and sfinfo.matches[0]["warning"] != FDMsg.EXTMISMATCH
+    )
+
+
+def _inspect_batch(sfinfos: list[SfInfo], policies: Policies) -> list[LogTables]:
+    """Inspect the images with one call of magick identify, the ones it could not assign are probed one by one"""
+    probed = imagemagick_inspect_batch(sfinfos)
+    return [_inspect_file(sfinfo, policies, False, None, res) for sfinfo, res in zip(sfinfos, probed, strict=True)]
+
+
+def _inspect_single(sfinfo: SfInfo, policies: Policies, verbose: bool, decode: DecodeParams | None) -> list[LogTables]:
+    return [_inspect_file(sfinfo, policies, verbose, decode)]
+
+
+def _inspect_file(
+    sfinfo: SfInfo,
+    policies: Policies,
+    verbose: bool,
+    decode: DecodeParams | None,
+    probed: tuple[bool, str, str] | None = None,
+) -> LogTables:
+    log_tables = LogTables()
+    with METRICS.time("task", sfinfo.filesize, task="inspect", puid=sfinfo.processed_as or ""):
+        inspect_file(sfinfo, policies, log_tables, verbose, decode, probed)
+    return log_tables
+
+
+def inspect_file(
+    sfinfo: SfInfo,
+    policies: Policies,
+    log_tables: LogTables,
+    verbose: bool,
+    decode: DecodeParams | None = None,
+    probed: tuple[bool, str, str] | None = None,
+) -> None:
+    """
+    Inspect the file: remove it if siegfried could not identify it or it is empty, rename it on an extension
+    mismatch and probe it with its bin.
+    :param probed the outcome of imagemagick_inspect, if the file was already probed in a batch
+    """
     puid = sfinfo.processed_as
     if not puid:
         remove(sfinfo, log_tables)
@@ -36,19 +146,32 @@ def inspect_file(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, verb
         log_tables.diagnostics_add(sfinfo, FDMsg.EXTMISMATCH)
 
     # check if the file throws any errors while open/processing it with the respective bin
-    if _content_errors(sfinfo, policies, log_tables, verbose):
+    try:
+        errors = _content_errors(sfinfo, policies, log_tables, verbose, decode, probed)
+    except LimitExceededError as e:
+        # the bin hung or ran out of resources on the file, it is kept and reported instead of stalling the run
+        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.TIMEOUT} {e.reason}"))
+        log_tables.diagnostics_add(sfinfo, FDMsg.TIMEOUT)
+        return
+    except ToolNotFoundError as e:
+        # a missing bin is no sign of a corrupt file, it is kept and reported
+        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.NOTFOUND} {e.reason}"))
+        log_tables.diagnostics_add(sfinfo, FDMsg.NOTFOUND)
+        return
+    if errors:
         sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FDMsg.ERROR}"))
         remove(sfinfo, log_tables)
         return
 
 
 def _rename(sfinfo: SfInfo, ext: str, log_tables: LogTables) -> None:
-    dest = sfinfo.path.with_suffix(ext)
-    # if a file with same name and extension already there, append file hash to name
-    if sfinfo.path.with_suffix(ext).is_file():
-        dest = sfinfo.path.parent / f"{sfinfo.path.stem}_{sfinfo.md5[:6]}{ext}"
     try:
-        sfinfo.path.rename(dest)
+        with FS_LOCK:
+            dest = sfinfo.path.with_suffix(ext)
+            # if a file with same name and extension already there, append file hash to name
+            if dest.is_file():
+                dest = sfinfo.path.parent / f"{sfinfo.path.stem}_{sfinfo.ensure_md5()[:6]}{ext}"
+            sfinfo.path.rename(dest)
         msg = f"did rename {sfinfo.path.name} -> {dest.name}"
         sfinfo.path, sfinfo.filename = dest, dest.relative_to(sfinfo.root_folder)
         sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg))
@@ -57,7 +180,14 @@ def _rename(sfinfo: SfInfo, ext: str, log_tables: LogTables) -> None:
         log_tables.errors.append((LogMsg(name="filehandler", msg=str(e)), sfinfo))
 
 
-def _content_errors(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, verbose: bool) -> bool:  # noqa: C901, PLR0912
+def _content_errors(  # noqa: C901
+    sfinfo: SfInfo,
+    policies: Policies,
+    log_tables: LogTables,
+    verbose: bool,
+    decode: DecodeParams | None = None,
+    probed: tuple[bool, str, str] | None = None,
+) -> bool:
     """
     Check if the file throws any error while opening or playing.
     Error logging is added to the SfInfo class, only return True if there are major errors
@@ -66,23 +196,19 @@ def _content_errors(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, v
     :param policies the policies
     :param log_tables the logtables
     :param verbose if true it does more detailed inspections
+    :param decode how ffmpeg decodes the file in verbose mode
+    :param probed the outcome of imagemagick_inspect from a batch, the file is not probed again
     """
 
-    pbin = ""
-    if sfinfo.processed_as in policies:
-        pbin = policies[sfinfo.processed_as].bin
-    # select bin out of mimetype if not specified in policies
-    if pbin == "" and sfinfo.matches[0]["mime"] != "":  # noqa: SIM102
-        if sfinfo.matches[0]["mime"].split("/")[0] in ["image", "audio", "video"]:
-            mime = sfinfo.matches[0]["mime"].split("/")[0]
-            pbin = Bin.MAGICK if mime == "image" else Bin.FFMPEG
-            msg = f"bin not specified in policies, using {pbin} according to the file mimetype for probing"
-            sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg))
+    pbin = probe_bin(sfinfo, policies)
+    if pbin and not (sfinfo.processed_as in policies and policies[sfinfo.processed_as].bin):
+        msg = f"bin not specified in policies, using {pbin} according to the file mimetype for probing"
+        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg))
 
     # get the specs and errors
     match pbin:
         case Bin.FFMPEG:
-            error, warning, specs = ffmpeg_inspect(sfinfo, verbose=verbose)
+            error, warning, specs = ffmpeg_inspect(sfinfo, verbose=verbose, decode=decode)
             if specs and not sfinfo.media_info:
                 sfinfo.media_info.append(LogMsg(name=Bin.FFMPEG, msg=json.dumps(specs)))
             if warning:
@@ -92,7 +218,7 @@ def _content_errors(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, v
                     sfinfo.processing_logs.append(LogMsg(name="filehandler", msg="re-encoding the file"))
                     sfinfo.status.pending = True
         case Bin.MAGICK:
-            error, warning, specs = imagemagick_inspect(sfinfo, verbose=verbose)  # type: ignore[assignment]
+            error, warning, specs = probed or imagemagick_inspect(sfinfo, verbose=verbose)  # type: ignore[assignment]
             if specs and not sfinfo.media_info:
                 sfinfo.media_info.append(LogMsg(name=Bin.MAGICK, msg=specs))  # type: ignore[arg-type]
             if warning:
@@ -109,3 +235,24 @@ def _content_errors(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, v
         log_tables.diagnostics_add(sfinfo, FDMsg.WARNING)
         return False
     return False
+
+
+def inspection_needs_file(sfinfo: SfInfo, policies: Policies) -> bool:
+    """Return whether the inspection reads or moves the file: it is probed, renamed or removed"""
+    puid = sfinfo.processed_as
+    if not puid or sfinfo.errors == FDMsg.EMPTYSOURCE:
+        return True
+    if sfinfo.matches[0]["warning"] == FDMsg.EXTMISMATCH and len(FMT2EXT[puid]["file_extensions"]) == 1:
+        return True
+    return bool(probe_bin(sfinfo, policies))
+
+
+def probe_bin(sfinfo: SfInfo, policies: Policies) -> str:
+    """Return the bin the file is probed with: the one of its policy, else selected out of the mimetype"""
+    if sfinfo.processed_as in policies and policies[sfinfo.processed_as].bin:
+        return policies[sfinfo.processed_as].bin
+    if sfinfo.matches and sfinfo.matches[0]["mime"] != "":
+        mime = sfinfo.matches[0]["mime"].split("/")[0]
+        if mime in ["image", "audio", "video"]:
+            return Bin.MAGICK if mime == "image" else Bin.FFMPEG
+    return ""
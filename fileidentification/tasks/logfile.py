@@ -0,0 +1,156 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+import textwrap
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from types import TracebackType
+from typing import IO, Any, Self
+
+from fileidentification.definitions.models import SfInfo
+
+# records written before the log is flushed to disk while appending
+FLUSH_EVERY = 100
+
+
+def _open(path: Path, mode: str) -> IO[str]:
+    """Open the log in text mode, compressed according to its suffix (.gz or .zst)"""
+    if path.suffix == ".gz":
+        return gzip.open(path, f"{mode}t", encoding="utf-8")  # type: ignore[return-value]
+    if path.suffix == ".zst":
+        try:
+            import zstandard  # noqa: PLC0415
+        except ImportError as e:
+            msg = "zstd compressed logs need the zstandard package (optional dependency 'zstd')"
+            raise ImportError(msg) from e
+        raw = open(path, f"{mode}b")  # noqa: PTH123, SIM115
+        if mode == "r":
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+            return io.TextIOWrapper(reader, encoding="utf-8")
+        # appending adds a new zstd frame, they are read as one stream
+        writer = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")  # noqa: PTH123
+
+
+def _record(i: int, sfinfo: SfInfo) -> str:
+    return json.dumps({"i": i, "file": sfinfo.model_dump(mode="json", exclude_none=True)}) + "\n"
+
+
+class LogAppender:
+    """
+    Appends the state of files to the jsonl log as they finish processing.
+    A file can be appended several times, the last record of its position in the stack wins when the log is read.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._f: IO[str] | None = None
+        self._pending = 0
+
+    def append(self, i: int, sfinfo: SfInfo) -> None:
+        if self._f is None:
+            self._f = _open(self.path, "a")
+        self._f.write(_record(i, sfinfo))
+        self._pending += 1
+        if self._pending >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._f is not None:
+            self._f.flush()
+        self._pending = 0
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None
+    ) -> None:
+        self.close()
+
+
+def read_log(path: Path) -> Iterator[SfInfo]:
+    """
+    Stream the files out of a jsonl log in the order of the stack. the first pass finds the offset of the last
+    record of every position in the stack, then the records are read in the order of the stack by seeking to
+    them, so just one record is in memory at the time. A compressed log can't be seeked, the last records are
+    spooled into an uncompressed temporary file first.
+    """
+    if path.suffix in [".gz", ".zst"]:
+        with tempfile.TemporaryFile() as spool:
+            yield from _read_at(spool, _spool_last(path, spool))
+        return
+    offsets: dict[int, int] = {}
+    with path.open("rb") as f:
+        offset = 0
+        for line in f:
+            if line.startswith(b'{"i": '):
+                offsets[int(line[6 : line.index(b",")])] = offset
+            offset += len(line)
+        yield from _read_at(f, offsets)
+
+
+def _spool_last(path: Path, spool: IO[bytes]) -> dict[int, int]:
+    """Write the last record of every position into spool, returns their offsets in it"""
+    last: dict[int, int] = {}
+    with _open(path, "r") as f:
+        for lineno, line in enumerate(f):
+            if line.startswith('{"i": '):
+                last[int(line[6 : line.index(",")])] = lineno
+    wanted = {lineno: i for i, lineno in last.items()}
+    offsets: dict[int, int] = {}
+    with _open(path, "r") as f:
+        for lineno, line in enumerate(f):
+            if lineno in wanted:
+                offsets[wanted[lineno]] = spool.tell()
+                spool.write(line.encode())
+    return offsets
+
+
+def _read_at(f: IO[bytes], offsets: dict[int, int]) -> Iterator[SfInfo]:
+    """Read the records at the offsets in the order of the stack"""
+    for i in sorted(offsets):
+        f.seek(offsets[i])
+        yield SfInfo(**json.loads(f.readline())["file"])
+
+
+def write_log(path: Path, files: Iterable[SfInfo], errors: list[SfInfo] | None) -> None:
+    """Write the compacted jsonl log (one record per file, then the errors), replaces the log when complete"""
+    tmp = path.with_name(f".{path.name}.tmp{path.suffix}")
+    with _open(tmp, "w") as f:
+        for i, sfinfo in enumerate(files):
+            f.write(_record(i, sfinfo))
+        for sfinfo in errors or []:
+            f.write(json.dumps({"error": sfinfo.model_dump(mode="json", exclude_none=True)}) + "\n")
+    os.replace(tmp, path)  # noqa: PTH105
+
+
+def read_errors(path: Path) -> Iterator[dict[str, Any]]:
+    with _open(path, "r") as f:
+        for line in f:
+            if line.startswith('{"error": '):
+                yield json.loads(line)["error"]
+
+
+def export_json(path: Path, outpath: Path) -> None:
+    """Write the jsonl log in the layout of the json log (LogOutput), streaming record by record"""
+    with outpath.open("w") as out:
+        out.write('{\n    "files": [')
+        sep = "\n"
+        for sfinfo in read_log(path):
+            out.write(sep + textwrap.indent(sfinfo.model_dump_json(indent=4, exclude_none=True), " " * 8))
+            sep = ",\n"
+        out.write("\n    ]" if sep == ",\n" else "]")
+        sep = ',\n    "errors": [\n'
+        for error in read_errors(path):
+            out.write(sep + textwrap.indent(json.dumps(error, indent=4, ensure_ascii=False), " " * 8))
+            sep = ",\n"
+        out.write("\n    ]\n}" if sep == ",\n" else "\n}")
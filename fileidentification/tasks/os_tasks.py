@@ -1,60 +1,80 @@
+import os
 import shutil
+import threading
 from pathlib import Path
 from typing import Any
 
 from typer import colors, secho
 
-from fileidentification.definitions.constants import RMV_DIR
-from fileidentification.definitions.models import FilePaths, LogMsg, LogTables, Policies, SfInfo
+from fileidentification.definitions.catalog import Catalog
+from fileidentification.definitions.constants import RMV_DIR, FileState
+from fileidentification.definitions.models import (
+    FileIndex,
+    FilePaths,
+    IndexDiff,
+    IndexEntry,
+    LogMsg,
+    LogTables,
+    Policies,
+    SfInfo,
+    Shard,
+)
+
+# held while files are moved around in root_folder, as the inspection runs on several threads
+FS_LOCK = threading.Lock()
 
 
 def remove(sfinfo: SfInfo, log_tables: LogTables) -> None:
     """Move a file from its sfinfo path to tmp dir / _REMOVED / ..."""
     dest: Path = sfinfo.tdir / RMV_DIR / sfinfo.filename
-    if not dest.parent.exists():
-        dest.parent.mkdir(parents=True)
     try:
-        sfinfo.path.rename(dest)
+        with FS_LOCK:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            sfinfo.path.rename(dest)
         sfinfo.status.removed = True
     except OSError as e:
         secho(f"{e}", fg=colors.RED)
         log_tables.errors.append((LogMsg(name="filehandler", msg=str(e)), sfinfo))
 
 
-def move_tmp(stack: list[SfInfo], policies: Policies, log_tables: LogTables, remove_original: bool) -> bool:
+def move_tmp(stack: Catalog, policies: Policies, log_tables: LogTables, remove_original: bool) -> bool:
     write_logs: bool = False
 
-    for sfinfo in stack:
-        # if it has a dest, it needs to be moved
-        if sfinfo.dest:
-            write_logs = True
-            # remove the original if its mentioned and flag it accordingly
-            if policies[sfinfo.derived_from.processed_as].remove_original or remove_original:  # type: ignore[index, union-attr]
-                derived_from = next(sfi for sfi in stack if sfi.filename == sfinfo.derived_from.filename)  # type: ignore[union-attr]
-                if derived_from.path.is_file():
-                    remove(derived_from, log_tables)
-            # create absolute filepath
-            abs_dest = sfinfo.root_folder / sfinfo.dest / sfinfo.filename.name
-            # append hash to filename if the path already exists
-            if abs_dest.is_file():
-                abs_dest = Path(abs_dest.parent, f"{sfinfo.filename.stem}_{sfinfo.md5[:6]}{sfinfo.filename.suffix}")
-            # move the file
-            try:
-                sfinfo.filename.rename(abs_dest)
-                if sfinfo.filename.parent.is_dir():
-                    shutil.rmtree(sfinfo.filename.parent)
-                # set relative path in sfinfo.filename, set flags
-                sfinfo.filename = sfinfo.dest / abs_dest.name
-                sfinfo.status.added = True
-                sfinfo.dest = None
-            except OSError as e:
-                secho(f"{e}", fg=colors.RED)
-                log_tables.errors.append((LogMsg(name="filehandler", msg=str(e)), sfinfo))
+    # the converted files have a dest, they need to be moved
+    for sfinfo in stack.select(FileState.CONVERTED):
+        write_logs = True
+        dest: Path = sfinfo.dest  # type: ignore[assignment]
+        # remove the original if its mentioned and flag it accordingly
+        if policies[sfinfo.derived_from.processed_as].remove_original or remove_original:  # type: ignore[index, union-attr]
+            derived_from = stack.parent(sfinfo)
+            if derived_from and derived_from.path.is_file():
+                remove(derived_from, log_tables)
+                stack.update(derived_from)
+        # create absolute filepath
+        abs_dest = sfinfo.root_folder / dest / sfinfo.filename.name
+        # append hash to filename if the path already exists
+        if abs_dest.is_file():
+            abs_dest = Path(
+                abs_dest.parent, f"{sfinfo.filename.stem}_{sfinfo.ensure_md5()[:6]}{sfinfo.filename.suffix}"
+            )
+        # move the file
+        try:
+            sfinfo.filename.rename(abs_dest)
+            if sfinfo.filename.parent.is_dir():
+                shutil.rmtree(sfinfo.filename.parent)
+            # set relative path in sfinfo.filename, set flags
+            sfinfo.filename = dest / abs_dest.name
+            sfinfo.status.added = True
+            sfinfo.dest = None
+            stack.update(sfinfo)
+        except OSError as e:
+            secho(f"{e}", fg=colors.RED)
+            log_tables.errors.append((LogMsg(name="filehandler", msg=str(e)), sfinfo))
 
     return write_logs
 
 
-def set_filepaths(fp: FilePaths, config: dict[str, Any], root_folder: Path) -> None:
+def set_filepaths(fp: FilePaths, config: dict[str, Any], root_folder: Path, shard: Shard | None = None) -> None:
     if root_folder.is_file():
         root_folder = Path(f"{root_folder.parent}_{root_folder.stem}")
     fp.TMP_DIR = Path(config["paths"]["TMP_DIR"])
@@ -66,3 +86,88 @@ def set_filepaths(fp: FilePaths, config: dict[str, Any], root_folder: Path) -> N
     fp.POLICIES_J = Path(config["paths"]["POLICIES_J"])
     if not fp.POLICIES_J.is_absolute():
         fp.POLICIES_J = Path(f"{root_folder}{fp.POLICIES_J}")
+    fp.LOG_JL = Path(config["paths"]["LOG_JL"])
+    if not fp.LOG_JL.is_absolute():
+        fp.LOG_JL = Path(f"{root_folder}{fp.LOG_JL}")
+    fp.INDEX_J = Path(config["paths"]["INDEX_J"])
+    if not fp.INDEX_J.is_absolute():
+        fp.INDEX_J = Path(f"{root_folder}{fp.INDEX_J}")
+    fp.STORE_DB = Path(config["paths"]["STORE_DB"])
+    if not fp.STORE_DB.is_absolute():
+        fp.STORE_DB = Path(f"{root_folder}{fp.STORE_DB}")
+    fp.METRICS_J = Path(config["paths"]["METRICS_J"])
+    if not fp.METRICS_J.is_absolute():
+        fp.METRICS_J = Path(f"{root_folder}{fp.METRICS_J}")
+    fp.METRICS_PROM = Path(config["paths"]["METRICS_PROM"])
+    if not fp.METRICS_PROM.is_absolute():
+        fp.METRICS_PROM = Path(f"{root_folder}{fp.METRICS_PROM}")
+    _shard_filepaths(fp, shard)
+
+
+def _shard_filepaths(fp: FilePaths, shard: Shard | None) -> None:
+    """Give the shard its own working dir, logs, index and policies, e.g. path/to/directory_log.shard-2-of-4.json"""
+    if shard is None:
+        return
+    for key in FilePaths.model_fields:
+        path: Path = getattr(fp, key)
+        stem, dot, suffixes = path.name.partition(".")
+        setattr(fp, key, path.with_name(f"{stem}.{shard.tag}{dot}{suffixes}"))
+
+
+def _index_entry(st: os.stat_result) -> IndexEntry:
+    return IndexEntry(size=st.st_size, mtime_ns=st.st_mtime_ns, inode=st.st_ino)
+
+
+def scan_folder(root_folder: Path, shard: Shard | None = None) -> dict[str, IndexEntry]:
+    """
+    Collect the stat data of all files in root_folder (or only of the ones in shard), keyed on the path relative to
+    root_folder
+    """
+    entries: dict[str, IndexEntry] = {}
+    dirs = [root_folder]
+    while dirs:
+        with os.scandir(dirs.pop()) as it:
+            for entry in it:
+                path = Path(entry.path).relative_to(root_folder)
+                if entry.is_dir(follow_symlinks=False):
+                    if shard is None or shard.walks(path):
+                        dirs.append(Path(entry.path))
+                elif entry.is_file() and (shard is None or shard.owns(path)):
+                    entries[f"{path}"] = _index_entry(entry.stat())
+    return entries
+
+
+def build_index(stack: Catalog) -> FileIndex:
+    """Index the files of the stack that are in root_folder (i.e. not removed and not waiting in the tmp dir)"""
+    index = FileIndex()
+    for batch in stack.batches(FileState.ACTIVE):
+        for _, sfinfo in batch:
+            try:
+                index.files[f"{sfinfo.filename}"] = _index_entry((sfinfo.root_folder / sfinfo.filename).stat())
+            except OSError:
+                continue
+    return index
+
+
+def diff_index(index: FileIndex, current: dict[str, IndexEntry]) -> IndexDiff:
+    """
+    Compare the index of the last run with the current stat data of root_folder.
+    A file that disappeared and reappears with the same inode, size and mtime at another path is moved, not new.
+    """
+    diff = IndexDiff()
+    deleted = {entry.inode: path for path, entry in index.files.items() if path not in current}
+    for path, entry in current.items():
+        if path in index.files:
+            if index.files[path] != entry:
+                diff.changed.append(path)
+            continue
+        old_path = deleted.get(entry.inode)
+        if old_path and index.files[old_path] == entry:
+            diff.moved[old_path] = path
+            del deleted[entry.inode]
+        else:
+            diff.new.append(path)
+    diff.deleted = sorted(deleted.values())
+    diff.new.sort()
+    diff.changed.sort()
+    return diff
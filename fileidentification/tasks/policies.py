@@ -4,6 +4,7 @@ from fileidentification.definitions.constants import PCMsg
 from fileidentification.definitions.models import LogMsg, LogTables, Policies, SfInfo
 from fileidentification.tasks.os_tasks import remove
 from fileidentification.wrappers.ffmpeg import ffmpeg_media_info
+from fileidentification.wrappers.process import ToolNotFoundError
 
 
 def apply_policy(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, strict: bool) -> None:
@@ -34,18 +35,32 @@ def apply_policy(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, stri
         return
 
 
+def policy_needs_file(sfinfo: SfInfo, policies: Policies, strict: bool) -> bool:
+    """Return whether applying the policy reads or moves the file: it is removed or its streams are probed"""
+    puid = sfinfo.processed_as
+    if not puid or sfinfo.status.pending:
+        return False
+    if puid not in policies:
+        return strict
+    return policies[puid].accepted and puid in ["fmt/199", "fmt/569"]
+
+
 def _has_invalid_streams(sfinfo: SfInfo, puid: str) -> bool:
     """Return true if video and audio codec differ from archival standards"""
-    streams = ffmpeg_media_info(sfinfo.path)
+    try:
+        streams = ffmpeg_media_info(sfinfo.path, sfinfo.md5)
+    except ToolNotFoundError as e:
+        secho(f"\t{e.reason}, the streams of {sfinfo.filename} are not checked", fg=colors.RED, bold=True)
+        return False
     if not streams:
         secho(f"\t{sfinfo.filename} throwing errors. consider inspection", fg=colors.RED, bold=True)
         return False
     if puid in ["fmt/569"]:
         # only the video codec has to be ffv1 -> return false as soon as any stream is ffv1
-        return all(stream["codec_name"] not in ["ffv1"] for stream in streams)  # type: ignore[index]
+        return all(stream["codec_name"] not in ["ffv1"] for stream in streams)
     if puid in ["fmt/199"]:
         # video codec has to be h264, audio codec aac -> return true if any stream does not match
         for stream in streams:
-            if stream["codec_name"] not in ["h264", "aac"]:  # type: ignore[index]
+            if stream["codec_name"] not in ["h264", "aac"]:
                 return True
     return False
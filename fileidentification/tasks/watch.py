@@ -0,0 +1,218 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+from typer import colors, secho
+
+from fileidentification.definitions.constants import WatchBackend
+
+# inotify events: a file was modified, written and closed, moved in or created (files and dirs)
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x2, 0x8, 0x80, 0x100
+IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x4000, 0x8000, 0x40000000
+MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+# wd, mask, cookie and length of the name that follows
+EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """The files that change in root_folder as reported by inotify, the dirs created in it are watched as well"""
+
+    backend = WatchBackend.INOTIFY
+
+    def __init__(self, root_folder: Path) -> None:
+        self.root_folder = root_folder
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd: int = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_init1: {os.strerror(ctypes.get_errno())}")
+        # watch descriptor: dir
+        self._dirs: dict[int, Path] = {}
+        try:
+            self._add(root_folder)
+        except OSError:
+            self.close()
+            raise
+
+    def changes(self, timeout: float) -> list[Path]:
+        """Wait up to timeout seconds for events, return the files they are about"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self._fd, 64 * 1024)
+        files: list[Path] = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT.size : offset + EVENT.size + length].rstrip(b"\0"))
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, the whole tree is listed once, the files that are known already are skipped
+                files.extend(self._watch(self.root_folder))
+            elif mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+            elif wd in self._dirs and mask & IN_ISDIR:
+                # the files can arrive in a new dir before it is watched, they are listed with it
+                files.extend(self._watch(self._dirs[wd] / name))
+            elif wd in self._dirs:
+                files.append(self._dirs[wd] / name)
+        return files
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _watch(self, folder: Path) -> list[Path]:
+        try:
+            return self._add(folder)
+        except OSError as e:
+            secho(f"could not watch {folder}: {e}", fg=colors.RED)
+            return []
+
+    def _add(self, folder: Path) -> list[Path]:
+        """Watch folder and the dirs in it, return the files in them"""
+        files: list[Path] = []
+        dirs = [folder]
+        while dirs:
+            current = dirs.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(current), MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                # the dir is already gone again
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(err, f"inotify_add_watch {current}: {os.strerror(err)}")
+            self._dirs[wd] = current
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(Path(entry.path))
+                        elif entry.is_file():
+                            files.append(Path(entry.path))
+            except OSError:
+                continue
+        return files
+
+
+class Poller:
+    """
+    The files that arrive in root_folder, found by polling the mtime of its dirs: only the dirs that changed are
+    listed again, the files are not stat'ed
+    """
+
+    backend = WatchBackend.POLLING
+
+    def __init__(self, root_folder: Path) -> None:
+        self.root_folder = root_folder
+        # dir: its mtime and the names of the files in it
+        self._dirs: dict[Path, tuple[int, set[str]]] = {}
+        self._list(root_folder)
+
+    def changes(self, timeout: float) -> list[Path]:
+        """Wait timeout seconds, return the files that were added since the last call"""
+        time.sleep(timeout)
+        files: list[Path] = []
+        for folder, (mtime, _) in list(self._dirs.items()):
+            try:
+                changed = folder.stat().st_mtime_ns != mtime
+            except OSError:
+                self._dirs.pop(folder, None)
+                continue
+            if changed:
+                files.extend(self._list(folder))
+        return files
+
+    def close(self) -> None:
+        """Nothing to release"""
+
+    def _list(self, folder: Path) -> list[Path]:
+        """List folder and the dirs in it that are not known yet, return the files that were not in them before"""
+        files: list[Path] = []
+        dirs = [folder]
+        while dirs:
+            current = dirs.pop()
+            try:
+                mtime = current.stat().st_mtime_ns
+                with os.scandir(current) as it:
+                    entries = list(it)
+            except OSError:
+                self._dirs.pop(current, None)
+                continue
+            known = self._dirs.get(current, (0, set()))[1]
+            names: set[str] = set()
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if Path(entry.path) not in self._dirs:
+                        dirs.append(Path(entry.path))
+                elif entry.is_file():
+                    names.add(entry.name)
+                    if entry.name not in known:
+                        files.append(Path(entry.path))
+            self._dirs[current] = (mtime, names)
+        return files
+
+
+class Watcher:
+    """
+    The files that arrive in root_folder, handed out in batches once they are complete: their size and mtime did not
+    change for settle seconds. it uses inotify on linux and falls back on polling the dirs every poll seconds.
+    the files in ignore (or whose path starts with one of them, e.g. the journal of the sqlite store) are skipped
+    """
+
+    def __init__(
+        self, root_folder: Path, backend: str, settle: float, poll: float, ignore: list[Path] | None = None
+    ) -> None:
+        self.settle, self.poll = settle, poll
+        self.ignore = [f"{path}" for path in ignore or []]
+        self.source: Inotify | Poller = _source(root_folder, backend)
+        self.backend = self.source.backend
+        # file: its size and mtime at the last change and when the change was seen
+        self._pending: dict[Path, tuple[tuple[int, int], float]] = {}
+
+    def __iter__(self) -> Iterator[list[Path]]:
+        """Yield the files that are complete every poll seconds, an empty list if there are none"""
+        while True:
+            deadline = time.monotonic() + self.poll
+            while (left := deadline - time.monotonic()) > 0:
+                for file in self.source.changes(left):
+                    if not any(f"{file}".startswith(path) for path in self.ignore):
+                        # an event resets the time the file has to stay unchanged
+                        self._pending[file] = ((-1, -1), time.monotonic())
+            yield self._settled()
+
+    def close(self) -> None:
+        self.source.close()
+
+    def _settled(self) -> list[Path]:
+        now = time.monotonic()
+        settled: list[Path] = []
+        for file, (last, seen) in list(self._pending.items()):
+            try:
+                st = file.stat()
+            except OSError:
+                # moved away or deleted before it was complete, e.g. the temporary file of a copy
+                del self._pending[file]
+                continue
+            if (st.st_size, st.st_mtime_ns) != last:
+                self._pending[file] = ((st.st_size, st.st_mtime_ns), now)
+            elif now - seen >= self.settle:
+                del self._pending[file]
+                settled.append(file)
+        return sorted(settled)
+
+
+def _source(root_folder: Path, backend: str) -> Inotify | Poller:
+    if backend == WatchBackend.INOTIFY and sys.platform == "linux":
+        try:
+            return Inotify(root_folder)
+        except OSError as e:
+            secho(f"inotify not available ({e}), falling back on polling", fg=colors.YELLOW)
+    return Poller(root_folder)
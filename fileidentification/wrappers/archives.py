@@ -0,0 +1,145 @@
+import hashlib
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from pathlib import Path, PurePosixPath
+from typing import IO, Any, cast
+
+import pygfried
+
+from fileidentification.definitions.constants import ARCHIVE_PUIDS, HashAlg
+from fileidentification.definitions.models import SfInfo
+from fileidentification.wrappers.hashing import BUFSIZE
+
+# a member of an archive to extract: its names in the nested archives, where it is written to
+Wanted = tuple[list[str], Path]
+
+
+def is_archive(path: Path, puid: str | None = None) -> bool:
+    """Return whether path is a zip or tar archive (possibly compressed), other zip containers as docx are not"""
+    if puid is None:
+        puid = pygfried.identify(f"{path}", detailed=True)["files"][0]["matches"][0]["id"]
+    return puid in ARCHIVE_PUIDS and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+
+def archive_root(archive: Path) -> Path:
+    """
+    Return the folder the members of archive are extracted to, next to it and named after it. it has a suffix, so it
+    is not a folder that is already there, e.g. the one the archive was created of
+    """
+    return archive.with_name(f"{archive.stem.removesuffix('.tar')}_extracted")
+
+
+def identify_archive(archive: Path, root_folder: Path, depth: int, fixity: list[str] | None = None) -> Iterator[SfInfo]:
+    """
+    Identify the members of a zip or tar archive without extracting it: every member is streamed into a temporary
+    file, hashed on the way and identified with pygfried, then the file is deleted again. the members of nested
+    archives are identified the same way up to depth, they are placed in a folder named after the nested archive.
+    The sfinfos have their path in root_folder, where the member is extracted to if it is needed on disk (extract)
+    :param depth how many levels of nested archives are opened, 0 only identifies the members of archive
+    :param fixity additional digests (HashAlg) to calculate in the same read as the md5
+    """
+    yield from _identify(archive, root_folder, depth, [HashAlg.MD5, *(fixity or [])], [], Path())
+
+
+def _identify(
+    archive: Path, root_folder: Path, depth: int, algorithms: list[str], chain: list[str], folder: Path
+) -> Iterator[SfInfo]:
+    for name, stream, size, modified in _members(archive):
+        filename = folder / _safe(name)
+        with tempfile.NamedTemporaryFile(suffix=PurePosixPath(name).suffix) as spool:
+            digests = _spool(stream, spool, algorithms)
+            metadata = cast("dict[str, Any]", pygfried.identify(spool.name, detailed=True)["files"][0])
+            metadata.update(filename=root_folder / filename, filesize=size, modified=modified)
+            md5 = digests.pop(HashAlg.MD5)
+            sfinfo = SfInfo(**metadata, md5=md5, checksums=digests or None, member=[*chain, name])
+            yield sfinfo
+            if depth > 0 and is_archive(Path(spool.name), sfinfo.processed_as):
+                nested = filename.parent / filename.name.replace(".", "_")
+                yield from _identify(Path(spool.name), root_folder, depth - 1, algorithms, [*chain, name], nested)
+
+
+def _members(archive: Path) -> Iterator[tuple[str, IO[bytes], int, str]]:
+    """Yield name, stream, size and modification time of the files in archive, in the order they are stored"""
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            for zinfo in zf.infolist():
+                if not zinfo.is_dir():
+                    # zip stores the local time without a timezone
+                    modified = datetime(*zinfo.date_time).isoformat()  # noqa: DTZ001
+                    with zf.open(zinfo) as stream:
+                        yield zinfo.filename, stream, zinfo.file_size, modified
+        return
+    # read as a stream, a compressed tar is not decompressed again for every member
+    with tarfile.open(archive, "r|*") as tf:
+        for tinfo in tf:
+            if tinfo.isfile() and (member := tf.extractfile(tinfo)):
+                yield tinfo.name, member, tinfo.size, datetime.fromtimestamp(tinfo.mtime, UTC).isoformat()
+
+
+def _spool(stream: IO[bytes], spool: IO[bytes], algorithms: list[str]) -> dict[str, str]:
+    """Copy stream into spool, returns the digests of the content calculated on the way"""
+    digests = {alg: hashlib.new(alg) for alg in dict.fromkeys(algorithms)}
+    while chunk := stream.read(BUFSIZE):
+        spool.write(chunk)
+        for digest in digests.values():
+            digest.update(chunk)
+    spool.flush()
+    return {alg: digest.hexdigest() for alg, digest in digests.items()}
+
+
+def _safe(name: str) -> Path:
+    """Return the member name as a relative path that stays in the folder it is extracted to"""
+    parts = [part for part in PurePosixPath(name).parts if part not in ("/", "..", ".")]
+    return Path(*parts) if parts else Path("_")
+
+
+def extract(archive: Path, sfinfos: Iterable[SfInfo]) -> None:
+    """Write the members among sfinfos that are not on disk yet to their path, the archive is opened once"""
+    _extract(
+        archive, [(sfinfo.member, sfinfo.path) for sfinfo in sfinfos if sfinfo.member and not sfinfo.path.is_file()]
+    )
+
+
+def _extract(archive: Path, wanted: list[Wanted]) -> None:
+    # the wanted members by their name in archive, with the rest of their chain of names in the nested archives
+    groups: dict[str, list[Wanted]] = {}
+    for chain, dest in wanted:
+        groups.setdefault(chain[0], []).append((chain[1:], dest))
+    if not groups:
+        return
+    with _open(archive) as open_member:
+        for name, members in groups.items():
+            for chain, dest in members:
+                if not chain:
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    with open_member(name) as stream, dest.open("wb") as f:
+                        shutil.copyfileobj(stream, f, BUFSIZE)
+            nested = [(chain, dest) for chain, dest in members if chain]
+            if nested:
+                with open_member(name) as stream, tempfile.NamedTemporaryFile() as spool:
+                    shutil.copyfileobj(stream, spool, BUFSIZE)
+                    spool.flush()
+                    _extract(Path(spool.name), nested)
+
+
+@contextmanager
+def _open(archive: Path) -> Iterator[Callable[[str], IO[bytes]]]:
+    """Open archive, yields a function that opens a member by its name"""
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            yield zf.open
+        return
+    with tarfile.open(archive, "r:*") as tf:
+
+        def open_member(name: str) -> IO[bytes]:
+            stream = tf.extractfile(name)
+            if stream is None:
+                raise KeyError(name)
+            return stream
+
+        yield open_member
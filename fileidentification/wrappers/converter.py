@@ -1,56 +1,78 @@
-import platform
 import shlex
-import subprocess
 from pathlib import Path
 
-from fileidentification.definitions.constants import PDFSETTINGS, Bin, LOPath
+from fileidentification.definitions.constants import PDFSETTINGS, Bin
 from fileidentification.definitions.models import PolicyParams, SfInfo
+from fileidentification.wrappers.process import run
+from fileidentification.wrappers.soffice import SOFFICE, SofficePool
 
-SOFFICE = LOPath.Linux if platform.system() == LOPath.Linux.name else LOPath.Darwin
 
+def workdir(sfinfo: SfInfo) -> Path:
+    """Return the folder in the tmp dir where the file is converted to"""
+    return Path(sfinfo.tdir / f"{sfinfo.filename.name}_{sfinfo.ensure_md5()[:6]}")
 
-def convert(sfinfo: SfInfo, args: PolicyParams) -> tuple[Path, str, Path]:
+
+def target_path(sfinfo: SfInfo, args: PolicyParams) -> Path:
+    """Return the path of the converted file in the workdir"""
+    return Path(workdir(sfinfo) / f"{sfinfo.filename.stem}.{args.target_container}")
+
+
+def convert(
+    sfinfo: SfInfo,
+    args: PolicyParams,
+    threads: int = 0,
+    profile: Path | None = None,
+    soffice: SofficePool | None = None,
+) -> tuple[Path, str, str]:
     """
     Convert a file to the desired format passed by the args
 
     :params sfinfo the metadata object of the file
     :params args the arguments how to convert ('bin', 'processing_args', 'target_container')
+    :params threads max number of threads ffmpeg uses, if not set in the processing_args. 0 lets ffmpeg decide
+    :params profile LibreOffice user profile dir, so that several LibreOffice instances can run at once
+    :params soffice running LibreOffice instances to convert with instead of starting LibreOffice for the file
 
-    :returns the constructed target path, the cmd run and the log path
+    :returns the constructed target path, the cmd run and its log
     """
 
-    wdir = Path(sfinfo.tdir / f"{sfinfo.filename.name}_{sfinfo.md5[:6]}")
-    if not wdir.exists():
-        wdir.mkdir(parents=True)
+    wdir = workdir(sfinfo)
+    wdir.mkdir(parents=True, exist_ok=True)
 
-    target = Path(wdir / f"{sfinfo.filename.stem}.{args.target_container}")
-    logfile_path = Path(wdir / f"{sfinfo.filename.stem}.log")
+    target = target_path(sfinfo, args)
 
-    # set input, outputfile and log for shell
-    inputfile = shlex.quote(str(sfinfo.path))
-    outfile = shlex.quote(str(target))
-    logfile = shlex.quote(str(logfile_path))
+    # the processing_args are split like the shell did
+    processing_args = shlex.split(args.processing_args)
+    inputfile, outfile = f"{sfinfo.path}", f"{target}"
 
-    cmd: str = ""
+    cmd: list[str] = []
     match args.bin:
         # construct command if its ffmpeg
         case Bin.FFMPEG:
-            cmd = f"ffmpeg -y -i {inputfile} {args.processing_args} {outfile} 2> {logfile}"
+            if threads and "-threads" not in processing_args:
+                processing_args += ["-threads", f"{threads}"]
+            cmd = ["ffmpeg", "-y", "-i", inputfile, *processing_args, outfile]
         # construct command if its imagemagick
         case Bin.MAGICK:
-            cmd = f"magick {args.processing_args} {inputfile} {outfile} 2> {logfile}"
+            cmd = ["magick", *processing_args, inputfile, outfile]
         # construct command if its inkscape
         # case Bin.INCSCAPE:
-        # cmd = f'inkscape --export-filename={outfile} {args["processing_args"]} {inputfile} 2> {logfile}'
+        # cmd = ["inkscape", f"--export-filename={outfile}", *processing_args, inputfile]
         # construct command if its LibreOffice
         case Bin.SOFFICE:
-            cmd = f"{SOFFICE} {args.processing_args} {args.target_container} {inputfile} "
+            if soffice and soffice.supports(args):
+                return target, *soffice.convert(sfinfo.path, target, args.target_container)
+            lo = [f"{SOFFICE}"]
+            if profile:
+                lo.append(f"-env:UserInstallation={profile.as_uri()}")
             # add the version if its pdf
-            if args.target_container == "pdf":
-                cmd = f"{SOFFICE} {args.processing_args} 'pdf{PDFSETTINGS}' {inputfile} "
-            cmd = cmd + f"--outdir {shlex.quote(str(wdir))} >> {logfile} 2>&1"
+            container = f"pdf{PDFSETTINGS}" if args.target_container == "pdf" else args.target_container
+            cmd = [*lo, *processing_args, container, inputfile, "--outdir", f"{wdir}"]
 
-    # run cmd in shell (and as a string, so [error]output is redirected to logfile)
-    subprocess.run(cmd, check=False, shell=True)
+    if not cmd:
+        return target, "", ""
+    # the log of ffmpeg and imagemagick is on stderr, LibreOffice writes it on both
+    res = run(cmd, merge_stderr=args.bin == Bin.SOFFICE, pbin=args.bin)
+    log = res.stdout if args.bin == Bin.SOFFICE else res.stderr
 
-    return target, cmd, logfile_path
+    return target, res.cmd, log
@@ -1,36 +1,179 @@
 import json
-import shlex
-import subprocess
+import os
+import random
+import threading
 from pathlib import Path
 from typing import Any
 
-from fileidentification.definitions.constants import ErrMsgFF
-from fileidentification.definitions.models import SfInfo
+from pydantic import BaseModel
+from typer import colors, secho
 
+from fileidentification.definitions.constants import Bin, DecodeMode, ErrMsgFF, ProbeBackend
+from fileidentification.definitions.models import LogMsg, SfInfo
+from fileidentification.wrappers import libav
+from fileidentification.wrappers.process import run, run_all
 
-def ffmpeg_inspect(sfinfo: SfInfo, verbose: bool) -> tuple[bool, str, dict[str, Any] | None]:
+STREAM_ENTRIES = (
+    "stream=index,codec_name,codec_long_name,profile,"
+    "codec_tag,pix_fmt,color_space,coded_width,coded_height,r_frame_rate,bit_rate,channels,channel_layout,"
+    "sample_aspect_ratio,display_aspect_ratio:format=duration"
+)
+# shortest segment worth its own ffmpeg process, in seconds
+MIN_SEGMENT = 30.0
+
+# a part of the file to decode: start and length in seconds, None is the whole file
+Window = tuple[float, float] | None
+
+
+class Probe(BaseModel):
+    """result of ffprobe: the streams if the file could be opened, else the error"""
+
+    streams: list[dict[str, Any]] | None = None
+    error: str = ""
+    # in seconds, if ffprobe knows it
+    duration: float | None = None
+
+
+class DecodeParams(BaseModel):
+    """
+    how the files are decoded in verbose mode (see DecodeMode).
+    samples: number of windows at random points (seeded per file, see _seed) in addition to the start and the end
+    window: length of a sampled window in seconds
+    segments: number of segments decoded in parallel, 0 = number of cpus
+    budget: seconds a file may be decoded, 0 = no limit
+    concurrency: ffmpeg processes decoding the windows of a file at once, 0 = all of them
     """
-    Check for errors with ffprobe -show_error -> std.out shows the error, std.err has file information
+
+    mode: DecodeMode = DecodeMode.FULL
+    samples: int = 4
+    window: float = 5.0
+    segments: int = 0
+    budget: float = 0.0
+    concurrency: int = 0
+
+
+class ProbeStore:
+    """
+    ffprobe results of the run keyed on path and md5, so that every file is only probed once.
+    a result is kept until the file is evicted, i.e. when no later stage reads it anymore.
+    the files are probed with ffprobe, or in process with libav if it is configured and the bindings are installed
+    """
+
+    def __init__(self) -> None:
+        self._probes: dict[tuple[str, str], Probe] = {}
+        self._lock = threading.Lock()
+        self.backend: str = ProbeBackend.FFPROBE
+
+    def configure(self, backend: str) -> None:
+        if backend == ProbeBackend.LIBAV and not libav.available():
+            secho("the libav bindings (PyAV) are not installed, falling back on ffprobe", fg=colors.YELLOW)
+            backend = ProbeBackend.FFPROBE
+        self.backend = backend
+
+    def get(self, file: Path, md5: str, keep: bool = True) -> Probe:
+        """Return the probe of the file, keep=False doesn't store it for the later stages"""
+        key = (f"{file}", md5)
+        with self._lock:
+            if key in self._probes:
+                return self._probes[key]
+        probe = _probe_output(libav.probe(file)) if self.backend == ProbeBackend.LIBAV else _ffprobe(file)
+        if keep:
+            with self._lock:
+                self._probes[key] = probe
+        return probe
+
+    def evict(self, *sfinfos: SfInfo) -> None:
+        """Drop the probes of the files"""
+        with self._lock:
+            for sfinfo in sfinfos:
+                self._probes.pop((f"{sfinfo.path}", sfinfo.md5), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._probes.clear()
+
+
+PROBES = ProbeStore()
+
+
+def ffmpeg_inspect(
+    sfinfo: SfInfo, verbose: bool, decode: DecodeParams | None = None
+) -> tuple[bool, str, list[dict[str, Any]] | None]:
+    """
+    Check for errors with ffprobe -show_error, the same call returns the streams of the file.
     in verbose mode: run the file in ffmpeg dropping frames instead of showing it, returns stderr as string.
-    depending on how many and how long the files are, this slows down the analytics
+    depending on how many and how long the files are, this slows down the analytics, decode sets whether
+    the whole file or only parts of it are decoded, how it was decoded is added to the processing logs.
     When the file can't be opened by ffmpeg at all, it returns [True, "stderr"]. for minor errors [False, "stderr"].
     if everithing ok [False, ""]
     """
 
-    cmd = f"ffprobe -hide_banner -show_error {shlex.quote(str(sfinfo.path))}"
-
-    res = subprocess.run(cmd, check=False, shell=True, capture_output=True, text=True)
+    probe = PROBES.get(sfinfo.path, sfinfo.md5)
+    std_out = probe.error
     if verbose:
-        cmd_v = f"ffmpeg -v error -i {shlex.quote(str(sfinfo.path))} -f null -"
-        res_v = subprocess.run(cmd_v, check=False, shell=True, capture_output=True, text=True)
-        # replace the stdout of errors with the verbose one
-        res.stdout = res_v.stderr
-    return _parse_output(sfinfo, res.stdout, res.stderr, verbose)
+        # replace the errors of ffprobe with the verbose one
+        std_out, decoded = _decode(sfinfo, probe.duration, decode or DecodeParams())
+        sfinfo.processing_logs.append(LogMsg(name=Bin.FFMPEG, msg=decoded))
+    return _parse_output(sfinfo, std_out, probe.streams, verbose)
+
+
+def _decode(sfinfo: SfInfo, duration: float | None, params: DecodeParams) -> tuple[str, str]:
+    """Decode the file or the windows of it with ffmpeg, returns the errors and how the file was decoded"""
+    windows: list[Window] = [None]
+    decoded = "decoded completely"
+    if duration and params.mode == DecodeMode.SAMPLED:
+        windows = _sampled(duration, params.window, params.samples, _seed(sfinfo))
+        starts = ", ".join(f"{w[0]:.1f}" for w in windows if w)
+        decoded = f"decoded {len(windows)} windows of {params.window}s starting at {starts}s"
+    if duration and params.mode == DecodeMode.SEGMENTS:
+        windows = _segments(duration, params.segments or os.cpu_count() or 1)
+        decoded = f"decoded in {len(windows)} segments in parallel"
+    if windows == [None]:
+        decoded = "decoded completely"
+    # the windows are decoded concurrency at a time, the budget is split among the rounds this takes
+    cmds = [_decode_cmd(sfinfo.path, window) for window in windows]
+    rounds = -(-len(cmds) // params.concurrency) if params.concurrency else 1
+    results = run_all(cmds, params.concurrency, timeout=params.budget / rounds or None, pbin=Bin.FFMPEG)
+    if any(res.timed_out for res in results):
+        decoded += f", stopped after the budget of {params.budget}s"
+    # the segments overlap up to the keyframe before their start, the errors there are reported twice
+    lines = dict.fromkeys(line for res in results for line in res.stderr.splitlines(keepends=True))
+    return "".join(lines), decoded
+
+
+def _seed(sfinfo: SfInfo) -> str:
+    """Return the seed of the sampled windows: the md5, or the filename and size if the md5 is deferred"""
+    return sfinfo.md5 or f"{sfinfo.filename}:{sfinfo.filesize}"
+
 
+def _sampled(duration: float, window: float, samples: int, seed: str) -> list[Window]:
+    """Return the windows at the start, the end and at random points (the same ones for the same seed)"""
+    if duration <= (samples + 2) * window:
+        return [None]
+    rng = random.Random(seed)  # noqa: S311
+    starts = {0.0, duration - window, *(rng.uniform(window, duration - 2 * window) for _ in range(samples))}
+    return [(start, window) for start in sorted(starts)]
 
-def _parse_output(sfinfo: SfInfo, std_out: str, _: str, verbose: bool) -> tuple[bool, str, dict[str, Any] | None]:
+
+def _segments(duration: float, segments: int) -> list[Window]:
+    """Split the file in segments, ffmpeg starts decoding them at the keyframe before their start"""
+    segments = max(1, min(segments, int(duration // MIN_SEGMENT)))
+    if segments == 1:
+        return [None]
+    length = duration / segments
+    return [(i * length, length) for i in range(segments)]
+
+
+def _decode_cmd(file: Path, window: Window) -> list[str]:
+    """Return the cmd that decodes the window of the file dropping the frames"""
+    seek = ["-ss", f"{window[0]:.3f}", "-t", f"{window[1]:.3f}"] if window else []
+    return ["ffmpeg", "-v", "error", *seek, "-i", f"{file}", "-f", "null", "-"]
+
+
+def _parse_output(
+    sfinfo: SfInfo, std_out: str, streams: list[dict[str, Any]] | None, verbose: bool
+) -> tuple[bool, str, list[dict[str, Any]] | None]:
     std_out = std_out.replace(f"{sfinfo.path.parent}", "")
-    streams = ffmpeg_media_info(sfinfo.path)
     if verbose:
         if std_out:
             if any(msg in std_out for msg in ErrMsgFF):
@@ -43,20 +186,36 @@ def _parse_output(sfinfo: SfInfo, std_out: str, _: str, verbose: bool) -> tuple[
     return False, std_out, streams
 
 
-def ffmpeg_media_info(file: Path) -> dict[str, Any] | None:
+def ffmpeg_media_info(file: Path, md5: str, keep: bool = True) -> list[dict[str, Any]] | None:
+    """Return the streams of the file, served from the probes of the run if the file was already probed"""
+    return PROBES.get(file, md5, keep).streams
+
+
+def _ffprobe(file: Path) -> Probe:
     cmd: list[str] = [
         "ffprobe",
         str(file),
         "-hide_banner",
+        "-show_error",
         "-show_entries",
-        "stream=index,codec_name,codec_long_name,profile,"
-        "codec_tag,pix_fmt,color_space,coded_width,coded_height,r_frame_rate,bit_rate,channels,channel_layout,"
-        "sample_aspect_ratio,display_aspect_ratio",
+        STREAM_ENTRIES,
         "-output_format",
         "json",
     ]
-    res = subprocess.run(cmd, check=False, capture_output=True)  # noqa: S603
-    if res.returncode == 0:
-        streams: dict[str, Any] = json.loads(res.stdout)["streams"]
-        return streams
-    return None
+    res = run(cmd, pbin=Bin.FFMPEG)
+    try:
+        output: dict[str, Any] = json.loads(res.stdout)
+    except json.JSONDecodeError:
+        return Probe(error=res.stderr or f"ffprobe failed on {file.name}")
+    if res.returncode != 0:
+        output.setdefault("error", {})
+    return _probe_output(output, res.stderr)
+
+
+def _probe_output(output: dict[str, Any], stderr: str = "") -> Probe:
+    """Return the Probe of the json output of ffprobe (or the same of libav.probe)"""
+    if "error" in output:
+        error = output["error"]
+        return Probe(error=f"[ERROR]\ncode={error.get('code')}\nstring={error.get('string', stderr)}\n[/ERROR]\n")
+    duration = output.get("format", {}).get("duration")
+    return Probe(streams=output.get("streams", []), duration=float(duration) if duration else None)
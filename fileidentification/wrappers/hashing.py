@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from fileidentification.definitions.constants import HashAlg
+from fileidentification.definitions.metrics import METRICS, PUID
+
+# size of the buffer each thread reads the files into
+BUFSIZE = 1024 * 1024
+# files queued per worker, bounds the memory used when the input is a stream
+QUEUED = 4
+# bytes hashed at the start and at the end of a file to tell apart files of the same size
+BLOCK = 64 * 1024
+# prefix of the digests that only cover the head and tail blocks
+PARTIAL = "blocks:"
+
+_local = threading.local()
+
+
+def _buffer() -> memoryview:
+    """Return the preallocated read buffer of the current thread"""
+    if not hasattr(_local, "buffer"):
+        _local.buffer = memoryview(bytearray(BUFSIZE))
+    buffer: memoryview = _local.buffer
+    return buffer
+
+
+def hash_file(path: str | Path, algorithms: Iterable[str] = (HashAlg.MD5,)) -> dict[str, str]:
+    """
+    Read the file once and feed every chunk to all the requested digests, returns {algorithm: hexdigest}.
+    hashlib releases the GIL while updating, so several files can be hashed in parallel with threads.
+    """
+    digests = {alg: hashlib.new(alg) for alg in dict.fromkeys(algorithms)}
+    buffer = _buffer()
+    start, total = time.perf_counter(), 0
+    with open(path, "rb", buffering=0) as s:  # noqa: PTH123
+        while size := s.readinto(buffer):
+            chunk = buffer[:size]
+            for digest in digests.values():
+                digest.update(chunk)
+            total += size
+    METRICS.observe("task", time.perf_counter() - start, total, task="hash", puid=PUID.get())
+    return {alg: digest.hexdigest() for alg, digest in digests.items()}
+
+
+def hash_files[T](
+    items: Iterable[T],
+    path: Callable[[T], Path],
+    algorithms: Iterable[str] = (HashAlg.MD5,),
+    workers: int = 0,
+) -> Iterator[tuple[T, dict[str, str]]]:
+    """
+    Hash the files of items on a thread pool, yields (item, digests) in the order of items.
+    items can be a generator (e.g. the output of siegfried): it is consumed while the files are hashed.
+    :param path returns the path of the file to hash of an item
+    :param algorithms the digests to calculate in the same read
+    :param workers number of threads, 0 means number of cpus
+    """
+    algorithms = tuple(algorithms)
+    workers = workers if workers > 0 else os.cpu_count() or 1
+    pending: deque[tuple[T, Future[dict[str, str]]]] = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            pending.append((item, pool.submit(hash_file, path(item), algorithms)))
+            if len(pending) >= workers * QUEUED:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def hash_blocks(path: str | Path, size: int) -> str:
+    """md5 of the first and the last BLOCK bytes of the file"""
+    digest = hashlib.md5()  # noqa: S324
+    with open(path, "rb", buffering=0) as s:  # noqa: PTH123
+        digest.update(os.pread(s.fileno(), BLOCK, 0))
+        digest.update(os.pread(s.fileno(), BLOCK, size - BLOCK))
+    return digest.hexdigest()
+
+
+def find_duplicates[T](
+    items: Iterable[T],
+    path: Callable[[T], Path],
+    size: Callable[[T], int],
+    md5: Callable[[T], str],
+    workers: int = 0,
+) -> dict[str, list[T]]:
+    """
+    Find identical files in three tiers, each one only reads the files that are still candidates:
+    files of the same size, then the same head and tail blocks, then the same full md5.
+    Returns {md5: items} of the groups with more than one file.
+    :param md5 returns the md5 of an item if it is already known (else ""), these files are not read completely
+    :param workers number of threads reading the files, 0 means number of cpus
+    """
+    workers = workers if workers > 0 else os.cpu_count() or 1
+    by_size: dict[int, list[T]] = defaultdict(list)
+    for item in items:
+        by_size[size(item)].append(item)
+    candidates = [item for group in by_size.values() if len(group) > 1 for item in group]
+
+    def blocks(item: T) -> str:
+        # small files are hashed completely, their block hash is already the md5. the larger ones are compared
+        # on their blocks even if their md5 is known, so they match the files whose md5 is not known yet
+        if size(item) <= 2 * BLOCK:
+            return md5(item) or hash_file(path(item))[HashAlg.MD5]
+        return f"{PARTIAL}{hash_blocks(path(item), size(item))}"
+
+    def full(candidate: tuple[T, str]) -> str:
+        item, digest = candidate
+        if digest.startswith(PARTIAL):
+            return md5(item) or hash_file(path(item))[HashAlg.MD5]
+        return digest
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        by_blocks: dict[tuple[int, str], list[tuple[T, str]]] = defaultdict(list)
+        for item, digest in zip(candidates, pool.map(blocks, candidates), strict=True):
+            by_blocks[(size(item), digest)].append((item, digest))
+        survivors = [candidate for group in by_blocks.values() if len(group) > 1 for candidate in group]
+
+        duplicates: dict[str, list[T]] = defaultdict(list)
+        for (item, _), digest in zip(survivors, pool.map(full, survivors), strict=True):
+            duplicates[digest].append(item)
+    return {digest: group for digest, group in duplicates.items() if len(group) > 1}
@@ -1,9 +1,12 @@
-import shlex
-import subprocess
 from pathlib import Path
 
-from fileidentification.definitions.constants import ErrMsgIM
+from fileidentification.definitions.constants import Bin, ErrMsgIM
 from fileidentification.definitions.models import SfInfo
+from fileidentification.wrappers.process import LimitExceededError, ToolNotFoundError, run
+
+FORMAT = "%m %wx%h %g %z-bit %[channels]"
+# separators of the records of a batch: a record per frame, the filename followed by the output of FORMAT, and its end
+RS, US = "\x1e", "\x1f"
 
 
 def imagemagick_inspect(sfinfo: SfInfo, verbose: bool) -> tuple[bool, str, str]:
@@ -13,17 +16,57 @@ def imagemagick_inspect(sfinfo: SfInfo, verbose: bool) -> tuple[bool, str, str]:
     if everithing ok [False, ""]
     """
 
-    cmd = f'magick identify -format "%m %wx%h %g %z-bit %[channels]" {shlex.quote(str(sfinfo.path))}'
+    cmd = ["magick", "identify", "-format", FORMAT, f"{sfinfo.path}"]
 
     if verbose:
-        cmd = (
-            f'magick identify -verbose -regard-warnings -format "%m %wx%h %g %z-bit %[channels]" '
-            f"{shlex.quote(str(sfinfo.path))}"
-        )
-    res = subprocess.run(cmd, check=False, shell=True, capture_output=True, text=True)
+        cmd = ["magick", "identify", "-verbose", "-regard-warnings", "-format", FORMAT, f"{sfinfo.path}"]
+    res = run(cmd, pbin=Bin.MAGICK)
     return _parse_output(sfinfo, res.stdout, res.stderr, verbose)
 
 
+def imagemagick_inspect_batch(sfinfos: list[SfInfo]) -> list[tuple[bool, str, str] | None]:
+    """
+    Run one magick identify for the files (see imagemagick_inspect, without verbose). stdout is split per file by
+    the filename in its records, stderr by the filename in the warnings. returns None for the files it can't
+    assign the output to, or for all of them if a line of stderr can't be assigned or the call fails
+    """
+    outputs = _identify_batch([sfinfo.path for sfinfo in sfinfos])
+    return [
+        _parse_output(sfinfo, *outputs[sfinfo.path], verbose=False) if sfinfo.path in outputs else None
+        for sfinfo in sfinfos
+    ]
+
+
+def _identify_batch(files: list[Path]) -> dict[Path, tuple[str, str]]:
+    """Return stdout and stderr of one magick identify per file, without the files it can't assign them to"""
+    cmd = ["magick", "identify", "-format", f"%i{US}{FORMAT}{RS}", *[f"{file}" for file in files]]
+    try:
+        res = run(cmd, pbin=Bin.MAGICK)
+    except (LimitExceededError, ToolNotFoundError):
+        # e.g. the timeout of the watchdog, the files are probed one by one to find the one it hangs on
+        return {}
+    # output cut at the limit of the buffer doesn't end with a record, the notice of the bytes not kept follows it
+    if res.stdout and not res.stdout.endswith(RS):
+        return {}
+    paths = {f"{file}": file for file in files}
+    *records, _ = res.stdout.split(RS)
+    stdout: dict[Path, str] = {}
+    for record in records:
+        name, sep, out = record.partition(US)
+        if not sep or name not in paths:
+            return {}
+        stdout[paths[name]] = stdout.get(paths[name], "") + out
+    # longest first, so that a warning about dir/a.jpg.png is not taken for dir/a.jpg
+    names = sorted(paths, key=len, reverse=True)
+    stderr: dict[Path, str] = {}
+    for line in res.stderr.splitlines(keepends=True):
+        match = next((name for name in names if name in line), None)
+        if match is None:
+            return {}
+        stderr[paths[match]] = stderr.get(paths[match], "") + line
+    return {file: (stdout.get(file, ""), stderr.get(file, "")) for file in files if file in stdout or file in stderr}
+
+
 def _parse_output(sfinfo: SfInfo, std_out: str, std_err: str, verbose: bool) -> tuple[bool, str, str]:
     std_out = std_out.replace(f"{sfinfo.path.parent}", "")
     std_err = std_err.replace(f"{sfinfo.path.parent}", "")
@@ -38,7 +81,15 @@ def _parse_output(sfinfo: SfInfo, std_out: str, std_err: str, verbose: bool) ->
     return False, std_err, std_out
 
 
+def imagemagick_media_infos(files: list[Path]) -> list[str | None]:
+    """
+    Return the media info of the files (see imagemagick_media_info) out of one call of magick identify,
+    None for the files it can't assign the output to
+    """
+    outputs = _identify_batch(files)
+    return [outputs[file][0] if file in outputs else None for file in files]
+
+
 def imagemagick_media_info(file: Path) -> str:
-    cmd = f'magick identify -format "%m %wx%h %g %z-bit %[channels]" {shlex.quote(str(file))}'
-    res = subprocess.run(cmd, check=False, shell=True, capture_output=True, text=True)
+    res = run(["magick", "identify", "-format", FORMAT, f"{file}"], pbin=Bin.MAGICK)
     return res.stdout.replace(f"{file}/", "")
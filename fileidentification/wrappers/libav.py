@@ -0,0 +1,92 @@
+import importlib.util
+from fractions import Fraction
+from pathlib import Path
+from typing import Any
+
+from fileidentification.definitions.constants import Bin
+from fileidentification.definitions.metrics import METRICS, PUID
+from fileidentification.wrappers.process import WATCHDOG, LimitExceededError
+
+# the names ffprobe gives the color spaces (AVColorSpace), unspecified and reserved are left out like ffprobe does
+COLOR_SPACES = {
+    0: "gbr",
+    1: "bt709",
+    4: "fcc",
+    5: "bt470bg",
+    6: "smpte170m",
+    7: "smpte240m",
+    8: "ycgco",
+    9: "bt2020nc",
+    10: "bt2020c",
+    11: "smpte2085",
+    12: "chroma-derived-nc",
+    13: "chroma-derived-c",
+    14: "ictcp",
+    15: "ipt-c2",
+    16: "ycgco-re",
+    17: "ycgco-ro",
+}
+
+
+def available() -> bool:
+    """Check whether the libav bindings (optional dependency 'libav') are installed"""
+    return importlib.util.find_spec("av") is not None
+
+
+def probe(file: Path) -> dict[str, Any]:
+    """
+    Open the file with libav in this process and return what ffprobe -show_error -show_entries STREAM_ENTRIES
+    returns as json: the streams and the duration, or the error if libav can't open the file.
+    the file is opened with the GIL released, so that it can be called from a thread pool.
+    :raises LimitExceededError if opening the file takes longer than the timeout of the watchdog for ffmpeg
+    """
+    import av  # noqa: PLC0415
+
+    timeout = WATCHDOG.get(Bin.FFMPEG).timeout
+    try:
+        with METRICS.time("tool", bin="libav", puid=PUID.get()), av.open(f"{file}", timeout=timeout or None) as c:
+            streams = [_stream(stream) for stream in c.streams]
+            duration = c.duration
+    except av.ExitError as e:
+        # libav was interrupted by the timeout
+        cmd, reason = f"libav: probe {file}", f"stopped after the timeout of {timeout}s"
+        raise LimitExceededError(cmd, reason) from e
+    except av.FFmpegError as e:
+        return {"error": {"code": -e.errno if e.errno else None, "string": e.strerror}}
+    output: dict[str, Any] = {"streams": streams}
+    if duration is not None:
+        output["format"] = {"duration": f"{duration / 1_000_000:.6f}"}
+    return output
+
+
+def _stream(stream: Any) -> dict[str, Any]:
+    """Return the entries of the stream, the ones that are not known are left out like ffprobe does"""
+    cc = stream.codec_context
+    entry: dict[str, Any] = {
+        "index": stream.index,
+        "codec_name": cc.name,
+        "codec_long_name": cc.codec.long_name,
+        "profile": cc.profile,
+        "codec_tag": f"0x{int.from_bytes(cc.codec_tag.encode('latin-1'), 'little'):04x}",
+    }
+    # in the order of ffprobe
+    if stream.type == "video":
+        entry |= {
+            "coded_width": cc.coded_width or cc.width,
+            "coded_height": cc.coded_height or cc.height,
+            "sample_aspect_ratio": _ratio(cc.sample_aspect_ratio, ":"),
+            "display_aspect_ratio": _ratio(cc.display_aspect_ratio, ":"),
+            "pix_fmt": cc.format.name if cc.format else None,
+            "color_space": COLOR_SPACES.get(cc.colorspace),
+        }
+    if stream.type == "audio":
+        entry |= {"channels": cc.layout.nb_channels, "channel_layout": cc.layout.name}
+    entry["r_frame_rate"] = _ratio(getattr(stream, "base_rate", None), "/") or "0/0"
+    entry["bit_rate"] = f"{cc.bit_rate}" if cc.bit_rate else None
+    return {key: value for key, value in entry.items() if value is not None}
+
+
+def _ratio(value: Fraction | None, sep: str) -> str | None:
+    if not value:
+        return None
+    return f"{value.numerator}{sep}{value.denominator}"
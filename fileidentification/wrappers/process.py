@@ -0,0 +1,288 @@
+import asyncio
+import errno
+import os
+import resource
+import shlex
+import signal
+import sys
+import threading
+import time
+from collections.abc import Callable, Coroutine
+from contextlib import suppress
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+from fileidentification.definitions.metrics import METRICS, PUID
+
+# bytes of stdout and of stderr kept per call, the rest of the output is counted and dropped
+MAX_OUTPUT = 1 << 20
+CHUNK = 1 << 16
+# what the tools write when an allocation fails with ENOMEM, e.g. at the memory limit
+OUT_OF_MEMORY = (os.strerror(errno.ENOMEM), "out of memory", "std::bad_alloc", "MemoryAllocationFailed")
+# the signals a tool ends with when it runs out of memory: killed, a failed allocation that is not checked, or aborted
+OOM_SIGNALS = (signal.SIGKILL, signal.SIGSEGV, signal.SIGABRT)
+
+
+class Result(BaseModel):
+    """the outcome of a call: returncode is None if the call was stopped after its timeout"""
+
+    argv: list[str]
+    returncode: int | None = None
+    stdout: str = ""
+    stderr: str = ""
+    timed_out: bool = False
+
+    @property
+    def cmd(self) -> str:
+        """Return the call as a shell command line, for the logs"""
+        return shlex.join(self.argv)
+
+
+class Limits(BaseModel):
+    """
+    the limits the watchdog sets on every call of a bin, 0 = no limit.
+    timeout: wall-clock seconds, memory: MB of address space, cpu: seconds of cpu time.
+    memory and cpu are rlimits of the process, they are only set on linux
+    """
+
+    timeout: float = 0
+    memory: int = 0
+    cpu: int = 0
+
+    def preexec(self) -> Callable[[], None] | None:
+        """
+        Return the function that sets the rlimits in the child before it runs the program, so they apply from its
+        first allocation on. its children inherit them. None if there are none to set
+        """
+        if sys.platform != "linux" or not (self.memory or self.cpu):
+            return None
+        memory, cpu = self.memory * 1024**2, self.cpu
+
+        def set_rlimits() -> None:
+            if memory:
+                resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+            if cpu:
+                # SIGXCPU at the limit, killed one second later if it is ignored
+                resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+
+        return set_rlimits
+
+    def exceeded(self, returncode: int | None, output: str = "") -> str:
+        """
+        Return why the call ended by a limit, empty if it did not. a call ended by a signal only counts as stopped by
+        the memory limit if it wrote that an allocation failed, the other crashes are left to the checks of the file
+        """
+        if self.cpu and returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+            return f"exceeded the cpu limit of {self.cpu}s"
+        # a tool running out of memory aborts or is killed, it is not taken for a corrupt file
+        if (
+            self.memory
+            and returncode in [-sig for sig in OOM_SIGNALS]
+            and any(msg.lower() in output.lower() for msg in OUT_OF_MEMORY)
+        ):
+            return f"killed by signal {-returncode} with the memory limit of {self.memory} MB"
+        return ""
+
+
+class LimitExceededError(Exception):
+    """a call was stopped by the watchdog: it exceeded the timeout, memory or cpu limit of its bin"""
+
+    def __init__(self, cmd: str, reason: str) -> None:
+        super().__init__(f"{reason}: {cmd}")
+        self.cmd = cmd
+        self.reason = reason
+
+
+class ToolNotFoundError(Exception):
+    """the program of a call could not be started: it is not installed or not executable. it says nothing about the file"""
+
+    def __init__(self, cmd: str, reason: str) -> None:
+        super().__init__(f"{reason}: {cmd}")
+        self.cmd = cmd
+        self.reason = reason
+
+
+class Watchdog:
+    """the limits of the calls per bin, set once for the run. calls without a bin have none"""
+
+    def __init__(self) -> None:
+        self._limits: dict[str, Limits] = {}
+
+    def configure(self, limits: dict[str, Limits]) -> None:
+        self._limits = limits
+
+    def get(self, pbin: str) -> Limits:
+        return self._limits.get(pbin) or Limits()
+
+
+WATCHDOG = Watchdog()
+
+
+class _Buffer:
+    """keeps the first limit bytes of a stream, counts the ones dropped"""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.data = bytearray()
+        self.dropped = 0
+
+    async def fill(self, stream: asyncio.StreamReader | None) -> None:
+        if stream is None:
+            return
+        while chunk := await stream.read(CHUNK):
+            keep = chunk[: max(0, self.limit - len(self.data))]
+            self.data += keep
+            self.dropped += len(chunk) - len(keep)
+
+    def text(self) -> str:
+        text = self.data.decode(errors="replace")
+        if self.dropped:
+            text += f"\n[... {self.dropped} bytes of output not kept]\n"
+        return text
+
+
+async def _exited(proc: asyncio.subprocess.Process) -> None:
+    """
+    Wait for the process itself to end. proc.wait() also waits for the pipes to be closed, i.e. for the processes
+    it started that hold them open, and those are only killed once it ended. on linux a pidfd tells when it ended,
+    elsewhere its returncode is polled
+    """
+    fd = -1
+    if hasattr(os, "pidfd_open"):
+        with suppress(OSError):
+            fd = os.pidfd_open(proc.pid)
+    if fd < 0:
+        while proc.returncode is None:  # noqa: ASYNC110
+            await asyncio.sleep(0.01)
+        return
+    loop = asyncio.get_running_loop()
+    ended: asyncio.Future[None] = loop.create_future()
+
+    def _ended() -> None:
+        if not ended.done():
+            ended.set_result(None)
+
+    loop.add_reader(fd, _ended)
+    try:
+        await ended
+    finally:
+        loop.remove_reader(fd)
+        os.close(fd)
+
+
+async def run_async(
+    argv: list[str],
+    timeout: float | None = None,  # noqa: ASYNC109
+    limit: int = MAX_OUTPUT,
+    merge_stderr: bool = False,
+    pbin: str = "",
+    puid: str = "",
+) -> Result:
+    """
+    Run argv without a shell and capture its output into bounded buffers.
+    the call is killed with the processes it started after timeout seconds, the output until then is kept.
+    the processes it leaves running are killed when it ends.
+    :param merge_stderr write stderr into stdout, like 2>&1
+    :param pbin the bin whose limits (see WATCHDOG) the call gets
+    :param puid of the file the call works on, for the metrics
+    :raises LimitExceededError if the call was stopped by the limits of pbin, rather than by timeout
+    :raises ToolNotFoundError if the program of argv could not be started
+    """
+    limits = WATCHDOG.get(pbin)
+    start = time.perf_counter()
+    watched = bool(limits.timeout) and (timeout is None or limits.timeout < timeout)
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT if merge_stderr else asyncio.subprocess.PIPE,
+            # own process group, so that the children of e.g. soffice are killed with it
+            start_new_session=True,
+            preexec_fn=limits.preexec(),
+        )
+    except OSError as e:
+        raise ToolNotFoundError(shlex.join(argv), f"{argv[0]} could not be started ({e.strerror})") from e
+    out, err = _Buffer(limit), _Buffer(limit)
+    reading = asyncio.gather(out.fill(proc.stdout), err.fill(proc.stderr))
+    timed_out = False
+    try:
+        await asyncio.wait_for(_exited(proc), limits.timeout if watched else timeout)
+    except TimeoutError:
+        timed_out = True
+    # the call itself after a timeout, else the processes it left behind, which would hold the pipes open
+    with suppress(ProcessLookupError):
+        os.killpg(proc.pid, signal.SIGKILL)
+    await proc.wait()
+    await reading
+    METRICS.observe("tool", time.perf_counter() - start, bin=pbin or Path(argv[0]).name, puid=puid)
+    result = Result(argv=argv, returncode=None if timed_out else proc.returncode, timed_out=timed_out)
+    result.stdout, result.stderr = out.text(), err.text()
+    if timed_out and watched:
+        raise LimitExceededError(result.cmd, f"stopped after the timeout of {limits.timeout}s")
+    if reason := limits.exceeded(result.returncode, result.stderr or result.stdout):
+        raise LimitExceededError(result.cmd, reason)
+    return result
+
+
+async def gather_async(
+    argvs: list[list[str]],
+    concurrency: int = 0,
+    timeout: float | None = None,  # noqa: ASYNC109
+    limit: int = MAX_OUTPUT,
+    pbin: str = "",
+    puid: str = "",
+) -> list[Result]:
+    """Run the calls at once, at most concurrency at a time (0 = all), returns the results in the order of argvs"""
+    semaphore = asyncio.Semaphore(concurrency or len(argvs) or 1)
+
+    async def bounded(argv: list[str]) -> Result:
+        async with semaphore:
+            return await run_async(argv, timeout, limit, pbin=pbin, puid=puid)
+
+    return list(await asyncio.gather(*(bounded(argv) for argv in argvs)))
+
+
+class _Loop:
+    """the event loop all calls of the process run on, in a thread of its own, started on first use"""
+
+    def __init__(self) -> None:
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def run[T](self, coro: Coroutine[Any, Any, T]) -> T:
+        """Run coro on the loop and wait for its result, the threads of the stages only wait here"""
+        loop = self._start()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            msg = "the calls on the loop itself need run_async"
+            raise RuntimeError(msg)
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="processes", daemon=True)
+                self._thread.start()
+            return self._loop
+
+
+LOOP = _Loop()
+
+
+def run(
+    argv: list[str], timeout: float | None = None, limit: int = MAX_OUTPUT, merge_stderr: bool = False, pbin: str = ""
+) -> Result:
+    """Run argv on the shared event loop (see run_async), blocks the calling thread only"""
+    return LOOP.run(run_async(argv, timeout, limit, merge_stderr, pbin, PUID.get()))
+
+
+def run_all(
+    argvs: list[list[str]], concurrency: int = 0, timeout: float | None = None, limit: int = MAX_OUTPUT, pbin: str = ""
+) -> list[Result]:
+    """Run the calls at once on the shared event loop (see gather_async), returns the results in order"""
+    return LOOP.run(gather_async(argvs, concurrency, timeout, limit, pbin, PUID.get()))
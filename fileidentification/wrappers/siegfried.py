@@ -0,0 +1,176 @@
+import codecs
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO, Any, cast
+
+import pygfried
+from typer import colors, secho
+
+from fileidentification.definitions.constants import HashAlg, SfBackend
+from fileidentification.definitions.models import SfInfo
+from fileidentification.wrappers.hashing import hash_files
+
+# bytes read at once from the stdout of sf
+CHUNK = 64 * 1024
+# start of the list of file entries in the json output of sf
+FILES_START = re.compile(r'"files"\s*:\s*\[')
+
+
+class SiegfriedError(Exception):
+    """sf failed or stopped part way through the scan, the files it returned are not all the files of the folder"""
+
+    def __init__(self, cmd: str, reason: str) -> None:
+        super().__init__(f"{reason}: {cmd}")
+        self.cmd = cmd
+        self.reason = reason
+
+
+def identify(
+    root_folder: Path,
+    backend: str = SfBackend.PYGFRIED,
+    multi: int = 0,
+    md5: bool = True,
+    fixity: list[str] | None = None,
+    workers: int = 0,
+) -> Iterator[SfInfo]:
+    """
+    Identify all files in root_folder (or root_folder itself, if it is a file), yields a SfInfo per file
+    as soon as siegfried returns its result.
+    :param root_folder the folder to scan
+    :param backend SfBackend.SF scans the folder with one call of sf, SfBackend.PYGFRIED calls pygfried per file
+    :param multi number of parallel workers sf uses, 0 means number of cpus
+    :param md5 if False, the md5 is deferred, i.e. only calculated when it is needed (SfInfo.ensure_md5)
+    :param fixity additional digests (HashAlg) to calculate in the same read as the md5
+    :param workers number of threads hashing the files, 0 means number of cpus
+    """
+    if backend == SfBackend.SF and root_folder.is_dir():
+        if shutil.which("sf"):
+            # sf calculates the md5 while identifying, only the fixity digests are left
+            yield from _hash(sf_identify(root_folder, multi, md5=md5), fixity or [], workers)
+            return
+        secho("sf not found, falling back on pygfried", fg=colors.YELLOW)
+    yield from _hash(pygfried_identify(root_folder), _algorithms(md5, fixity), workers)
+
+
+def _algorithms(md5: bool, fixity: list[str] | None) -> list[str]:
+    return [HashAlg.MD5, *(fixity or [])] if md5 else [*(fixity or [])]
+
+
+def _hash(metadatas: Iterator[dict[str, Any]], algorithms: list[str], workers: int) -> Iterator[SfInfo]:
+    """Hash the files on a thread pool while siegfried is still identifying the next ones"""
+    if not algorithms:
+        yield from (SfInfo(**metadata) for metadata in metadatas)
+        return
+    for metadata, digests in hash_files(metadatas, lambda m: Path(m["filename"]), algorithms, workers):
+        if HashAlg.MD5 in digests:
+            metadata[HashAlg.MD5] = digests.pop(HashAlg.MD5)
+        yield SfInfo(**metadata, checksums=digests or None)
+
+
+def identify_files(
+    files: list[Path], md5: bool = True, fixity: list[str] | None = None, workers: int = 0
+) -> Iterator[SfInfo]:
+    """Identify the given files with pygfried, used to only identify the files that changed since the last run"""
+    yield from _hash((_pygfried(f) for f in files), _algorithms(md5, fixity), workers)
+
+
+def identify_batch(
+    files: list[Path], backend: str = SfBackend.PYGFRIED, multi: int = 0, md5: bool = True, workers: int = 0
+) -> list[SfInfo]:
+    """
+    Identify the files with one scan of sf, which hashes them in the same read, returns their SfInfo in the order
+    of files. sf scans a folder: the files are linked into a folder of their own next to them.
+    With SfBackend.PYGFRIED, or if the files can't be linked or sf fails, they are identified one by one
+    (see identify_files).
+    """
+    if backend != SfBackend.SF or len(files) < 2 or not shutil.which("sf"):
+        return list(identify_files(files, md5=md5, workers=workers))
+    found: dict[int, SfInfo] = {}
+    try:
+        with tempfile.TemporaryDirectory(dir=os.path.commonpath(files), prefix=".sf_") as tmp:
+            links = Path(tmp)
+            for i, file in enumerate(files):
+                # a folder per file, the files keep their names (and extensions) for siegfried
+                (links / f"{i}").mkdir()
+                (links / f"{i}" / file.name).hardlink_to(file)
+            for sfinfo in identify(links, SfBackend.SF, multi, md5=md5, workers=workers):
+                i = int(sfinfo.filename.relative_to(links).parts[0])
+                sfinfo.filename = files[i]
+                found[i] = sfinfo
+    except (OSError, SiegfriedError) as e:
+        secho(f"{e}, identifying the files one by one", fg=colors.YELLOW)
+        found = {}
+    missing = [i for i in range(len(files)) if i not in found]
+    found |= dict(zip(missing, identify_files([files[i] for i in missing], md5=md5, workers=workers), strict=True))
+    return [found[i] for i in range(len(files))]
+
+
+def pygfried_identify(root_folder: Path) -> Iterator[dict[str, Any]]:
+    if root_folder.is_file():
+        yield _pygfried(root_folder)
+        return
+    for f in root_folder.rglob("*"):
+        if f.is_file():
+            yield _pygfried(f)
+
+
+def _pygfried(file: Path) -> dict[str, Any]:
+    return cast("dict[str, Any]", pygfried.identify(f"{file}", detailed=True)["files"][0])
+
+
+def sf_identify(root_folder: Path, multi: int = 0, md5: bool = True) -> Iterator[dict[str, Any]]:
+    """
+    Scan root_folder with siegfried's own multi-worker directory scan. the md5 is calculated by sf in the same pass
+    (unless it is deferred).
+    The file entries are parsed out of the json stream while sf is still writing it.
+    The filenames are mapped back onto root_folder, so they have the same form as the ones returned by pygfried.
+    :raises SiegfriedError if sf exits with an error, after the files it returned until then
+    """
+    abs_root = root_folder.absolute()
+    workers = multi if multi > 0 else os.cpu_count() or 1
+    cmd = ["sf", "-json", *(["-hash", "md5"] if md5 else []), "-multi", f"{workers}", f"{abs_root}"]
+    # stderr is spooled to a file, a pipe that is only read at the end could block sf
+    with (
+        tempfile.TemporaryFile() as stderr,
+        subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr) as proc,  # noqa: S603
+    ):
+        for metadata in _parse_stream(proc.stdout):  # type: ignore[arg-type]
+            metadata["filename"] = f"{root_folder / Path(metadata['filename']).relative_to(abs_root)}"
+            yield metadata
+        if proc.wait():
+            stderr.seek(0)
+            reason = stderr.read().decode(errors="replace").strip() or "no output on stderr"
+            raise SiegfriedError(shlex.join(cmd), f"sf exited with {proc.returncode} ({reason})")
+
+
+def _parse_stream(stream: IO[bytes]) -> Iterator[dict[str, Any]]:
+    """Yield the objects of the files list in the json output of sf, without waiting for the document to be complete"""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    in_files = False
+    while chunk := stream.read1(CHUNK):  # type: ignore[attr-defined]
+        buffer += utf8.decode(chunk)
+        if not in_files:
+            start = FILES_START.search(buffer)
+            if not start:
+                continue
+            buffer, in_files = buffer[start.end() :], True
+        while True:
+            buffer = buffer.lstrip(", \t\r\n")
+            if not buffer or buffer[0] == "]":
+                break
+            try:
+                metadata, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # the object is not completely written yet
+                break
+            yield metadata
+            buffer = buffer[end:]
@@ -0,0 +1,205 @@
+import json
+import os
+import platform
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+from contextlib import suppress
+from pathlib import Path
+from queue import Queue
+from types import TracebackType
+from typing import Any, Self
+
+from typer import colors, secho
+
+from fileidentification.definitions.constants import PDFFILTERDATA, SOFFICEWORKERTARGETS, Bin, LOPath
+from fileidentification.definitions.metrics import METRICS, PUID
+from fileidentification.definitions.models import PolicyParams
+from fileidentification.wrappers.process import WATCHDOG, LimitExceededError, Limits
+
+SOFFICE = LOPath.Linux if platform.system() == LOPath.Linux.name else LOPath.Darwin
+
+# the script that runs in the python with the uno module
+WORKER_SCRIPT = Path(__file__).parent / "soffice_worker.py"
+# seconds to wait for LibreOffice to start, and for a single conversion if the watchdog sets no timeout
+STARTUP_TIMEOUT = 90
+CONVERT_TIMEOUT = 600
+
+
+class WorkerTimeoutError(ConnectionError):
+    """the worker did not answer in time, it was killed"""
+
+
+class SofficeWorker:
+    """
+    A LibreOffice instance that stays open, it gets the conversions over a pipe to the worker script.
+    the worker and the LibreOffice it starts run in a process group of their own, they are killed together.
+    every start gets a fresh profile in profiles, the one of a killed LibreOffice can still be locked
+    """
+
+    def __init__(self, python: str, profiles: Path) -> None:
+        self.python = python
+        self.profiles = profiles
+        self.profile: Path | None = None
+        self.proc: subprocess.Popen[str] | None = None
+        self._starts = 0
+
+    def start(self) -> None:
+        self.stop()
+        self._starts += 1
+        self.profile = self.profiles / f"{self._starts}"
+        cmd = [self.python, f"{WORKER_SCRIPT}", f"{SOFFICE}", self.profile.absolute().as_uri()]
+        self.proc = subprocess.Popen(  # noqa: S603
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+            start_new_session=True,
+            # the worker runs for many files, only the memory limit applies to it
+            preexec_fn=Limits(memory=WATCHDOG.get(Bin.SOFFICE).memory).preexec(),  # noqa: PLW1509
+        )
+        if not self._read(STARTUP_TIMEOUT).get("ok"):
+            self.stop()
+            msg = "the LibreOffice worker did not start"
+            raise ConnectionError(msg)
+
+    def stop(self) -> None:
+        if self.proc is None:
+            return
+        with suppress(OSError, subprocess.TimeoutExpired):
+            if self.proc.poll() is None:
+                self._write({"cmd": "quit"})
+            self.proc.wait(timeout=15)
+        # a LibreOffice the worker could not close, or left behind when it died, is killed with the group
+        self._kill()
+        self.proc = None
+        if self.profile:
+            shutil.rmtree(self.profile, ignore_errors=True)
+
+    def _kill(self) -> None:
+        """Kill the worker and the LibreOffice it started"""
+        with suppress(ProcessLookupError):
+            os.killpg(self.proc.pid, signal.SIGKILL)  # type: ignore[union-attr]
+        self.proc.wait()  # type: ignore[union-attr]
+
+    def alive(self) -> bool:
+        """Health check: the worker and LibreOffice answer a ping"""
+        if self.proc is None or self.proc.poll() is not None:
+            return False
+        try:
+            return bool(self._request({"cmd": "ping"}, timeout=10).get("ok"))
+        except (OSError, ConnectionError):
+            return False
+
+    def convert(self, inputfile: Path, target: Path, target_container: str) -> dict[str, Any]:
+        """Convert the file, restarts the worker if it is not healthy. a crash during conversion is not retried"""
+        if not self.alive():
+            self.start()
+        request: dict[str, Any] = {
+            "cmd": "convert",
+            "input": f"{inputfile.absolute()}",
+            "output": f"{target.absolute()}",
+            "target": target_container,
+        }
+        if target_container == "pdf":
+            request["filter_data"] = PDFFILTERDATA
+        timeout = WATCHDOG.get(Bin.SOFFICE).timeout or CONVERT_TIMEOUT
+        try:
+            return self._request(request, timeout=timeout)
+        except WorkerTimeoutError as e:
+            self.stop()
+            cmd, reason = f"soffice worker: convert {inputfile}", f"stopped after the timeout of {timeout}s"
+            raise LimitExceededError(cmd, reason) from e
+        except (OSError, ConnectionError) as e:
+            self.stop()
+            return {"ok": False, "error": f"{e}"}
+
+    def _request(self, request: dict[str, Any], timeout: float) -> dict[str, Any]:
+        self._write(request)
+        return self._read(timeout)
+
+    def _write(self, request: dict[str, Any]) -> None:
+        self.proc.stdin.write(json.dumps(request) + "\n")  # type: ignore[union-attr]
+        self.proc.stdin.flush()  # type: ignore[union-attr]
+
+    def _read(self, timeout: float) -> dict[str, Any]:
+        stdout = self.proc.stdout  # type: ignore[union-attr]
+        ready, _, _ = select.select([stdout], [], [], timeout)
+        if not ready:
+            self._kill()
+            msg = f"the LibreOffice worker did not answer within {timeout}s"
+            raise WorkerTimeoutError(msg)
+        line = stdout.readline()  # type: ignore[union-attr]
+        if not line:
+            msg = "the LibreOffice worker exited"
+            raise ConnectionError(msg)
+        response: dict[str, Any] = json.loads(line)
+        return response
+
+
+class SofficePool:
+    """
+    LibreOffice instances that are kept open for the conversions of a run, each with its own profile.
+    Used as context manager, the instances are closed and the profiles removed on exit.
+    """
+
+    def __init__(self, size: int, python: str) -> None:
+        self._profiles = tempfile.TemporaryDirectory(prefix="soffice_")
+        self._workers: Queue[SofficeWorker] = Queue()
+        for i in range(max(1, size)):
+            self._workers.put(SofficeWorker(python, Path(self._profiles.name) / f"{i}"))
+
+    @classmethod
+    def start(cls, size: int, python: str) -> Self | None:
+        """Start the pool, returns None if there is no python with the uno module to run the worker script"""
+        if not shutil.which(python):
+            secho(f"{python} not found, starting LibreOffice for every file", fg=colors.YELLOW)
+            return None
+        pool = cls(size, python)
+        worker = pool._workers.get()
+        try:
+            worker.start()
+        except ConnectionError:
+            secho(f"could not start LibreOffice with uno ({python}), starting it for every file", fg=colors.YELLOW)
+            pool.close()
+            return None
+        finally:
+            pool._workers.put(worker)
+        return pool
+
+    @staticmethod
+    def supports(args: PolicyParams) -> bool:
+        """Check whether the worker can do the conversion, it only replaces the plain --convert-to call"""
+        return args.processing_args.split() == ["--headless", "--convert-to"] and (
+            args.target_container in SOFFICEWORKERTARGETS
+        )
+
+    def convert(self, inputfile: Path, target: Path, target_container: str) -> tuple[str, str]:
+        """Convert the file with the next free instance, returns the cmd and a log like the one of the cli"""
+        worker = self._workers.get()
+        try:
+            with METRICS.time("tool", bin=Bin.SOFFICE, puid=PUID.get()):
+                res = worker.convert(inputfile, target, target_container)
+        finally:
+            self._workers.put(worker)
+        cmd = f"soffice worker: convert {inputfile} -> {target}"
+        if res.get("ok"):
+            return cmd, f"convert {inputfile} -> {target} using filter : {res['filter']}\n"
+        return cmd, f"Error: {res.get('error')}\n"
+
+    def close(self) -> None:
+        while not self._workers.empty():
+            self._workers.get().stop()
+        self._profiles.cleanup()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None
+    ) -> None:
+        self.close()
@@ -0,0 +1,135 @@
+"""
+Conversion worker for LibreOffice, it is run by wrappers.soffice with a python that has the uno module
+(e.g. the system python with the python3-uno package), so it must not import anything of fileidentification.
+It starts LibreOffice listening on a pipe, then reads one json request per line from stdin and answers with one
+json line on stdout. It exits when LibreOffice is gone, wrappers.soffice restarts it.
+
+usage: python soffice_worker.py <soffice executable> <profile url>
+"""
+
+import contextlib
+import json
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any
+
+import uno  # type: ignore[import-not-found]
+from com.sun.star.beans import PropertyValue  # type: ignore[import-not-found]
+from com.sun.star.connection import NoConnectException  # type: ignore[import-not-found]
+
+# seconds to wait for LibreOffice to accept connections
+STARTUP = 60
+
+# export filter per target container and document type, the first type the document supports is used
+FILTERS: dict[str, list[tuple[str, str]]] = {
+    "pdf": [
+        ("com.sun.star.text.TextDocument", "writer_pdf_Export"),
+        ("com.sun.star.sheet.SpreadsheetDocument", "calc_pdf_Export"),
+        ("com.sun.star.presentation.PresentationDocument", "impress_pdf_Export"),
+        ("com.sun.star.drawing.DrawingDocument", "draw_pdf_Export"),
+    ],
+    "docx": [("com.sun.star.text.TextDocument", "MS Word 2007 XML")],
+    "xlsx": [("com.sun.star.sheet.SpreadsheetDocument", "Calc MS Excel 2007 XML")],
+    "pptx": [("com.sun.star.presentation.PresentationDocument", "Impress MS PowerPoint 2007 XML")],
+    "odt": [("com.sun.star.text.TextDocument", "writer8")],
+    "ods": [("com.sun.star.sheet.SpreadsheetDocument", "calc8")],
+    "odp": [("com.sun.star.presentation.PresentationDocument", "impress8")],
+}
+
+
+def _props(**kwargs: Any) -> tuple[Any, ...]:
+    return tuple(PropertyValue(Name=k, Value=v) for k, v in kwargs.items())
+
+
+def connect(soffice: str, profile: str) -> tuple[subprocess.Popen[bytes], Any]:
+    """Start LibreOffice and return the process and its desktop"""
+    pipe = f"fileidentification_{uuid.uuid4().hex}"
+    cmd = [
+        soffice,
+        "--headless",
+        "--invisible",
+        "--nologo",
+        "--norestore",
+        "--nodefault",
+        f"-env:UserInstallation={profile}",
+        f"--accept=pipe,name={pipe};urp;StarOffice.ComponentContext",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)  # noqa: S603
+    local = uno.getComponentContext()
+    resolver = local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local)
+    deadline = time.monotonic() + STARTUP
+    while time.monotonic() < deadline:
+        try:
+            ctx = resolver.resolve(f"uno:pipe,name={pipe};urp;StarOffice.ComponentContext")
+            return proc, ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        except NoConnectException:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    msg = "LibreOffice did not start"
+    raise RuntimeError(msg)
+
+
+def convert(desktop: Any, request: dict[str, Any]) -> str:
+    """Convert the file of the request, returns the name of the export filter used"""
+    url = uno.systemPathToFileUrl(request["input"])
+    doc = desktop.loadComponentFromURL(url, "_blank", 0, _props(Hidden=True, ReadOnly=True))
+    if doc is None:
+        msg = f"could not load {request['input']}"
+        raise RuntimeError(msg)
+    try:
+        filter_name = next((f for service, f in FILTERS[request["target"]] if doc.supportsService(service)), None)
+        if not filter_name:
+            msg = f"no filter to export this document type to {request['target']}"
+            raise RuntimeError(msg)
+        props = [PropertyValue(Name="FilterName", Value=filter_name), PropertyValue(Name="Overwrite", Value=True)]
+        if request.get("filter_data"):
+            data = tuple(PropertyValue(Name=k, Value=v) for k, v in request["filter_data"].items())
+            props.append(PropertyValue(Name="FilterData", Value=uno.Any("[]com.sun.star.beans.PropertyValue", data)))
+        uno.invoke(doc, "storeToURL", (uno.systemPathToFileUrl(request["output"]), tuple(props)))
+    finally:
+        doc.close(True)
+    return filter_name
+
+
+def _answer(response: dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(response) + "\n")
+    sys.stdout.flush()
+
+
+def main(soffice: str, profile: str) -> None:
+    proc, desktop = connect(soffice, profile)
+    _answer({"ok": True})
+    try:
+        for line in sys.stdin:
+            request = json.loads(line)
+            if proc.poll() is not None:
+                _answer({"ok": False, "error": "LibreOffice crashed"})
+                return
+            match request["cmd"]:
+                case "ping":
+                    desktop.getCurrentComponent()
+                    _answer({"ok": True})
+                case "convert":
+                    try:
+                        _answer({"ok": True, "filter": convert(desktop, request)})
+                    except Exception as e:  # noqa: BLE001
+                        _answer({"ok": False, "error": f"{e}"})
+                        if proc.poll() is not None:
+                            return
+                case "quit":
+                    return
+    finally:
+        with contextlib.suppress(Exception):
+            desktop.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
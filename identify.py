@@ -1,14 +1,11 @@
 from pathlib import Path
 from typing import Annotated
 
-import toml
 import typer
 
-from fileidentification.filehandling import FileHandler
-
 
 def main(
-    root_folder: Annotated[Path, typer.Argument(help="path to the directory or file")],
+    root_folder: Annotated[Path, typer.Argument(help="path to the directory, file or zip/tar archive")],
     inspect: Annotated[
         bool,
         typer.Option(
@@ -95,7 +92,38 @@ def main(
     ] = False,
     mode_quiet: Annotated[bool, typer.Option("--quiet", "-q", help="just print errors and warnings")] = False,
     to_csv: Annotated[bool, typer.Option("--csv", help="get a csv out of the log.json")] = False,
+    metrics: Annotated[
+        bool,
+        typer.Option("--metrics", help="write the durations of the stages and tools as json and prometheus textfile"),
+    ] = False,
+    watch: Annotated[
+        bool,
+        typer.Option(
+            "--watch", "-w", help="keep running and process the files that arrive in the folder, ctrl-c stops"
+        ),
+    ] = False,
+    shard: Annotated[
+        str | None,
+        typer.Option(
+            "--shard", help="only process shard index/count of the folder, e.g. 2/4 (merge them with --merge)"
+        ),
+    ] = None,
+    shards: Annotated[
+        int,
+        typer.Option("--shards", help="split the folder into n shards, process them side by side and merge their logs"),
+    ] = 0,
+    merge: Annotated[
+        int,
+        typer.Option(
+            "--merge", help="merge the logs of the n shards of the folder, e.g. after they ran on several nodes"
+        ),
+    ] = 0,
 ) -> None:
+    # imported here, so that --help and wrong arguments don't wait for the pipeline to load
+    import toml  # noqa: PLC0415
+
+    from fileidentification.filehandling import FileHandler  # noqa: PLC0415
+
     fh = FileHandler()
     fh.config = toml.load("appconfig.toml")
     fh.run(
@@ -114,6 +142,11 @@ def main(
         mode_verbose=mode_verbose,
         mode_quiet=mode_quiet,
         to_csv=to_csv,
+        metrics=metrics,
+        watch=watch,
+        shard=shard,
+        shards=shards,
+        merge=merge,
     )
 
 
@@ -0,0 +1,59 @@
+import hashlib
+import io
+import tarfile
+import zipfile
+from pathlib import Path
+
+from fileidentification.wrappers.archives import archive_root, extract, identify_archive, is_archive
+
+
+def _zip[T: (Path, io.BytesIO)](path: T, members: dict[str, bytes]) -> T:
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return path
+
+
+def test_archive_root_does_not_collide_with_the_source_folder(tmp_path: Path) -> None:
+    (tmp_path / "photos").mkdir()
+    assert archive_root(tmp_path / "photos.zip") == tmp_path / "photos_extracted"
+    assert archive_root(tmp_path / "photos.tar.gz") == tmp_path / "photos_extracted"
+
+
+def test_identify_and_extract_members(tmp_path: Path) -> None:
+    nested = io.BytesIO()
+    _zip(nested, {"inner.txt": b"inner"})
+    archive = _zip(
+        tmp_path / "photos.zip", {"a/b.txt": b"hello", "../escape.txt": b"out", "nested.zip": nested.getvalue()}
+    )
+    assert is_archive(archive)
+    root = archive_root(archive)
+    sfinfos = {f"{sfinfo.filename}": sfinfo for sfinfo in identify_archive(archive, root, depth=1)}
+    assert set(sfinfos) == {
+        f"{root}/a/b.txt",
+        f"{root}/escape.txt",
+        f"{root}/nested.zip",
+        f"{root}/nested_zip/inner.txt",
+    }
+    inner = sfinfos[f"{root}/nested_zip/inner.txt"]
+    assert inner.member == ["nested.zip", "inner.txt"]
+    assert inner.md5 == hashlib.md5(b"inner").hexdigest()  # noqa: S324
+    # nothing is written to disk until the members are extracted
+    assert not root.exists()
+    for sfinfo in sfinfos.values():
+        sfinfo.path = sfinfo.filename
+    extract(archive, sfinfos.values())
+    assert (root / "a" / "b.txt").read_bytes() == b"hello"
+    assert (root / "nested_zip" / "inner.txt").read_bytes() == b"inner"
+    assert not (tmp_path / "escape.txt").exists()
+
+
+def test_identify_tar_members(tmp_path: Path) -> None:
+    archive = tmp_path / "docs.tar.gz"
+    with tarfile.open(archive, "w:gz") as tf:
+        info = tarfile.TarInfo("readme.txt")
+        info.size = 5
+        tf.addfile(info, io.BytesIO(b"hello"))
+    sfinfos = list(identify_archive(archive, archive_root(archive), depth=0))
+    assert [sfinfo.filename.name for sfinfo in sfinfos] == ["readme.txt"]
+    assert sfinfos[0].filesize == 5
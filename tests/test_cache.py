@@ -0,0 +1,62 @@
+import os
+from pathlib import Path
+
+from fileidentification.definitions.models import PolicyParams
+from fileidentification.filehandling import FileHandler
+from fileidentification.tasks.cache import ConversionCache
+from tests.util import make_sfinfo
+
+POLICY = PolicyParams(bin="magick", target_container="tif", processing_args="-compress lzw", expected=["fmt/353"])
+
+
+def _output(folder: Path, name: str, size: int) -> Path:
+    folder.mkdir(parents=True, exist_ok=True)
+    output = folder / name
+    output.write_bytes(b"x" * size)
+    return output
+
+
+def test_cache_returns_the_output_of_the_same_source_and_policy(tmp_path: Path) -> None:
+    cache = ConversionCache(tmp_path / "cache", 1024)
+    source = make_sfinfo("a.jpg", md5="0" * 32)
+    key = cache.key(source, POLICY)
+    assert cache.get(key, tmp_path / "out" / "a.tif") is None
+    cache.put(key, make_sfinfo(_output(tmp_path / "tmp", "a.tif", 10), 10, "fmt/353"), "magick a.jpg a.tif")
+    hit = cache.get(key, tmp_path / "out" / "a.tif")
+    assert hit is not None
+    sfinfo, cmd = hit
+    assert sfinfo.filename == tmp_path / "out" / "a.tif"
+    assert sfinfo.processed_as == "fmt/353"
+    assert cmd == "magick a.jpg a.tif"
+    assert (tmp_path / "out" / "a.tif").stat().st_size == 10
+    # the output is a copy, a change of it doesn't reach the entry
+    assert (tmp_path / "out" / "a.tif").stat().st_nlink == 1
+    (tmp_path / "out" / "a.tif").write_bytes(b"changed")
+    assert cache.get(key, tmp_path / "out" / "b.tif") is not None
+    assert (tmp_path / "out" / "b.tif").read_bytes() == b"x" * 10
+    # another policy is another entry
+    assert cache.key(source, POLICY.model_copy(update={"processing_args": ""})) != key
+
+
+def test_cache_evicts_the_least_recently_used(tmp_path: Path) -> None:
+    cache = ConversionCache(tmp_path / "cache", 25)
+    keys = []
+    for i in range(3):
+        key = cache.key(make_sfinfo(f"{i}.jpg", md5=f"{i}" * 32), POLICY)
+        cache.put(key, make_sfinfo(_output(tmp_path / "tmp", f"{i}.tif", 10), 10), "")
+        entry = tmp_path / "cache" / key[:2] / key / "entry.json"
+        os.utime(entry, (i, i))
+        keys.append(key)
+    assert cache.get(keys[0], tmp_path / "out" / "0.tif") is None
+    assert cache.get(keys[2], tmp_path / "out" / "2.tif") is not None
+    # the entries are scanned again when the cache is opened
+    assert ConversionCache(tmp_path / "cache", 25)._size == 20  # noqa: SLF001
+
+
+def test_file_handler_opens_the_cache_once(tmp_path: Path) -> None:
+    fh = FileHandler()
+    fh.config = {"cache": {"DIR": f"{tmp_path / 'cache'}", "MAX_GB": 1}}
+    assert fh._cache() is fh._cache()  # noqa: SLF001
+    fh = FileHandler()
+    fh.config = {"cache": {"DIR": "", "MAX_GB": 1}}
+    assert fh._cache() is None  # noqa: SLF001
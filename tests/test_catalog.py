@@ -0,0 +1,89 @@
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from fileidentification.definitions.catalog import Catalog
+from fileidentification.definitions.constants import FileState
+from fileidentification.definitions.models import BasicAnalytics, SfInfo
+from fileidentification.definitions.store import Store
+from tests.util import make_sfinfo
+
+Factory = Callable[[list[SfInfo]], Catalog]
+
+
+@pytest.fixture(params=["memory", "compact", "sqlite"])
+def catalog(request: pytest.FixtureRequest, tmp_path: Path) -> Factory:
+    if request.param == "sqlite":
+        return lambda sfinfos: Store(tmp_path / "_store.sqlite", sfinfos)
+    return lambda sfinfos: Catalog(sfinfos, compact=request.param == "compact")
+
+
+def _names(sfinfos: list[SfInfo]) -> list[str]:
+    return [f"{sfinfo.filename}" for sfinfo in sfinfos]
+
+
+def test_catalog_indexes_follow_updates(catalog: Factory) -> None:
+    stack = catalog(
+        [
+            make_sfinfo(f"{name}.mp4", puid=puid)
+            for name, puid in zip("abc", ["fmt/199", "fmt/5", "fmt/199"], strict=True)
+        ]
+    )
+    assert len(stack) == 3
+    assert _names(stack.with_puid("fmt/199")) == ["a.mp4", "c.mp4"]
+    b = stack.get("b.mp4")
+    assert b is not None
+    b.status.pending = True
+    stack.update(b)
+    assert _names(stack.select(FileState.PENDING)) == ["b.mp4"]
+    b.status.removed = True
+    stack.update(b)
+    assert _names(stack.select(FileState.ACTIVE)) == ["a.mp4", "c.mp4"]
+    assert _names(stack.select(FileState.REMOVED)) == ["b.mp4"]
+
+
+def test_catalog_links_converted_files(catalog: Factory) -> None:
+    stack = catalog([make_sfinfo("a.avi", puid="fmt/5")])
+    original = stack[0]
+    converted = make_sfinfo("a.mp4", derived_from=original)
+    stack.append(converted)
+    assert stack.parent(converted) is original
+    assert stack.derived(original) == [converted]
+
+
+def test_catalog_batches_while_the_state_changes(catalog: Factory) -> None:
+    stack = catalog([make_sfinfo(f"{i}.mp4", status={"pending": True}) for i in range(7)])
+    seen = []
+    for batch in stack.batches(FileState.PENDING, size=3, start=1):
+        for i, sfinfo in batch:
+            # a converted file is no longer pending, the next batch still starts after it
+            sfinfo.status.pending = False
+            stack.update(sfinfo)
+            seen.append(i)
+    assert seen == [1, 2, 3, 4, 5, 6]
+    assert _names(stack.select(FileState.PENDING)) == ["0.mp4"]
+
+
+def test_catalog_find_duplicates_hands_out_files_of_shared_sizes(
+    catalog: Factory, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    sfinfos = []
+    for name, data, puid in [("a", b"same", "fmt/43"), ("b", b"same", "fmt/43"), ("c", b"other", "fmt/43")]:
+        (tmp_path / name).write_bytes(data)
+        sfinfos.append(make_sfinfo(name, len(data), puid, path=tmp_path / name))
+    stack = catalog(sfinfos)
+    handed_out: list[str] = []
+    find_duplicates = BasicAnalytics.find_duplicates
+
+    def _find_duplicates(ba: BasicAnalytics, sfinfos: list[SfInfo], workers: int = 0) -> None:
+        handed_out.extend(_names(sfinfos))
+        find_duplicates(ba, sfinfos, workers)
+
+    monkeypatch.setattr(BasicAnalytics, "find_duplicates", _find_duplicates)
+    ba = BasicAnalytics()
+    stack.find_duplicates(ba)
+    assert handed_out == ["a", "b"]
+    assert list(ba.filehashes.values()) == [[Path("a"), Path("b")]]
+    # the md5s calculated on the way are indexed
+    assert _names(stack.with_md5(next(iter(ba.filehashes)))) == ["a", "b"]
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from fileidentification.definitions.constants import Bin, FPMsg
+from fileidentification.definitions.models import PolicyParams, SfInfo
+from fileidentification.tasks import conversion
+from fileidentification.tasks.cache import ConversionCache
+from fileidentification.tasks.conversion import Output, convert_files
+from fileidentification.wrappers.converter import target_path
+from tests.util import make_sfinfo
+
+POLICIES = {
+    "fmt/11": PolicyParams(bin=Bin.MAGICK, target_container="tif", expected=["fmt/353"]),
+    "fmt/199": PolicyParams(bin=Bin.FFMPEG, target_container="mkv", expected=["fmt/569"]),
+}
+
+
+def _sfinfo(folder: Path, name: str, puid: str, filesize: int) -> SfInfo:
+    sfinfo = make_sfinfo(name, filesize, puid, processed_as=puid, md5=f"{name:0>32}")
+    sfinfo.set_processing_paths(folder, folder / "_TMP", initial=False)
+    return sfinfo
+
+
+class _Converter:
+    """
+    stands in for converter.convert: counts the files converted at once per bin, writes the target.
+    verify stands in for verify_outputs, it records the batches
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.running: Counter[str] = Counter()
+        self.peak: Counter[str] = Counter()
+        self.started: list[str] = []
+        self.threads: dict[str, int] = {}
+        self.verified: list[list[str]] = []
+
+    def __call__(self, sfinfo: SfInfo, args: PolicyParams, threads: int = 0, **kwargs: Any) -> tuple[Path, str, str]:
+        with self.lock:
+            self.running[args.bin] += 1
+            self.peak[args.bin] = max(self.peak[args.bin], self.running[args.bin])
+            self.started.append(f"{sfinfo.filename}")
+            self.threads[f"{sfinfo.filename}"] = threads
+        time.sleep(0.02)
+        target = target_path(sfinfo, args)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(f"{sfinfo.filename}")
+        with self.lock:
+            self.running[args.bin] -= 1
+        return target, f"convert {sfinfo.filename}", ""
+
+    def verify(self, converted: list[tuple[SfInfo, PolicyParams, Output]], **kwargs: Any) -> list[SfInfo | None]:
+        self.verified.append([f"{sfinfo.filename}" for sfinfo, _, _ in converted])
+        return [make_sfinfo(target, processed_as=args.expected[0]) for _, args, (target, _) in converted]
+
+
+@pytest.fixture
+def converter(monkeypatch: pytest.MonkeyPatch) -> _Converter:
+    converter = _Converter()
+    monkeypatch.setattr(conversion, "convert", converter)
+    monkeypatch.setattr(conversion, "verify_outputs", converter.verify)
+    return converter
+
+
+def test_convert_files_limits_the_slots_per_bin(tmp_path: Path, converter: _Converter) -> None:
+    sfinfos = [_sfinfo(tmp_path, f"image_{i}.gif", "fmt/11", i) for i in range(8)]
+    sfinfos += [_sfinfo(tmp_path, f"video_{i}.mp4", "fmt/199", i) for i in range(3)]
+    converted = list(convert_files(sfinfos, POLICIES, {"magick": 3, "ffmpeg": 1}))
+    assert converter.peak == {Bin.MAGICK: 3, Bin.FFMPEG: 1}
+    # the cpus are split among the ffmpeg slots
+    assert converter.threads["video_0.mp4"] == os.cpu_count()
+    # yielded in the order of the files, with the command and the verified output
+    assert [(f"{sfinfo.filename}", cmds) for sfinfo, _, cmds in converted] == [
+        (f"{sfinfo.filename}", [f"convert {sfinfo.filename}"]) for sfinfo in sfinfos
+    ]
+    assert all(target and target.processed_as == "fmt/353" for _, target, _ in converted[:8])
+
+
+def test_convert_files_starts_the_smallest_files_first(tmp_path: Path, converter: _Converter) -> None:
+    sizes = [50, 10, 40, 20, 30]
+    sfinfos = [_sfinfo(tmp_path, f"video_{size}.mp4", "fmt/199", size) for size in sizes]
+    converted = list(convert_files(sfinfos, POLICIES, {"ffmpeg": 1}))
+    assert converter.started == [f"video_{size}.mp4" for size in sorted(sizes)]
+    assert [sfinfo for sfinfo, _, _ in converted] == sfinfos
+
+
+def test_convert_files_converts_duplicates_one_after_the_other(tmp_path: Path, converter: _Converter) -> None:
+    # the same name and md5 in two folders share their working dir
+    sfinfos = [_sfinfo(tmp_path, f"{folder}/video.mp4", "fmt/199", 1) for folder in "ab"]
+    list(convert_files(sfinfos, POLICIES, {"ffmpeg": 2}))
+    assert converter.peak == {Bin.FFMPEG: 1}
+
+
+def test_convert_files_verifies_in_batches_before_the_duplicates_take_the_cache(
+    tmp_path: Path, converter: _Converter, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(conversion, "VERIFY_BATCH", 3)
+    cache = ConversionCache(tmp_path / "cache", 1024**2)
+    # a, b and c are the same video under other names
+    duplicates = {"a.mp4", "b.mp4", "c.mp4"}
+    names = ["a.mp4", "x.mp4", "b.mp4", "y.mp4", "z.mp4", "c.mp4"]
+    sfinfos = [_sfinfo(tmp_path, name, "fmt/199", 1) for name in names]
+    for sfinfo in sfinfos:
+        if sfinfo.filename.name in duplicates:
+            sfinfo.md5 = "a" * 32
+    converted = list(convert_files(sfinfos, POLICIES, {"ffmpeg": 2}, cache=cache))
+    assert sorted(converter.started) == ["a.mp4", "x.mp4", "y.mp4", "z.mp4"]
+    # the batch of a is verified (and a put into the cache) before b starts, the outputs of a batch at once
+    assert converter.verified == [["a.mp4", "x.mp4"], ["y.mp4", "z.mp4"]]
+    for sfinfo, target, cmds in converted:
+        assert target is not None
+        assert target.filename.is_file()
+        if sfinfo.filename.name in duplicates - {"a.mp4"}:
+            assert cmds == ["convert a.mp4"]
+            assert target.processing_logs[-1].msg.startswith(FPMsg.CACHED)
+        else:
+            assert cmds == [f"convert {sfinfo.filename}"]
@@ -0,0 +1,19 @@
+import hashlib
+from pathlib import Path
+
+from benchmarks.corpus import generate
+
+
+def _digests(folder: Path) -> dict[str, str]:
+    return {
+        f"{file.relative_to(folder)}": hashlib.md5(file.read_bytes()).hexdigest()  # noqa: S324
+        for file in sorted(folder.rglob("*"))
+        if file.is_file()
+    }
+
+
+def test_same_seed_gives_the_same_corpus(tmp_path: Path) -> None:
+    first = _digests(generate(tmp_path / "first", scale=0.5, seed=3))
+    assert first
+    assert _digests(generate(tmp_path / "second", scale=0.5, seed=3)) == first
+    assert _digests(generate(tmp_path / "other", scale=0.5, seed=4)) != first
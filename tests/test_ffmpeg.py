@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import pytest
+
+from fileidentification.definitions.constants import DecodeMode
+from fileidentification.definitions.models import SfInfo
+from fileidentification.wrappers import ffmpeg
+from fileidentification.wrappers.ffmpeg import DecodeParams, Probe, ProbeStore, Window, _decode, _sampled, _seed
+from fileidentification.wrappers.process import Result
+from tests.util import make_sfinfo
+
+
+@pytest.fixture
+def probed(monkeypatch: pytest.MonkeyPatch) -> list[Path]:
+    """Replace ffprobe, returns the files it was called on"""
+    calls: list[Path] = []
+
+    def _ffprobe(file: Path) -> Probe:
+        calls.append(file)
+        return Probe(streams=[{"codec_name": "h264"}])
+
+    monkeypatch.setattr(ffmpeg, "_ffprobe", _ffprobe)
+    return calls
+
+
+def test_probe_store_probes_once(probed: list[Path]) -> None:
+    store = ProbeStore()
+    sfinfo = make_sfinfo("video.mp4", md5="abc", path=Path("video.mp4"))
+    assert store.get(sfinfo.path, sfinfo.md5).streams == [{"codec_name": "h264"}]
+    store.get(sfinfo.path, sfinfo.md5)
+    assert probed == [Path("video.mp4")]
+    # a changed file is probed again
+    store.get(sfinfo.path, "def")
+    assert len(probed) == 2
+
+
+def test_probe_store_evict(probed: list[Path]) -> None:
+    store = ProbeStore()
+    sfinfo = make_sfinfo("video.mp4", md5="abc", path=Path("video.mp4"))
+    store.get(sfinfo.path, sfinfo.md5)
+    store.evict(sfinfo)
+    store.get(sfinfo.path, sfinfo.md5)
+    assert len(probed) == 2
+
+
+def test_probe_store_keep(probed: list[Path]) -> None:
+    store = ProbeStore()
+    store.get(Path("out.mkv"), "abc", keep=False)
+    store.get(Path("out.mkv"), "abc", keep=False)
+    assert len(probed) == 2
+
+
+@pytest.mark.parametrize(("concurrency", "timeout"), [(0, 60.0), (2, 20.0), (6, 60.0)])
+def test_decode_segments_with_concurrency(monkeypatch: pytest.MonkeyPatch, concurrency: int, timeout: float) -> None:
+    calls: list[tuple[int, int, float | None]] = []
+
+    def run_all(argvs: list[list[str]], concurrency: int = 0, timeout: float | None = None, **_: str) -> list[Result]:
+        calls.append((len(argvs), concurrency, timeout))
+        return [Result(argv=argv, stderr="error\n") for argv in argvs]
+
+    monkeypatch.setattr(ffmpeg, "run_all", run_all)
+    params = DecodeParams(mode=DecodeMode.SEGMENTS, segments=6, budget=60, concurrency=concurrency)
+    errors, decoded = _decode(make_sfinfo("video.mp4"), 600.0, params)
+    # the segments run concurrency at a time, the budget is split among the rounds
+    assert calls == [(6, concurrency, timeout)]
+    assert errors == "error\n"
+    assert decoded == "decoded in 6 segments in parallel"
+
+
+def test_sampled_windows_differ_per_file_without_md5() -> None:
+    def windows(sfinfo: SfInfo) -> list[Window]:
+        return _sampled(600.0, 5.0, 4, _seed(sfinfo))
+
+    # the md5 is deferred: the windows are seeded with the filename and size
+    a, b = make_sfinfo("a.mp4", 1000), make_sfinfo("b.mp4", 1000)
+    assert windows(a) == windows(make_sfinfo("a.mp4", 1000))
+    assert windows(a) != windows(b)
+    assert windows(make_sfinfo("a.mp4", 1000, md5="0" * 32)) == windows(make_sfinfo("b.mp4", 2000, md5="0" * 32))
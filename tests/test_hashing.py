@@ -0,0 +1,58 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from fileidentification.wrappers import hashing
+from fileidentification.wrappers.hashing import BLOCK, find_duplicates, hash_file
+
+
+def _write(path: Path, data: bytes) -> Path:
+    path.write_bytes(data)
+    return path
+
+
+def _find(files: list[Path], known: dict[Path, str] | None = None) -> list[list[str]]:
+    known = known or {}
+    duplicates = find_duplicates(files, lambda f: f, lambda f: f.stat().st_size, lambda f: known.get(f, ""))
+    return sorted(sorted(f.name for f in group) for group in duplicates.values())
+
+
+def test_hash_file_digests(tmp_path: Path) -> None:
+    f = _write(tmp_path / "a", b"x" * (3 * BLOCK + 5))
+    digests = hash_file(f, ("md5", "sha256"))
+    assert digests == {
+        "md5": hashlib.md5(f.read_bytes()).hexdigest(),  # noqa: S324
+        "sha256": hashlib.sha256(f.read_bytes()).hexdigest(),
+    }
+
+
+@pytest.mark.parametrize("size", [10, 3 * BLOCK])
+def test_find_duplicates(tmp_path: Path, size: int) -> None:
+    data = b"a" * size
+    files = [
+        _write(tmp_path / "a", data),
+        _write(tmp_path / "b", data),
+        # same size, head and tail, differs in the middle
+        _write(tmp_path / "c", data[: size // 2] + b"b" + data[size // 2 + 1 :]),
+        _write(tmp_path / "d", data + b"a"),
+    ]
+    assert _find(files) == [["a", "b"]]
+
+
+@pytest.mark.parametrize("size", [10, 3 * BLOCK])
+def test_find_duplicates_known_md5(tmp_path: Path, size: int, monkeypatch: pytest.MonkeyPatch) -> None:
+    # one file with its md5 already known, its duplicate without
+    data = bytes(range(256)) * (size // 256 + 1)
+    files = [_write(tmp_path / "known", data), _write(tmp_path / "unknown", data)]
+    known = {files[0]: hashlib.md5(data).hexdigest()}  # noqa: S324
+    read: list[Path] = []
+
+    def _hash_file(path: Path, algorithms: tuple[str, ...] = ("md5",)) -> dict[str, str]:
+        read.append(path)
+        return {"md5": hashlib.md5(path.read_bytes()).hexdigest()}  # noqa: S324
+
+    monkeypatch.setattr(hashing, "hash_file", _hash_file)
+    assert _find(files, known) == [["known", "unknown"]]
+    # the file with the known md5 is never hashed completely
+    assert read == [files[1]]
@@ -0,0 +1,72 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from fileidentification.definitions.constants import FDMsg
+from fileidentification.definitions.models import LogTables, SfInfo
+from fileidentification.tasks.inspection import inspect_files
+from fileidentification.wrappers import imagemagick
+from fileidentification.wrappers.imagemagick import RS, US, _identify_batch, imagemagick_inspect_batch
+from fileidentification.wrappers.process import Result
+from tests.util import make_sfinfo
+
+SPECS = "PNG 1x1 1x1+0+0 8-bit srgb"
+
+
+def _record(file: Path, specs: str = SPECS) -> str:
+    return f"{file}{US}{specs}{RS}"
+
+
+class _Magick:
+    """stands in for process.run: answers the batch with output, a single file with its specs"""
+
+    def __init__(self, stdout: str = "", stderr: str = "") -> None:
+        self.stdout, self.stderr = stdout, stderr
+        self.calls: list[list[str]] = []
+
+    def __call__(self, argv: list[str], **kwargs: Any) -> Result:
+        self.calls.append(argv)
+        files = argv[4:]
+        if len(files) > 1:
+            return Result(argv=argv, returncode=0, stdout=self.stdout, stderr=self.stderr)
+        return Result(argv=argv, returncode=0, stdout=SPECS)
+
+
+def _sfinfo(folder: Path, name: str) -> SfInfo:
+    sfinfo = make_sfinfo(name, puid="fmt/11", processed_as="fmt/11")
+    sfinfo.matches[0]["mime"] = "image/png"
+    sfinfo.set_processing_paths(folder, folder / "_TMP", initial=False)
+    return sfinfo
+
+
+def test_the_output_is_split_per_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    single, frames = tmp_path / "a.jpg", tmp_path / "a.jpg.png"
+    # a record per frame, the warning about a.jpg.png is not taken for a.jpg
+    stdout = _record(single) + _record(frames, "PNG 1") + _record(frames, "PNG 2")
+    stderr = f"magick: corrupt image `{frames}' @ warning/png.c/MagickPNGWarningHandler/1526.\n"
+    monkeypatch.setattr(imagemagick, "run", _Magick(stdout, stderr))
+    assert _identify_batch([single, frames]) == {single: (SPECS, ""), frames: ("PNG 1PNG 2", stderr)}
+
+
+@pytest.mark.parametrize("cut", [-5, 1], ids=["in_a_record", "after_a_record"])
+def test_truncated_output_is_not_assigned(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, cut: int) -> None:
+    files = [tmp_path / f"{i}.png" for i in range(3)]
+    records = [_record(file) for file in files]
+    # the buffer of run keeps the head of the output, followed by its notice of the bytes not kept
+    kept = "".join(records)[:cut] if cut < 0 else "".join(records[:cut])
+    stdout = f"{kept}\n[... 100 bytes of output not kept]\n"
+    monkeypatch.setattr(imagemagick, "run", _Magick(stdout))
+    assert _identify_batch(files) == {}
+    assert imagemagick_inspect_batch([_sfinfo(tmp_path, f"{i}.png") for i in range(3)]) == [None] * 3
+
+
+def test_a_batch_that_is_not_assigned_is_probed_one_by_one(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    sfinfos = [_sfinfo(tmp_path, f"{i}.png") for i in range(3)]
+    magick = _Magick(f"{_record(sfinfos[0].path)}\n[... 100 bytes of output not kept]\n")
+    monkeypatch.setattr(imagemagick, "run", magick)
+    log_tables = LogTables()
+    inspect_files(sfinfos, {}, log_tables, verbose=False, limits={"magick": 1}, batch=3)
+    assert [argv[4:] for argv in magick.calls] == [[f"{s.path}" for s in sfinfos]] + [[f"{s.path}"] for s in sfinfos]
+    assert [s.media_info[0].msg for s in sfinfos] == [SPECS] * 3
+    assert not log_tables.diagnostics.get(FDMsg.ERROR.name)
@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import Counter
+from typing import Any
+
+import pytest
+
+from fileidentification.definitions.constants import FDMsg
+from fileidentification.definitions.models import LogTables, SfInfo
+from fileidentification.tasks import inspection
+from fileidentification.tasks.inspection import FFMPEG_VERBOSE, OTHER, inspect_files
+from tests.util import make_sfinfo
+
+MIMES = {"image": "image/png", "video": "video/mp4", "other": "application/pdf"}
+
+
+def _sfinfo(name: str, kind: str) -> SfInfo:
+    return make_sfinfo(f"{name}", matches=[{"id": "fmt/11", "mime": MIMES[kind], "warning": ""}])
+
+
+class _Probes:
+    """stands in for inspect_file: counts the files probed at once per bin, logs a diagnostic per file"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.running: Counter[str] = Counter()
+        self.peak: Counter[str] = Counter()
+        self.events: list[str] = []
+
+    def __call__(self, sfinfo: SfInfo, policies: Any, log_tables: LogTables, verbose: bool, *args: Any) -> None:
+        kind = sfinfo.matches[0]["mime"].split("/")[0]
+        with self.lock:
+            self.running[kind] += 1
+            self.peak[kind] = max(self.peak[kind], self.running[kind])
+            self.events.append(f"start {sfinfo.filename}")
+        time.sleep(0.05)
+        with self.lock:
+            self.running[kind] -= 1
+            self.events.append(f"end {sfinfo.filename}")
+        log_tables.diagnostics_add(sfinfo, FDMsg.ERROR)
+
+
+@pytest.fixture
+def probes(monkeypatch: pytest.MonkeyPatch) -> _Probes:
+    probes = _Probes()
+    monkeypatch.setattr(inspection, "inspect_file", probes)
+    return probes
+
+
+def test_inspect_files_limits_every_pool(probes: _Probes) -> None:
+    sfinfos = [_sfinfo(f"{kind}_{i}", kind) for i in range(6) for kind in MIMES]
+    log_tables = LogTables()
+    limits = {"magick": 3, "ffmpeg": 1, FFMPEG_VERBOSE: 2, OTHER: 2}
+    inspect_files(sfinfos, {}, log_tables, verbose=True, limits=limits)
+    assert probes.peak == {"image": 3, "video": 2, "application": 2}
+    # the logs of the files are merged in the order of the files, not in the order they finished
+    assert log_tables.diagnostics[FDMsg.ERROR.name] == sfinfos
+
+
+def test_inspect_files_pools_run_side_by_side(probes: _Probes) -> None:
+    # a single slot per pool: the images are not held up by the videos
+    sfinfos = [_sfinfo(f"video_{i}", "video") for i in range(4)] + [_sfinfo("image", "image")]
+    inspect_files(sfinfos, {}, LogTables(), verbose=False, limits={"magick": 1, "ffmpeg": 1})
+    assert probes.peak == {"video": 1, "image": 1}
+    assert probes.events.index("start image") < probes.events.index("end video_3")
@@ -0,0 +1,87 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from fileidentification.wrappers import libav
+from fileidentification.wrappers.ffmpeg import _ffprobe, _probe_output
+
+av = pytest.importorskip("av", reason="the libav bindings (optional dependency 'libav') are not installed")
+
+# what ffprobe -show_error -show_entries STREAM_ENTRIES -output_format json returns for the file of media()
+FFPROBE = {
+    "streams": [
+        {
+            "index": 0,
+            "codec_name": "ffv1",
+            "codec_long_name": "FFmpeg video codec #1",
+            "codec_tag": "0x0000",
+            "coded_width": 64,
+            "coded_height": 48,
+            "pix_fmt": "yuv420p",
+            "r_frame_rate": "25/1",
+        },
+        {
+            "index": 1,
+            "codec_name": "flac",
+            "codec_long_name": "FLAC (Free Lossless Audio Codec)",
+            "codec_tag": "0x0000",
+            "channels": 2,
+            "channel_layout": "stereo",
+            "r_frame_rate": "0/0",
+        },
+    ],
+    "format": {"duration": "1.000000"},
+}
+
+
+@pytest.fixture
+def media(tmp_path: Path) -> Path:
+    """Write a second of black ffv1 video and silent flac audio into a mkv"""
+    path = tmp_path / "media.mkv"
+    with av.open(f"{path}", "w") as container:
+        video = container.add_stream("ffv1", rate=25)
+        video.width, video.height, video.pix_fmt = 64, 48, "yuv420p"
+        audio = container.add_stream("flac", rate=8000, layout="stereo")
+        for i in range(25):
+            frame = av.VideoFrame(64, 48, "yuv420p")
+            frame.pts = i
+            container.mux(video.encode(_silent(frame)))
+        container.mux(video.encode())
+        for i in range(8):
+            samples = av.AudioFrame(format="s16", layout="stereo", samples=1000)
+            samples.sample_rate, samples.pts = 8000, i * 1000
+            container.mux(audio.encode(_silent(samples)))
+        container.mux(audio.encode())
+    return path
+
+
+def _silent[T](frame: T) -> T:
+    """Zero the planes of the frame, they are allocated without"""
+    for plane in frame.planes:  # type: ignore[attr-defined]
+        plane.update(bytes(plane.buffer_size))
+    return frame
+
+
+@pytest.fixture
+def invalid(tmp_path: Path) -> Path:
+    path = tmp_path / "invalid.mkv"
+    path.write_text("not a matroska file")
+    return path
+
+
+def test_probe_returns_the_entries_of_ffprobe(media: Path) -> None:
+    assert libav.probe(media) == FFPROBE
+
+
+def test_probe_returns_the_error_of_ffprobe(invalid: Path) -> None:
+    # AVERROR_INVALIDDATA, as ffprobe reports it
+    assert libav.probe(invalid) == {
+        "error": {"code": -1094995529, "string": "Invalid data found when processing input"}
+    }
+
+
+@pytest.mark.skipif(shutil.which("ffprobe") is None, reason="ffprobe is not installed")
+def test_probe_matches_ffprobe(media: Path, invalid: Path) -> None:
+    for path in (media, invalid):
+        assert _probe_output(libav.probe(path)) == _ffprobe(path)
@@ -0,0 +1,48 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from fileidentification.tasks.logfile import LogAppender, export_json, read_errors, read_log, write_log
+from tests.util import make_sfinfo
+
+
+@pytest.fixture(params=[".jsonl", ".jsonl.gz"])
+def log(request: pytest.FixtureRequest, tmp_path: Path) -> Path:
+    return tmp_path / f"_log{request.param}"
+
+
+def test_read_log_last_record_wins_in_stack_order(log: Path) -> None:
+    stack = [make_sfinfo(f"{name}.mp4") for name in "abc"]
+    write_log(log, stack, None)
+    with LogAppender(log) as appender:
+        # the files finish processing out of order, b twice
+        stack[2].processed_as = "fmt/569"
+        appender.append(2, stack[2])
+        stack[1].status.pending = True
+        appender.append(1, stack[1])
+        stack[1].status.pending, stack[1].status.added = False, True
+        appender.append(1, stack[1])
+    files = list(read_log(log))
+    assert [f"{sfinfo.filename}" for sfinfo in files] == ["a.mp4", "b.mp4", "c.mp4"]
+    assert files[1].status.added
+    assert not files[1].status.pending
+    assert files[2].processed_as == "fmt/569"
+
+
+def test_write_log_compacts(log: Path) -> None:
+    stack = [make_sfinfo("a.mp4"), make_sfinfo("b.mp4")]
+    write_log(log, stack, [make_sfinfo("broken.mp4")])
+    with LogAppender(log) as appender:
+        appender.append(0, stack[0])
+    write_log(log, read_log(log), [make_sfinfo("broken.mp4")])
+    opener = gzip.open if log.suffix == ".gz" else open
+    with opener(log, "rt") as f:
+        assert len(f.readlines()) == 3
+    assert [error["filename"] for error in read_errors(log)] == ["broken.mp4"]
+
+
+def test_export_json(log: Path, tmp_path: Path) -> None:
+    write_log(log, [make_sfinfo("a.mp4")], None)
+    export_json(log, tmp_path / "_log.json")
+    assert '"filename": "a.mp4"' in (tmp_path / "_log.json").read_text()
@@ -0,0 +1,90 @@
+import json
+import re
+from pathlib import Path
+
+from fileidentification.definitions.metrics import BUCKETS, PREFIX, PUID, Metrics
+
+
+def _metrics() -> Metrics:
+    metrics = Metrics()
+    metrics.observe("task", 0.003, 100, task="hash", puid="fmt/43")
+    metrics.observe("task", 0.003, 50, task="hash", puid="fmt/43")
+    metrics.observe("task", 2.0, 1000, task="hash", puid="fmt/43")
+    metrics.observe("tool", 4000.0, bin="ffmpeg", puid='fmt/"1"')
+    return metrics
+
+
+def _samples(text: str) -> dict[str, float]:
+    """Return the value of every sample line of the textfile by its name and labels"""
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_to_json() -> None:
+    data = json.loads(_metrics().to_json())
+    assert data["buckets"] == list(BUCKETS)
+    [task] = data["metrics"]["task"]
+    assert task["labels"] == {"task": "hash", "puid": "fmt/43"}
+    assert (task["count"], task["bytes"]) == (3, 1150)
+    assert task["seconds"] == 2.006
+    # 0.003 falls into the bucket up to 0.005, 2.0 into the one up to 5.0
+    assert task["buckets"][BUCKETS.index(0.005)] == 2
+    assert task["buckets"][BUCKETS.index(5.0)] == 1
+    # above the largest bound
+    assert data["metrics"]["tool"][0]["buckets"][-1] == 1
+
+
+def test_to_prometheus() -> None:
+    text = _metrics().to_prometheus()
+    samples = _samples(text)
+    labels = 'task="hash",puid="fmt/43"'
+    bucket = f"{PREFIX}_task_seconds_bucket"
+    # the buckets are cumulative, +Inf is the count
+    assert samples[f'{bucket}{{{labels},le="0.001"}}'] == 0
+    assert samples[f'{bucket}{{{labels},le="0.005"}}'] == 2
+    assert samples[f'{bucket}{{{labels},le="1.0"}}'] == 2
+    assert samples[f'{bucket}{{{labels},le="5.0"}}'] == 3
+    assert samples[f'{bucket}{{{labels},le="+Inf"}}'] == 3
+    assert samples[f"{PREFIX}_task_seconds_count{{{labels}}}"] == 3
+    assert samples[f"{PREFIX}_task_seconds_sum{{{labels}}}"] == 2.006
+    assert samples[f"{PREFIX}_task_bytes_total{{{labels}}}"] == 1150
+    # the quotes in the labels are escaped
+    assert samples[f'{PREFIX}_tool_seconds_count{{bin="ffmpeg",puid="fmt/\\"1\\""}}'] == 1
+    assert f"# TYPE {PREFIX}_task_seconds histogram" in text
+    assert f"# TYPE {PREFIX}_task_bytes_total counter" in text
+    # every sample line is name{labels} value
+    assert all(re.fullmatch(r"[a-z_]+(\{.*\})? [0-9.e+]+", line) for line in text.splitlines() if line[0] != "#")
+
+
+def test_time_labels_the_calls_with_the_puid() -> None:
+    metrics = Metrics()
+    with metrics.time("task", 10, task="inspect", puid="fmt/11"):
+        assert PUID.get() == "fmt/11"
+        metrics.observe("tool", 0.1, bin="magick", puid=PUID.get())
+    assert PUID.get() == ""
+
+    @metrics.timed("stage", stage="convert")
+    def convert() -> str:
+        return "done"
+
+    assert convert() == "done"
+    snapshot = metrics.snapshot()
+    assert [s.labels for s in snapshot["tool"]] == [{"bin": "magick", "puid": "fmt/11"}]
+    assert [(s.labels, s.count) for s in snapshot["stage"]] == [({"stage": "convert"}, 1)]
+
+
+def test_write(tmp_path: Path) -> None:
+    metrics = _metrics()
+    prom = tmp_path / "textfiles" / "fileidentification.prom"
+    metrics.write(tmp_path / "metrics.json", prom)
+    metrics.observe("stage", 1.0, stage="inspect")
+    metrics.write(tmp_path / "metrics.json", prom)
+    assert "stage" in json.loads((tmp_path / "metrics.json").read_text())["metrics"]
+    assert f"{PREFIX}_stage_seconds_count" in prom.read_text()
+    # the textfile is replaced, nothing is left behind for the collector to read
+    assert [path.name for path in prom.parent.iterdir()] == [prom.name]
+    assert prom.stat().st_mode & 0o777 == 0o644
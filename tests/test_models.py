@@ -0,0 +1,17 @@
+from pathlib import Path
+
+from fileidentification.definitions.models import BasicAnalytics
+from tests.util import make_sfinfo
+
+
+def test_find_duplicates_only_files_with_a_puid(tmp_path: Path) -> None:
+    sfinfos = []
+    for name, puid in [("a.jpg", "fmt/43"), ("b.tif", "fmt/353"), ("c.bin", "UNKNOWN")]:
+        (tmp_path / name).write_bytes(b"same")
+        sfinfos.append(make_sfinfo(name, 4, puid, path=tmp_path / name))
+    ba = BasicAnalytics()
+    ba.find_duplicates(sfinfos)
+    assert sfinfos[2].processed_as is None
+    assert list(ba.filehashes.values()) == [[Path("a.jpg"), Path("b.tif")]]
+    # the md5 calculated on the way is kept
+    assert sfinfos[0].md5 == sfinfos[1].md5 != ""
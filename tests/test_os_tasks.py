@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from fileidentification.definitions.catalog import Catalog
+from fileidentification.definitions.models import FileIndex, Shard
+from fileidentification.tasks.os_tasks import build_index, diff_index, scan_folder
+from tests.util import make_sfinfo
+
+
+def _collection(root: Path) -> None:
+    for name in ("a/one.txt", "a/two.txt", "b/c/three.txt", "top.txt"):
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(name)
+
+
+def _index(root: Path, paths: list[str]) -> FileIndex:
+    stack = Catalog([make_sfinfo(root / path) for path in paths])
+    for sfinfo in stack:
+        sfinfo.set_processing_paths(root, root / "_TMP", initial=True)
+        stack.update(sfinfo)
+    return build_index(stack)
+
+
+def test_scan_folder_and_build_index_agree(tmp_path: Path) -> None:
+    _collection(tmp_path)
+    current = scan_folder(tmp_path)
+    assert sorted(current) == ["a/one.txt", "a/two.txt", "b/c/three.txt", "top.txt"]
+    # a file of the stack that is gone is not indexed
+    index = _index(tmp_path, [*current, "gone.txt"])
+    assert index.files == current
+    assert not diff_index(index, current)
+
+
+def test_scan_folder_of_a_shard(tmp_path: Path) -> None:
+    _collection(tmp_path)
+    shards = [scan_folder(tmp_path, Shard(index=index, count=2)) for index in (1, 2)]
+    assert sorted([*shards[0], *shards[1]]) == sorted(scan_folder(tmp_path))
+    assert not set(shards[0]) & set(shards[1])
+
+
+def test_diff_index(tmp_path: Path) -> None:
+    _collection(tmp_path)
+    index = _index(tmp_path, list(scan_folder(tmp_path)))
+    (tmp_path / "new.txt").write_text("new")
+    (tmp_path / "a/one.txt").rename(tmp_path / "b/one.txt")
+    (tmp_path / "a/two.txt").write_text("changed content")
+    (tmp_path / "top.txt").unlink()
+    (tmp_path / "b/c/three.txt").rename(tmp_path / "three.txt")
+    # the same content as the moved file, but another inode: it is a new file
+    (tmp_path / "b/c/renamed.txt").write_text("b/c/three.txt")
+    diff = diff_index(index, scan_folder(tmp_path))
+    assert diff.new == ["b/c/renamed.txt", "new.txt"]
+    assert diff.changed == ["a/two.txt"]
+    assert diff.moved == {"a/one.txt": "b/one.txt", "b/c/three.txt": "three.txt"}
+    assert diff.deleted == ["top.txt"]
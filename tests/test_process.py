@@ -0,0 +1,125 @@
+import resource
+import signal
+import sys
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from fileidentification.definitions.constants import FDMsg, FPMsg
+from fileidentification.definitions.models import LogTables
+from fileidentification.tasks import inspection
+from fileidentification.tasks.inspection import inspect_file
+from fileidentification.wrappers.process import (
+    WATCHDOG,
+    LimitExceededError,
+    Limits,
+    ToolNotFoundError,
+    Watchdog,
+    run,
+    run_all,
+)
+from tests.util import make_sfinfo
+
+
+def test_run_captures_the_output() -> None:
+    res = run([sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"])
+    assert (res.returncode, res.stdout, res.stderr) == (3, "out\n", "err\n")
+
+
+def test_run_all_in_order() -> None:
+    results = run_all([[sys.executable, "-c", f"print({i})"] for i in range(4)], concurrency=2)
+    assert [res.stdout for res in results] == ["0\n", "1\n", "2\n", "3\n"]
+
+
+def test_run_a_missing_tool_raises() -> None:
+    with pytest.raises(ToolNotFoundError, match="not-a-tool"):
+        run(["not-a-tool", "file.mp4"])
+
+
+def test_a_missing_tool_does_not_remove_the_file(monkeypatch: pytest.MonkeyPatch) -> None:
+    def _content_errors(*_: object) -> bool:
+        run(["not-a-tool", "video.mp4"])
+        return True
+
+    monkeypatch.setattr(inspection, "_content_errors", _content_errors)
+    removed: list[str] = []
+    monkeypatch.setattr(inspection, "remove", lambda sfinfo, _: removed.append(f"{sfinfo.filename}"))
+    sfinfo = make_sfinfo("video.mp4")
+    log_tables = LogTables()
+    inspect_file(sfinfo, {}, log_tables, verbose=False)
+    assert removed == []
+    assert not sfinfo.status.removed
+    assert log_tables.diagnostics[FDMsg.NOTFOUND.name] == [sfinfo]
+    assert sfinfo.processing_logs[-1].msg.startswith(f"{FPMsg.NOTFOUND} not-a-tool")
+
+
+def _running(pid: int, wait: float = 1.0) -> bool:
+    """
+    Return whether the process still runs after up to wait seconds, a zombie that is not reaped yet is gone.
+    a SIGKILL is only delivered when the process is scheduled next, it is not gone when kill returns
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            if Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0] == "Z":
+                return False
+        except FileNotFoundError:
+            return False
+        if time.monotonic() > deadline:
+            return True
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def watchdog() -> Iterator[Watchdog]:
+    yield WATCHDOG
+    WATCHDOG.configure({})
+
+
+def test_run_stops_the_call_after_the_timeout() -> None:
+    res = run([sys.executable, "-c", "import time; print('started', flush=True); time.sleep(30)"], timeout=0.5)
+    assert res.timed_out
+    assert res.returncode is None
+    assert res.stdout == "started\n"
+
+
+def test_the_watchdog_timeout_raises(watchdog: Watchdog) -> None:
+    watchdog.configure({"tool": Limits(timeout=0.5)})
+    with pytest.raises(LimitExceededError, match=r"stopped after the timeout of 0\.5s"):
+        run([sys.executable, "-c", "import time; time.sleep(30)"], pbin="tool")
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="the processes are read from /proc")
+def test_the_processes_left_behind_are_killed() -> None:
+    res = run(["sh", "-c", "sleep 30 & echo $!"])
+    assert res.returncode == 0
+    assert not _running(int(res.stdout))
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="the rlimits are only set on linux")
+def test_the_rlimits_are_set_before_the_program_runs(watchdog: Watchdog) -> None:
+    watchdog.configure({"tool": Limits(memory=512, cpu=20)})
+    code = "import resource; print(*resource.getrlimit(resource.RLIMIT_AS), *resource.getrlimit(resource.RLIMIT_CPU))"
+    res = run([sys.executable, "-c", code], pbin="tool")
+    assert res.stdout.split() == [f"{512 * 1024**2}"] * 2 + ["20", "21"]
+    # the calls of the other bins have no limits
+    assert run([sys.executable, "-c", code]).stdout.split()[0] == f"{resource.RLIM_INFINITY}"
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="the rlimits are only set on linux")
+def test_the_cpu_limit_raises(watchdog: Watchdog) -> None:
+    watchdog.configure({"tool": Limits(cpu=1)})
+    with pytest.raises(LimitExceededError, match="exceeded the cpu limit of 1s"):
+        run([sys.executable, "-c", "while True: pass"], pbin="tool")
+
+
+def test_a_crash_is_not_taken_for_the_memory_limit() -> None:
+    limits = Limits(memory=512)
+    assert limits.exceeded(-signal.SIGSEGV, "Segmentation fault") == ""
+    assert limits.exceeded(1, "Cannot allocate memory") == ""
+    assert limits.exceeded(-signal.SIGABRT, "terminate called after throwing an instance of 'std::bad_alloc'")
+    assert limits.exceeded(-signal.SIGSEGV, "av_malloc: Cannot allocate memory")
+    # without a memory limit it is a crash like any other
+    assert Limits().exceeded(-signal.SIGSEGV, "Cannot allocate memory") == ""
@@ -0,0 +1,102 @@
+import json
+import shutil
+from pathlib import Path
+from typing import Any
+
+import pytest
+import toml
+
+from fileidentification.definitions.constants import ShardSplit
+from fileidentification.definitions.models import FilePaths, Shard
+from fileidentification.filehandling import FileHandler
+from fileidentification.tasks.os_tasks import set_filepaths
+
+REPO = Path(__file__).parent.parent
+PATHS = [f"{folder}/file_{i}.txt" for folder in ("a", "a/b", "c", "d/e", "f") for i in range(3)] + ["top.txt"]
+
+
+def test_shard_validation() -> None:
+    assert Shard(index=2, count=4).tag == "shard-2-of-4"
+    for index, count in ((0, 2), (3, 2)):
+        with pytest.raises(ValueError, match="validation error"):
+            Shard(index=index, count=count)
+
+
+@pytest.mark.parametrize("split", list(ShardSplit))
+def test_every_file_is_in_one_shard(split: ShardSplit) -> None:
+    shards = [Shard(index=index, count=3, split=split) for index in range(1, 4)]
+    for path in PATHS:
+        assert sum(shard.owns(path) for shard in shards) == 1
+    for shard in shards:
+        # converted and renamed files (with the md5 if the name is taken) stay with their original
+        assert shard.owns("a/file_0.txt") == shard.owns("a/file_0.tif") == shard.owns("a/file_0_0a1b2c_3d4e5f.tif")
+        # with split subtree, the files below the first folder stay together
+        if split == ShardSplit.SUBTREE:
+            assert shard.owns("a/file_0.txt") == shard.owns("a/b/file_1.txt")
+
+
+def test_a_flat_collection_is_split() -> None:
+    shards = [Shard(index=index, count=3) for index in range(1, 4)]
+    owned = [sum(shard.owns(f"file_{i}.txt") for i in range(30)) for shard in shards]
+    assert sum(owned) == 30
+    assert all(owned)
+
+
+def test_set_filepaths_tags_the_shard(tmp_path: Path) -> None:
+    fp = FilePaths()
+    set_filepaths(fp, _config(), tmp_path / "collection", Shard(index=1, count=2))
+    assert fp.LOG_J.name == "collection_log.shard-1-of-2.json"
+    assert fp.POLICIES_J.name == "collection_policies.shard-1-of-2.json"
+
+
+def _config() -> dict[str, Any]:
+    config: dict[str, Any] = toml.load(REPO / "appconfig.toml")
+    config["policies"]["DEFAULTPOLICIES"] = f"{REPO / 'fileidentification/definitions/default_policies.json'}"
+    return config
+
+
+def _run(root_folder: Path, **params: Any) -> FileHandler:
+    fh = FileHandler()
+    fh.config = _config()
+    with pytest.raises(SystemExit) as exit_info:
+        fh.run(root_folder, inspect=False, apply=False, remove_tmp=False, **params)
+    assert not exit_info.value.code
+    return fh
+
+
+def _log(root_folder: Path, tag: str = "") -> dict[str, Any]:
+    log: dict[str, Any] = json.loads(Path(f"{root_folder}_log{tag}.json").read_text())
+    return log
+
+
+def _files(log: dict[str, Any]) -> list[tuple[str, str, str]]:
+    """Return the files of the log with their md5 and format, the filenames are relative to the root folder"""
+    return sorted((sfinfo["filename"], sfinfo["md5"], sfinfo["processed_as"]) for sfinfo in log["files"])
+
+
+def test_merged_shards_match_a_single_run(tmp_path: Path) -> None:
+    collection = tmp_path / "collection"
+    for i, path in enumerate(PATHS):
+        (collection / path).parent.mkdir(parents=True, exist_ok=True)
+        (collection / path).write_text(f"content of file {i}\n")
+    # top.txt is in the other shard than a/file_0.txt, the duplicates are found across the shards
+    (collection / "top.txt").write_text("content of file 0\n")
+    single = tmp_path / "single"
+    shutil.copytree(collection, single)
+    _run(single)
+    for index in (1, 2):
+        _run(collection, shard=f"{index}/2")
+    fh = _run(collection, merge=2)
+    assert [sorted(f"{path}" for path in paths) for paths in fh.ba.filehashes.values()] == [["a/file_0.txt", "top.txt"]]
+    merged = _log(collection)
+    assert _files(merged) == _files(_log(single))
+    # every file was handled by one of the shards, their logs are merged in the order of the shards
+    shards = [_log(collection, f".shard-{index}-of-2") for index in (1, 2)]
+    assert all(log["files"] for log in shards)
+    assert [sfinfo["filename"] for sfinfo in merged["files"]] == [
+        sfinfo["filename"] for log in shards for sfinfo in log["files"]
+    ]
+    # the merge is deterministic
+    first = Path(f"{collection}_log.json").read_bytes()
+    _run(collection, merge=2)
+    assert Path(f"{collection}_log.json").read_bytes() == first
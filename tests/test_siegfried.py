@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from fileidentification.definitions.constants import HashAlg, SfBackend
+from fileidentification.wrappers import siegfried
+from fileidentification.wrappers.hashing import hash_file
+from fileidentification.wrappers.siegfried import SiegfriedError, _parse_stream, identify_batch, sf_identify
+
+FILES = [
+    {"filename": "a/café.txt", "filesize": 3, "matches": [{"id": "x-fmt/111"}]},
+    {"filename": "b/[1].pdf", "filesize": 10, "matches": [{"id": "fmt/276"}]},
+]
+DOCUMENT = json.dumps({"siegfried": "1.11.1", "identifiers": [{"name": "pronom"}], "files": FILES}, indent=1)
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 64 * 1024])
+def test_parse_stream_yields_every_file(monkeypatch: pytest.MonkeyPatch, chunk: int) -> None:
+    # small chunks split the objects and the multibyte characters between reads
+    monkeypatch.setattr(siegfried, "CHUNK", chunk)
+    assert list(_parse_stream(io.BytesIO(DOCUMENT.encode()))) == FILES
+
+
+def test_parse_stream_without_files() -> None:
+    assert list(_parse_stream(io.BytesIO(b'{"siegfried": "1.11.1", "files": []}'))) == []
+
+
+def _fake_sf(folder: Path, output: str, stderr: str = "", returncode: int = 0) -> None:
+    """Put an sf on the PATH that writes output and stderr and exits with returncode"""
+    script = folder / "sf"
+    script.write_text(f"#!/bin/sh\ncat <<'EOF'\n{output}\nEOF\necho '{stderr}' >&2\nexit {returncode}\n")
+    script.chmod(0o755)
+
+
+def test_sf_identify_maps_the_filenames(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    root = tmp_path / "root"
+    files = [{**file, "filename": f"{root.absolute()}/{file['filename']}"} for file in FILES]
+    _fake_sf(tmp_path, json.dumps({"files": files}))
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    assert [metadata["filename"] for metadata in sf_identify(root)] == [f"{root}/a/café.txt", f"{root}/b/[1].pdf"]
+
+
+def test_sf_identify_raises_if_sf_fails(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    root = tmp_path / "root"
+    # sf stopped after the first file
+    partial = json.dumps({"files": [{**FILES[0], "filename": f"{root.absolute()}/a/café.txt"}]})[:-2]
+    _fake_sf(tmp_path, partial, stderr="open b: permission denied", returncode=1)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    scan = sf_identify(root)
+    assert next(scan)["filename"] == f"{root}/a/café.txt"
+    with pytest.raises(SiegfriedError, match="sf exited with 1 \\(open b: permission denied\\)"):
+        next(scan)
+
+
+# stands in for sf -json -hash md5 DIR: lists the files of DIR with a fixed md5, logs its calls, fails with SF_FAIL
+SCANNING_SF = """\
+import json, os, sys
+from pathlib import Path
+
+with open(os.environ["SF_CALLS"], "a") as calls:
+    calls.write(" ".join(sys.argv[1:]) + "\\n")
+if os.environ.get("SF_FAIL"):
+    sys.exit(os.environ["SF_FAIL"])
+files = [
+    {"filename": f"{path}", "filesize": path.stat().st_size, "modified": "", "errors": "", "md5": "f" * 32,
+     "matches": [{"id": "fmt/353", "warning": ""}]}
+    for path in sorted(Path(sys.argv[-1]).rglob("*")) if path.is_file()
+]
+print(json.dumps({"files": files}))
+"""
+
+
+@pytest.fixture
+def sf_calls(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Put the sf of SCANNING_SF on the PATH, returns the file its calls are logged to"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "sf").write_text(f"#!{sys.executable}\n{SCANNING_SF}")
+    (bin_dir / "sf").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("SF_CALLS", f"{tmp_path / 'calls'}")
+    return tmp_path / "calls"
+
+
+def _outputs(folder: Path) -> list[Path]:
+    """Two outputs of the same name in their working dirs and another one"""
+    files = [folder / "a_1" / "a.tif", folder / "b_2" / "a.tif", folder / "c_3" / "c.tif"]
+    for i, file in enumerate(files):
+        file.parent.mkdir(parents=True)
+        file.write_text(f"{i}")
+    return files
+
+
+def test_identify_batch_scans_the_files_with_one_call(tmp_path: Path, sf_calls: Path) -> None:
+    files = _outputs(tmp_path / "tmp")
+    sfinfos = identify_batch(files, SfBackend.SF, multi=2)
+    assert sf_calls.read_text().count("\n") == 1
+    assert "-hash md5" in sf_calls.read_text()
+    # in the order of the files, with their paths and the md5 of sf
+    assert [(sfinfo.filename, sfinfo.filesize, sfinfo.md5) for sfinfo in sfinfos] == [
+        (file, 1, "f" * 32) for file in files
+    ]
+    assert [sfinfo.processed_as for sfinfo in sfinfos] == ["fmt/353"] * 3
+    # the folder with the links is removed
+    assert sorted(path.name for path in (tmp_path / "tmp").iterdir()) == ["a_1", "b_2", "c_3"]
+
+
+def test_identify_batch_identifies_one_by_one_if_sf_fails(
+    tmp_path: Path, sf_calls: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    files = _outputs(tmp_path / "tmp")
+    monkeypatch.setenv("SF_FAIL", "open: permission denied")
+    sfinfos = identify_batch(files, SfBackend.SF)
+    assert sf_calls.read_text().count("\n") == 1
+    # identified with pygfried and hashed
+    assert [(sfinfo.filename, sfinfo.md5) for sfinfo in sfinfos] == [
+        (file, hash_file(file)[HashAlg.MD5]) for file in files
+    ]
+
+
+def test_identify_batch_with_pygfried(tmp_path: Path, sf_calls: Path) -> None:
+    files = _outputs(tmp_path / "tmp")
+    assert [sfinfo.filename for sfinfo in identify_batch(files)] == files
+    assert not sf_calls.exists()
@@ -0,0 +1,109 @@
+import os
+import signal
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+
+from fileidentification.wrappers import soffice
+from fileidentification.wrappers.process import LimitExceededError
+from fileidentification.wrappers.soffice import SofficeWorker
+
+# stands in for soffice_worker.py: it starts a "LibreOffice" (a sleep) and writes its pid into the profile,
+# converts by copying the input and hangs on the inputs named hang
+FAKE_WORKER = textwrap.dedent(
+    """
+    import json, shutil, subprocess, sys, time
+    from pathlib import Path
+    from urllib.parse import urlparse
+
+    profile = Path(urlparse(sys.argv[2]).path)
+    profile.mkdir(parents=True)
+    office = subprocess.Popen(["sleep", "60"])
+    (profile / "soffice.pid").write_text(str(office.pid))
+    print(json.dumps({"ok": True}), flush=True)
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request["cmd"] == "quit":
+            office.kill()
+            break
+        if request["cmd"] == "convert":
+            if Path(request["input"]).name == "hang":
+                time.sleep(60)
+            shutil.copyfile(request["input"], request["output"])
+            print(json.dumps({"ok": True, "filter": "copy"}), flush=True)
+        else:
+            print(json.dumps({"ok": True}), flush=True)
+    """
+)
+
+
+def _running(pid: int, wait: float = 1.0) -> bool:
+    """
+    Return whether the process still runs after up to wait seconds, a zombie that is not reaped yet is gone.
+    a SIGKILL is only delivered when the process is scheduled next, it is not gone when kill returns
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            if Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0] == "Z":
+                return False
+        except FileNotFoundError:
+            return False
+        if time.monotonic() > deadline:
+            return True
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def worker(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> SofficeWorker:
+    script = tmp_path / "worker.py"
+    script.write_text(FAKE_WORKER)
+    monkeypatch.setattr(soffice, "WORKER_SCRIPT", script)
+    monkeypatch.setattr(soffice, "CONVERT_TIMEOUT", 1)
+    (tmp_path / "doc").write_text("content")
+    (tmp_path / "hang").write_text("content")
+    return SofficeWorker(sys.executable, tmp_path / "profiles")
+
+
+def _office(worker: SofficeWorker) -> int:
+    assert worker.profile is not None
+    return int((worker.profile / "soffice.pid").read_text())
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="reads the process states from /proc")
+def test_timeout_kills_libreoffice_and_restarts_with_a_fresh_profile(worker: SofficeWorker, tmp_path: Path) -> None:
+    assert worker.convert(tmp_path / "doc", tmp_path / "doc.pdf", "pdf") == {"ok": True, "filter": "copy"}
+    first_profile, first_office = worker.profile, _office(worker)
+    with pytest.raises(LimitExceededError, match="stopped after the timeout of 1s"):
+        worker.convert(tmp_path / "hang", tmp_path / "hang.pdf", "pdf")
+    # the LibreOffice of the worker is killed with it, its profile is removed
+    assert worker.proc is None
+    assert not _running(first_office)
+    assert first_profile is not None
+    assert not first_profile.exists()
+    # the next conversion starts a new worker with a profile of its own
+    assert worker.convert(tmp_path / "doc", tmp_path / "doc2.pdf", "pdf")["ok"]
+    assert worker.profile != first_profile
+    assert (tmp_path / "doc2.pdf").read_text() == "content"
+    worker.stop()
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="reads the process states from /proc")
+def test_health_check_restarts_a_dead_worker(worker: SofficeWorker, tmp_path: Path) -> None:
+    assert not worker.alive()
+    worker.start()
+    assert worker.alive()
+    office = _office(worker)
+    assert worker.proc is not None
+    os.kill(worker.proc.pid, signal.SIGKILL)
+    worker.proc.wait()
+    assert not worker.alive()
+    # the LibreOffice the dead worker left behind is killed when it is restarted
+    assert worker.convert(tmp_path / "doc", tmp_path / "doc.pdf", "pdf")["ok"]
+    assert not _running(office)
+    assert worker.alive()
+    worker.stop()
+    assert worker.proc is None
@@ -0,0 +1,39 @@
+import sqlite3
+from pathlib import Path
+
+from fileidentification.definitions.constants import FileState
+from fileidentification.definitions.store import Store
+from tests.util import make_sfinfo
+
+
+def test_pages_follow_the_state_changes(tmp_path: Path) -> None:
+    stack = Store(tmp_path / "_store.sqlite", [make_sfinfo(f"{i}.mp4", status={"pending": True}) for i in range(10)])
+    reader = sqlite3.connect(tmp_path / "_store.sqlite")
+    seen: list[int] = []
+    committed: list[int] = []
+    for batch in stack.batches(FileState.PENDING, size=3):
+        # the changes of the batches before are committed when the next one is read
+        committed.append(reader.execute("SELECT COUNT(*) FROM files WHERE pending = 1").fetchone()[0])
+        for i, sfinfo in batch:
+            sfinfo.status.pending = False
+            stack.update(sfinfo)
+            seen.append(i)
+        if batch[0][0] == 0:
+            # a file ahead of the page that is no longer pending is skipped
+            ahead, behind = stack[7], stack[0]
+            ahead.status.pending = False
+            # a file behind the page that is pending again is not handed out twice
+            behind.status.pending = True
+            stack.update(ahead, behind)
+            # a file added while paging, e.g. a converted one that needs another conversion, is handed out
+            stack.append(make_sfinfo("10.mp4", status={"pending": True}))
+    assert seen == [0, 1, 2, 3, 4, 5, 6, 8, 9, 10]
+    assert committed == [10, 8, 5, 2]
+    assert [f"{sfinfo.filename}" for sfinfo in stack.select(FileState.PENDING)] == ["0.mp4"]
+    reader.close()
+
+
+def test_pages_start_at_the_position(tmp_path: Path) -> None:
+    stack = Store(tmp_path / "_store.sqlite", [make_sfinfo(f"{i}.mp4") for i in range(5)])
+    pages = [[i for i, _ in batch] for batch in stack.batches(FileState.ACTIVE, size=2, start=1)]
+    assert pages == [[1, 2], [3, 4]]
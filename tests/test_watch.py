@@ -0,0 +1,50 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from fileidentification.definitions.constants import WatchBackend
+from fileidentification.tasks.watch import Poller, Watcher
+
+BACKENDS = [WatchBackend.POLLING] + ([WatchBackend.INOTIFY] if sys.platform == "linux" else [])
+
+
+def _collect(watcher: Watcher, seconds: float) -> list[Path]:
+    files: list[Path] = []
+    end = time.monotonic() + seconds
+    for batch in watcher:
+        files.extend(batch)
+        if time.monotonic() > end:
+            return files
+    return files
+
+
+def test_poller_lists_the_new_files_only(tmp_path: Path) -> None:
+    (tmp_path / "old.txt").write_text("old")
+    poller = Poller(tmp_path)
+    (tmp_path / "sub" / "deeper").mkdir(parents=True)
+    (tmp_path / "sub" / "deeper" / "new.txt").write_text("new")
+    (tmp_path / "new.txt").write_text("new")
+    assert sorted(poller.changes(0)) == [tmp_path / "new.txt", tmp_path / "sub" / "deeper" / "new.txt"]
+    assert poller.changes(0) == []
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_watcher_hands_out_settled_files(tmp_path: Path, backend: str) -> None:
+    watcher = Watcher(tmp_path, backend, settle=0.3, poll=0.05, ignore=[tmp_path / "_log"])
+    try:
+        assert watcher.backend == backend
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "a.txt").write_text("a")
+        (tmp_path / "_log.jsonl").write_text("{}")
+        # still being written: not handed out before it stays unchanged for settle seconds
+        assert _collect(watcher, 0.15) == []
+        with (tmp_path / "sub" / "a.txt").open("a") as f:
+            f.write("more")
+        # a file that is gone again before it settled, e.g. the temporary file of a copy
+        (tmp_path / "tmp.part").write_text("x")
+        (tmp_path / "tmp.part").unlink()
+        assert _collect(watcher, 1.0) == [tmp_path / "sub" / "a.txt"]
+    finally:
+        watcher.close()
@@ -0,0 +1,16 @@
+from pathlib import Path
+from typing import Any
+
+from fileidentification.definitions.models import SfInfo
+
+
+def make_sfinfo(filename: str | Path, filesize: int = 0, puid: str = "fmt/199", **kwargs: Any) -> SfInfo:
+    """Return a SfInfo as siegfried would, with the puid as its first match"""
+    kwargs.setdefault("matches", [{"id": puid, "warning": ""}])
+    return SfInfo(
+        filename=Path(filename),
+        filesize=filesize,
+        modified="2025-01-01T00:00:00+00:00",
+        errors="",
+        **kwargs,
+    )
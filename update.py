@@ -7,7 +7,8 @@ from bs4 import BeautifulSoup
 from lxml import etree, objectify  # type: ignore[import-untyped]
 from typer import colors, secho
 
-from fileidentification.definitions.constants import FMTJSN, DroidSigURL
+from fileidentification.definitions.constants import FMTJSN, FMTTSV, DroidSigURL
+from fileidentification.definitions.formats import to_tsv
 
 
 def write_fmt2ext(link: str) -> None:
@@ -52,6 +53,7 @@ def write_fmt2ext(link: str) -> None:
         puids[puid] = format_info
 
     FMTJSN.write_text(json.dumps(puids, indent=4, ensure_ascii=False))
+    FMTTSV.write_text(to_tsv(puids), encoding="utf-8")
     secho(
         f"extensions and names updated to {link[-8:-4]} in {FMTJSN}",
         fg=colors.GREEN,